@@ -0,0 +1,70 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+"""Runs the benchmarks and compares their API call counts with the
+baseline file. Usage:
+
+    python -m benchmarks [--update-baseline] [--baseline PATH] [NAME...]
+"""
+
+# Built-in Imports
+import os
+import sys
+import argparse
+
+# Cloudify imports
+from benchmarks import harness
+from benchmarks import scenarios
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+
+def main(argv):
+
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    parser.add_argument('names', nargs='*',
+                        help='Run only the benchmarks with these names.')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='Write the measurements to the baseline file '
+                             'instead of comparing them with it.')
+    args = parser.parse_args(argv)
+
+    measurements = []
+    for name, scenario, parameter, scales in scenarios.BENCHMARKS:
+        if args.names and name not in args.names:
+            continue
+        for scale in scales:
+            measurement = harness.measure(name, scale, scenario)
+            measurements.append(measurement)
+            print('{0:<32} {1:<12} {2:>8.3f}s {3:>5} calls '
+                  '{4:>8} objects'.format(
+                      name, '{0}={1}'.format(parameter, scale),
+                      measurement.wall_time, measurement.api_calls,
+                      measurement.allocations))
+
+    if args.update_baseline:
+        harness.write_baseline(args.baseline, measurements)
+        return 0
+
+    regressions = harness.compare(args.baseline, measurements)
+    for regression in regressions:
+        print('REGRESSION {0}'.format(regression))
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
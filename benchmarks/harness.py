@@ -0,0 +1,112 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+# Built-in Imports
+import gc
+import json
+import time
+from collections import namedtuple
+
+# Third-party Imports
+import mock
+from moto import mock_ec2
+
+# Cloudify imports
+from core import metrics
+from core import throttle
+
+Measurement = namedtuple(
+    'Measurement',
+    'name scale wall_time api_calls actions allocations')
+
+
+def measure(name, scale, scenario):
+    """Runs a benchmark scenario against moto and measures it.
+
+    :param name: The name of the benchmark.
+    :param scale: The scale parameter passed to the scenario,
+        e.g. the number of nodes or rules.
+    :param scenario: A callable that takes scale, creates the resources
+        that the operation needs and returns the operation as a callable.
+    :returns a Measurement. Waits are skipped, and the rate limiter
+        does not limit, so that wall_time is the time spent by the plugin
+        and by moto. allocations is the growth of the number of objects
+        tracked by the garbage collector.
+    """
+
+    actions = []
+    record = metrics.record
+
+    def counting_record(action, *args, **kwargs):
+        actions.append(action)
+        return record(action, *args, **kwargs)
+
+    rate_limiter = throttle.RateLimiter(
+        burst=10 ** 9, initial_rate=10 ** 9, max_rate=10 ** 9)
+
+    with mock_ec2(), \
+            mock.patch('time.sleep'), \
+            mock.patch('core.throttle.get_rate_limiter',
+                       return_value=rate_limiter):
+        operation = scenario(scale)
+
+        with mock.patch('core.metrics.record', counting_record):
+            gc.collect()
+            objects = len(gc.get_objects())
+            start = time.time()
+            operation()
+            wall_time = time.time() - start
+            allocations = len(gc.get_objects()) - objects
+
+    return Measurement(
+        name, scale, round(wall_time, 4), len(actions),
+        dict((action, actions.count(action)) for action in set(actions)),
+        allocations)
+
+
+def key(measurement):
+    return '{0}[{1}]'.format(measurement.name, measurement.scale)
+
+
+def write_baseline(path, measurements):
+    """Writes the measurements to a baseline file."""
+
+    with open(path, 'w') as baseline_file:
+        json.dump(dict((key(m), m._asdict()) for m in measurements),
+                  baseline_file, indent=2, sort_keys=True,
+                  separators=(',', ': '))
+        baseline_file.write('\n')
+
+
+def compare(path, measurements):
+    """Compares measurements with a baseline file.
+
+    :returns a list of regression messages, one per benchmark that
+        makes more API calls than its baseline.
+    """
+
+    with open(path) as baseline_file:
+        baseline = json.load(baseline_file)
+
+    regressions = []
+    for measurement in measurements:
+        expected = baseline.get(key(measurement))
+        if expected and measurement.api_calls > expected['api_calls']:
+            regressions.append(
+                '{0}: {1} API calls, baseline {2} ({3})'.format(
+                    key(measurement), measurement.api_calls,
+                    expected['api_calls'], measurement.actions))
+
+    return regressions
@@ -0,0 +1,263 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+"""Benchmark scenarios. Each scenario takes a scale parameter, creates
+the AWS resources and mocked contexts that an operation needs, and
+returns a callable that runs the operation.
+"""
+
+# Built-in Imports
+import logging
+
+# Third-party Imports
+from boto.vpc import VPCConnection
+
+# Cloudify imports
+from ec2 import ebs
+from ec2 import instance
+from ec2 import securitygroup
+from ec2 import constants
+from vpc import vpc
+from vpc import networkacl
+from vpc import routetable
+from vpc import constants as vpc_constants
+from cloudify.state import current_ctx
+from cloudify.mocks import MockCloudifyContext
+from cloudify.mocks import MockContext
+from cloudify.mocks import MockNodeContext
+from cloudify.mocks import MockNodeInstanceContext
+from cloudify.mocks import MockRelationshipContext
+from cloudify.mocks import MockRelationshipSubjectContext
+
+DEPLOYMENT_ID = 'benchmark'
+IMAGE_ID = 'ami-e214778a'
+INSTANCE_TYPE = 't1.micro'
+ZONE = 'us-east-1a'
+VPC_CIDR = '10.0.0.0/16'
+
+
+def node_context(name, properties, relationships=None,
+                 runtime_properties=None, node_type=None):
+
+    properties = dict(properties, **{
+        constants.AWS_CONFIG_PROPERTY: {},
+        'use_external_resource': False,
+        'resource_id': ''})
+
+    ctx = MockCloudifyContext(
+        node_id=name,
+        node_name=name,
+        deployment_id=DEPLOYMENT_ID,
+        properties=properties,
+        runtime_properties=runtime_properties,
+        relationships=relationships,
+        operation={'retry_number': 0},
+        provider_context={'resources': {}})
+    ctx.node.type = node_type
+    ctx.node.type_hierarchy = [node_type, 'cloudify.nodes.Root']
+    ctx.logger.setLevel(logging.WARNING)
+
+    return ctx
+
+
+def relationship_to(relationship_type, resource_id):
+    return MockRelationshipContext(
+        MockRelationshipSubjectContext(
+            MockNodeContext('target', {'resource_id': resource_id}),
+            MockNodeInstanceContext(
+                'target',
+                {constants.EXTERNAL_RESOURCE_ID: resource_id})),
+        relationship_type)
+
+
+def run_each(contexts, operation, **kwargs):
+
+    def run():
+        for ctx in contexts:
+            current_ctx.set(ctx=ctx)
+            operation(ctx=ctx, **kwargs)
+
+    return run
+
+
+def instance_context(name, instance_id=None):
+
+    ctx = node_context(name, {
+        'image_id': IMAGE_ID,
+        'instance_type': INSTANCE_TYPE,
+        'cloudify_agent': {},
+        'agent_config': {},
+        'use_password': False,
+        'parameters': {}
+    }, node_type='cloudify.nodes.Compute')
+    if instance_id:
+        ctx.instance.runtime_properties[constants.EXTERNAL_RESOURCE_ID] = \
+            instance_id
+
+    return ctx
+
+
+def launch_instances(count):
+    reservation = VPCConnection().run_instances(
+        IMAGE_ID, min_count=count, max_count=count,
+        instance_type=INSTANCE_TYPE, placement=ZONE)
+    return [instance_object.id for instance_object in reservation.instances]
+
+
+def run_instances(nodes):
+    return run_each(
+        [instance_context('vm_{0}'.format(n)) for n in range(nodes)],
+        instance.run_instances)
+
+
+def start_instances(nodes):
+    return run_each(
+        [instance_context('vm_{0}'.format(n), instance_id)
+         for n, instance_id in enumerate(launch_instances(nodes))],
+        instance.start)
+
+
+def terminate_instances(nodes):
+    return run_each(
+        [instance_context('vm_{0}'.format(n), instance_id)
+         for n, instance_id in enumerate(launch_instances(nodes))],
+        instance.terminate)
+
+
+def create_volumes(nodes):
+    return run_each(
+        [node_context('volume_{0}'.format(n), {
+            'size': 1, constants.ZONE: ZONE, 'device': '/dev/sdf'})
+         for n in range(nodes)],
+        ebs.create, args={})
+
+
+def attach_volumes(nodes):
+
+    client = VPCConnection()
+    contexts = []
+
+    for n, instance_id in enumerate(launch_instances(nodes)):
+        volume = client.create_volume(1, ZONE)
+        contexts.append(MockCloudifyContext(
+            node_id='volume_{0}'.format(n),
+            deployment_id=DEPLOYMENT_ID,
+            source=MockContext({
+                'node': MockContext({'properties': {
+                    constants.AWS_CONFIG_PROPERTY: {},
+                    'use_external_resource': False,
+                    'resource_id': '',
+                    constants.ZONE: ZONE,
+                    'device': '/dev/sdf'}}),
+                'instance': MockContext({'runtime_properties': {
+                    constants.EXTERNAL_RESOURCE_ID: volume.id}})}),
+            target=MockContext({
+                'node': MockContext({'properties': {
+                    constants.AWS_CONFIG_PROPERTY: {},
+                    'use_external_resource': False,
+                    'resource_id': ''}}),
+                'instance': MockContext({'runtime_properties': {
+                    constants.EXTERNAL_RESOURCE_ID: instance_id,
+                    'placement': ZONE}})})))
+        contexts[-1].logger.setLevel(logging.WARNING)
+
+    return run_each(contexts, ebs.attach)
+
+
+def create_security_group(rules):
+
+    client = VPCConnection()
+    vpc_id = client.create_vpc(VPC_CIDR).id
+    source_groups = [
+        client.create_security_group(
+            'source_{0}'.format(n), 'source', vpc_id=vpc_id).name
+        for n in range(max(rules / 10, 1))]
+
+    group_rules = []
+    for n in range(rules):
+        rule = dict(ip_protocol='tcp', from_port=1000 + n, to_port=1000 + n)
+        if n % 2:
+            rule['src_group_id'] = source_groups[n % len(source_groups)]
+        else:
+            rule['cidr_ip'] = '10.{0}.0.0/16'.format(n % 256)
+        group_rules.append(rule)
+
+    return run_each(
+        [node_context('security_group', {
+            'description': 'benchmark',
+            'rules': group_rules
+        }, relationships=[relationship_to(
+            constants.SECURITY_GROUP_VPC_RELATIONSHIP, vpc_id)])],
+        securitygroup.create)
+
+
+def create_vpcs(nodes):
+    return run_each(
+        [node_context('vpc_{0}'.format(n), {
+            'cidr_block': VPC_CIDR,
+            'instance_tenancy': 'default',
+            'enable_vpc_classic_link': False
+        }, node_type='cloudify.aws.nodes.VPC') for n in range(nodes)],
+        vpc.create_vpc)
+
+
+def create_route_table(routes):
+
+    client = VPCConnection()
+    vpc_id = client.create_vpc(VPC_CIDR).id
+    gateway_id = client.create_internet_gateway().id
+    client.attach_internet_gateway(gateway_id, vpc_id)
+
+    return run_each(
+        [node_context('route_table', {}, relationships=[relationship_to(
+            vpc_constants.ROUTE_TABLE_VPC_RELATIONSHIP, vpc_id)],
+            node_type='cloudify.aws.nodes.RouteTable')],
+        routetable.create_route_table,
+        routes=[dict(destination_cidr_block='172.{0}.{1}.0/24'.format(
+            16 + n / 256, n % 256), gateway_id=gateway_id)
+            for n in range(routes)])
+
+
+def create_network_acl(entries):
+
+    vpc_id = VPCConnection().create_vpc(VPC_CIDR).id
+
+    return run_each(
+        [node_context('network_acl', {
+            'acl_network_entries': [dict(
+                rule_number=100 + n, protocol=6, rule_action='allow',
+                cidr_block='10.{0}.0.0/16'.format(n % 256), egress=False,
+                port_range_from=1000 + n, port_range_to=1000 + n)
+                for n in range(entries)]
+        }, relationships=[relationship_to(
+            vpc_constants.NETWORK_ACL_IN_VPC_RELATIONSHIP, vpc_id)],
+            node_type='cloudify.aws.nodes.ACL')],
+        networkacl.create_network_acl)
+
+
+# (name, scenario, scale parameter, scales)
+BENCHMARKS = [
+    ('instance.run_instances', run_instances, 'nodes', [1, 10]),
+    ('instance.start', start_instances, 'nodes', [1, 10]),
+    ('instance.terminate', terminate_instances, 'nodes', [1, 10]),
+    ('ebs.create', create_volumes, 'nodes', [1, 10]),
+    ('ebs.attach', attach_volumes, 'nodes', [1, 10]),
+    ('securitygroup.create', create_security_group, 'rules', [10, 40]),
+    ('vpc.create_vpc', create_vpcs, 'nodes', [1, 10]),
+    ('routetable.create_route_table', create_route_table, 'routes',
+     [1, 20]),
+    ('networkacl.create_network_acl', create_network_acl, 'entries',
+     [1, 20]),
+]
@@ -13,13 +13,12 @@
 #  * See the License for the specific language governing permissions and
 #  * limitations under the License.
 
-import uuid
-
 # Third-party Imports
 from boto import exception
 
 # Cloudify imports
 from . import utils, constants, connection
+from core import cache
 from cloudify.exceptions import NonRecoverableError, RecoverableError
 from cloudify import ctx
 
@@ -27,13 +26,20 @@ from cloudify import ctx
 class AwsBase(object):
 
     def __init__(self,
-                 client=None
+                 client=None,
+                 describe_cache=None
                  ):
         self.client = \
             client if client else connection.EC2ConnectionClient().client()
+        self.describe_cache = \
+            describe_cache if describe_cache else cache.get_describe_cache()
 
     def execute(self, fn, args=None, raise_on_falsy=False):
 
+        if not getattr(fn, '__name__', '').startswith(
+                constants.DESCRIBE_FUNCTION_PREFIXES):
+            self.describe_cache.invalidate()
+
         try:
             output = fn(**args) if args else fn()
         except (exception.EC2ResponseError,
@@ -50,6 +56,15 @@ class AwsBase(object):
             self, filter_function, filters,
             not_found_token='NotFound'):
 
+        return self.describe_cache.get_or_fetch(
+            filter_function, filters,
+            lambda: self._get_and_filter_resources_by_matcher(
+                filter_function, filters, not_found_token))
+
+    def _get_and_filter_resources_by_matcher(
+            self, filter_function, filters,
+            not_found_token='NotFound'):
+
         try:
             list_of_matching_resources = filter_function(**filters)
         except exception.EC2ResponseError as e:
@@ -423,21 +438,10 @@ class AwsBaseNode(AwsBase):
 
     def tag_resource(self, resource):
 
-        name = ctx.node.properties.get('name')
-        if name:
-            self._tag_resource(resource, 'Name', name)
-        else:
-            self._tag_resource(resource, 'Name', uuid.uuid4())
-
-        self._tag_resource(resource, 'resource_id', ctx.instance.id)
-        deployment_id = ctx.deployment.id
-        if deployment_id:
-            self._tag_resource(resource, 'deployment_id', deployment_id)
-
-    def _tag_resource(self, resource, tag_key, tag_value):
+        self.describe_cache.invalidate()
 
         try:
-            output = resource.add_tag(tag_key, tag_value)
+            output = resource.add_tags(utils.get_tags())
         except (exception.EC2ResponseError,
                 exception.BotoServerError) as e:
             raise NonRecoverableError(
@@ -526,6 +530,8 @@ class RouteMixin(object):
                     'Missing valid values: {0}'.format(route)
             )
 
+        self.describe_cache.invalidate()
+
         try:
             output = self.client.create_route(**route_to_create)
         except exception.EC2ResponseError as e:
@@ -563,6 +569,8 @@ class RouteMixin(object):
                 destination_cidr_block=route['destination_cidr_block']
         )
 
+        self.describe_cache.invalidate()
+
         try:
             output = self.client.delete_route(**args)
         except exception.EC2ResponseError as e:
@@ -13,9 +13,13 @@
 #    * See the License for the specific language governing permissions and
 #    * limitations under the License.
 
+# cloudify_aws.ec2 would shadow the ec2 package.
+from __future__ import absolute_import
+
 # Builtin Imports
 import ConfigParser
 import os
+import threading
 
 # Third-party Imports
 from boto.ec2 import get_region
@@ -23,12 +27,17 @@ from boto.ec2 import EC2Connection
 from boto.ec2.elb import ELBConnection
 from boto.vpc import VPCConnection
 from boto.regioninfo import RegionInfo
-from boto.ec2.elb import connect_to_region as connect_to_elb_region
 
 # Cloudify Imports
 from . import utils, constants
+from ec2.connection import get_pooled_connection, _connect_to_elb_region
 from cloudify.exceptions import NonRecoverableError
 
+# Parsed and validated Boto cfg files, keyed by path and
+# holding the (mtime, size) signature of the parsed version.
+_config_files = {}
+_config_files_lock = threading.Lock()
+
 
 class EC2ConnectionClient():
     """Provides functions for getting the EC2 Client
@@ -44,7 +53,7 @@ class EC2ConnectionClient():
         aws_config_property = (self._get_aws_config_property() or
                                self._get_aws_config_from_file())
         if not aws_config_property:
-            return EC2Connection()
+            return get_pooled_connection('ec2', EC2Connection, {})
         elif aws_config_property.get('ec2_region_name'):
             region_object = \
                 get_region(aws_config_property['ec2_region_name'])
@@ -58,7 +67,7 @@ class EC2ConnectionClient():
 
         aws_config = self.aws_config_cleanup(aws_config)
 
-        return EC2Connection(**aws_config)
+        return get_pooled_connection('ec2', EC2Connection, aws_config)
 
     def _get_aws_config_property(self):
         node_properties = \
@@ -77,12 +86,31 @@ class EC2ConnectionClient():
         return os.environ.get(constants.AWS_CONFIG_PATH_ENV_VAR_NAME)
 
     def _parse_config_file(self, path):
-        """Parse and validate Boto cfg file
+        """Parse and validate Boto cfg file, once per change of the file
         """
         path = str(path)
         if not os.path.isfile(path):
             raise NonRecoverableError('no aws config file at {0}'.format(path))
 
+        stat = os.stat(path)
+        signature = (stat.st_mtime, stat.st_size)
+
+        with _config_files_lock:
+            cached = _config_files.get(path)
+        if cached and cached[0] == signature:
+            return cached[1].copy()
+
+        config = self._read_config_file(path)
+
+        with _config_files_lock:
+            _config_files[path] = (signature, config)
+
+        return config.copy()
+
+    def _read_config_file(self, path):
+        """Read and validate Boto cfg file
+        """
+
         parser = ConfigParser.ConfigParser()
         parser.read(path)
 
@@ -144,7 +172,7 @@ class ELBConnectionClient(EC2ConnectionClient):
         aws_config_property = (self._get_aws_config_property() or
                                self._get_aws_config_from_file())
         if not aws_config_property:
-            return ELBConnection()
+            return get_pooled_connection('elb', ELBConnection, {})
 
         aws_config = aws_config_property.copy()
 
@@ -163,11 +191,11 @@ class ELBConnectionClient(EC2ConnectionClient):
 
         if 'region' in aws_config:
             if type(aws_config['region']) is RegionInfo:
-                return ELBConnection(**aws_config)
-            elif type(aws_config['region']) is str:
-                elb_region = aws_config.pop('region')
-                return connect_to_elb_region(
-                        elb_region, **aws_config)
+                return get_pooled_connection(
+                    'elb', ELBConnection, aws_config)
+            elif isinstance(aws_config['region'], basestring):
+                return get_pooled_connection(
+                    'elb', _connect_to_elb_region, aws_config)
 
         raise NonRecoverableError(
                 'Cannot connect to ELB endpoint. '
@@ -186,7 +214,7 @@ class VPCConnectionClient(EC2ConnectionClient):
         aws_config_property = (self._get_aws_config_property(aws_config) or
                                self._get_aws_config_from_file())
         if not aws_config_property:
-            return VPCConnection()
+            return get_pooled_connection('vpc', VPCConnection, {})
         elif aws_config_property.get('ec2_region_name'):
             region_object = \
                 get_region(aws_config_property['ec2_region_name'])
@@ -206,7 +234,7 @@ class VPCConnectionClient(EC2ConnectionClient):
         if 'ec2_region_endpoint' in aws_config:
             del(aws_config["ec2_region_endpoint"])
 
-        return VPCConnection(**aws_config)
+        return get_pooled_connection('vpc', VPCConnection, aws_config)
 
     def _get_aws_config_property(self, aws_config=None):
         if aws_config:
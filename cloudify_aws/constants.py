@@ -200,6 +200,7 @@ RUN_INSTANCE_PARAMETERS = {
 }
 
 AWS_CONFIG_PATH_ENV_VAR_NAME = "AWS_CONFIG_PATH"
+DESCRIBE_FUNCTION_PREFIXES = ('get_', 'describe_')
 
 # Boto config schema (section > options)
 BOTO_CONFIG_SCHEMA = {
@@ -13,11 +13,16 @@
 #    * See the License for the specific language governing permissions and
 #    * limitations under the License.
 
+# cloudify_aws.ec2 would shadow the ec2 package.
+from __future__ import absolute_import
+
 # Built-in Imports
 import os
 
 # Cloudify Imports
 from . import constants
+# The resource summaries and tags are shared with the ec2 package.
+from ec2.utils import get_tags, log_available_resources  # noqa
 from cloudify import ctx
 from cloudify.exceptions import NonRecoverableError
 
@@ -33,18 +38,6 @@ def validate_node_property(key, ctx_node_properties):
                 '{0} is a required input. Unable to create.'.format(key))
 
 
-def log_available_resources(list_of_resources):
-    """This logs a list of available resources.
-    """
-
-    message = 'Available resources: \n'
-
-    for resource in list_of_resources:
-        message = '{0}{1}\n'.format(message, resource)
-
-    ctx.logger.debug(message)
-
-
 def get_external_resource_id_or_raise(operation, ctx_instance):
     """Checks if the EXTERNAL_RESOURCE_ID runtime_property is set and
     returns it.
@@ -13,34 +13,67 @@
 #  * See the License for the specific language governing permissions and
 #  * limitations under the License.
 
-import uuid
-
 # Third-party Imports
 from boto import exception
 
 # Cloudify imports
 from ec2 import utils as ec2_utils
 from ec2 import constants
+from ec2 import connection as ec2_connection
 from vpc import constants as vpc_constants
 from vpc import connection
+from core import cache
+from core import workers
+from core import preflight
 from cloudify.exceptions import NonRecoverableError, RecoverableError
 from cloudify import ctx
 
 
+def iter_resources(describe_function, **kwargs):
+    """Yields the resources returned by a boto describe function,
+    requesting the next page, with its next_token, only once the
+    previous page is consumed. Only one page is held in memory, and
+    no more pages are requested once the caller stops iterating.
+
+    :param describe_function: A boto get_all_* function.
+    :param kwargs: The arguments of describe_function, e.g. max_results
+        for the functions that accept it.
+    """
+
+    page = describe_function(**kwargs)
+
+    while True:
+        for resource in page:
+            yield resource
+        next_token = getattr(page, 'next_token', None)
+        if not next_token:
+            return
+        page = describe_function(next_token=next_token, **kwargs)
+
+
 class AwsBase(object):
 
     def __init__(self,
-                 client=None
+                 client=None,
+                 describe_cache=None
                  ):
         self.client = \
             client if client else connection.VPCConnectionClient().client()
+        self.describe_cache = \
+            describe_cache if describe_cache else cache.get_describe_cache()
 
     def execute(self, fn, args=None, raise_on_falsy=False):
 
+        if not getattr(fn, '__name__', '').startswith(
+                constants.DESCRIBE_FUNCTION_PREFIXES):
+            self.describe_cache.invalidate()
+
         try:
             output = fn(**args) if args else fn()
         except (exception.EC2ResponseError,
                 exception.BotoServerError) as e:
+            self.reset_client_on_auth_error(e)
+            self.raise_if_throttled(e)
             raise NonRecoverableError('{0}'.format(str(e)))
 
         if raise_on_falsy and not output:
@@ -53,16 +86,91 @@ class AwsBase(object):
             self, filter_function, filters,
             not_found_token='NotFound'):
 
+        return self.describe_cache.get_or_fetch(
+            filter_function, filters,
+            lambda: self._get_and_filter_resources_by_matcher(
+                filter_function, filters, not_found_token))
+
+    def _get_and_filter_resources_by_matcher(
+            self, filter_function, filters,
+            not_found_token='NotFound'):
+
+        return list(self.iter_resources(
+            filter_function, not_found_token, **filters))
+
+    def iter_resources(self, describe_function,
+                       not_found_token='NotFound', **kwargs):
+        """Yields the resources of a describe function page by page,
+        like iter_resources, and is not cached. A not found error ends
+        the iteration, and other boto errors are raised like in execute.
+        """
+
         try:
-            list_of_matching_resources = filter_function(**filters)
+            for resource in iter_resources(describe_function, **kwargs):
+                yield resource
         except exception.EC2ResponseError as e:
             if not_found_token in str(e):
-                return []
+                return
+            self.reset_client_on_auth_error(e)
+            self.raise_if_throttled(e)
             raise NonRecoverableError('{0}'.format(str(e)))
         except exception.BotoServerError as e:
+            self.reset_client_on_auth_error(e)
+            self.raise_if_throttled(e)
             raise NonRecoverableError('{0}'.format(str(e)))
 
-        return list_of_matching_resources
+    def find_resource(self, describe_function, matcher,
+                      not_found_token='NotFound', **kwargs):
+        """Returns the first resource of a describe function that
+        matches, without requesting the pages after it.
+
+        :param matcher: A callable that takes a resource.
+        :returns the resource, or None.
+        """
+
+        for resource in self.iter_resources(
+                describe_function, not_found_token, **kwargs):
+            if matcher(resource):
+                return resource
+
+        return None
+
+    def describe_filtered(self, describe_function, filters,
+                          not_found_token='NotFound', **kwargs):
+        """Describes the resources that match EC2 API filters, so that
+        AWS does the filtering instead of returning the whole account.
+        Paginated results are followed to the last page, and the result
+        is cached like the other describe calls.
+
+        :param describe_function: A boto get_all_* function that
+            accepts filters, e.g. self.client.get_all_route_tables.
+        :param filters: A dict of filter names and values,
+            e.g. {'vpc-id': 'vpc-0123abcd'}.
+        :param kwargs: Other arguments of describe_function.
+        :returns a list of resources.
+        """
+
+        return self.get_and_filter_resources_by_matcher(
+            describe_function, dict(kwargs, filters=filters),
+            not_found_token)
+
+    def reset_client_on_auth_error(self, error):
+        """Drops the pooled connection of this client if AWS rejected
+        its credentials, so that the next operation reconnects.
+        """
+
+        if getattr(error, 'error_code', None) in constants.AUTH_ERROR_CODES:
+            ec2_connection.reset_connections(self.client)
+
+    def raise_if_throttled(self, error):
+        """Raises a RecoverableError if AWS still throttled the request
+        after the retries of the rate limiter, so that the operation
+        is retried instead of failing.
+        """
+
+        if getattr(error, 'error_code', None) in \
+                constants.THROTTLING_ERROR_CODES:
+            raise RecoverableError('{0}'.format(str(error)))
 
     def filter_for_single_resource(self, filter_function,
                                    filters,
@@ -258,7 +366,9 @@ class AwsBaseNode(AwsBase):
         """ This validates all VPC Nodes before bootstrap.
         """
 
-        resource = self.get_resource()
+        resource = preflight.get_preflight().exists(self.resource_id)
+        if resource is None:
+            resource = self.get_resource()
 
         for property_key in self.required_properties:
             ec2_utils.validate_node_property(
@@ -343,7 +453,7 @@ class AwsBaseNode(AwsBase):
 
         ctx.logger.info(
             'Assuming {0} is external, because the user '
-            'specified use_external_resource. Not deleting {0}.'
+            'specified use_external_resource. Not deleting {1}.'
             .format(self.aws_resource_type,
                     self.resource_id))
 
@@ -371,19 +481,10 @@ class AwsBaseNode(AwsBase):
 
     def tag_resource(self, resource):
 
-        name = ctx.node.properties.get('name')
-        if name:
-            self._tag_resource(resource, 'Name', name)
-        else:
-            self._tag_resource(resource, 'Name', uuid.uuid4())
-
-        self._tag_resource(resource, 'resource_id', ctx.instance.id)
-        self._tag_resource(resource, 'deployment_id', ctx.deployment.id)
-
-    def _tag_resource(self, resource, tag_key, tag_value):
+        self.describe_cache.invalidate()
 
         try:
-            output = resource.add_tag(tag_key, tag_value)
+            output = resource.add_tags(ec2_utils.get_tags())
         except (exception.EC2ResponseError,
                 exception.BotoServerError) as e:
             raise NonRecoverableError(
@@ -425,6 +526,46 @@ class RouteMixin(object):
     def create_route(self, route_table_id,
                      route, route_table_ctx_instance=None):
 
+        route_to_create = self.get_route_to_create(route_table_id, route)
+
+        self.describe_cache.invalidate()
+        self.create_route_from_args(route_to_create)
+
+        if route_table_ctx_instance:
+            self.add_route_to_runtime_properties(route_table_ctx_instance,
+                                                 route_to_create)
+        return True
+
+    def create_route_batch(self, route_table_id,
+                           routes, route_table_ctx_instance=None):
+        """Creates routes in a route table concurrently. Routes that
+        already exist count as created. The created routes that are not
+        recorded yet are added to the routes runtime property at once,
+        even if some routes failed.
+
+        :raises the error of the first route that failed.
+        """
+
+        routes_to_create = [self.get_route_to_create(route_table_id, route)
+                            for route in routes]
+
+        self.describe_cache.invalidate()
+        results = workers.run_concurrently(
+            self.create_route_from_args, routes_to_create)
+
+        if route_table_ctx_instance:
+            recorded = route_table_ctx_instance.runtime_properties.get(
+                'routes', [])
+            route_table_ctx_instance.runtime_properties['routes'] = \
+                recorded + [route for route, (_, error)
+                            in zip(routes_to_create, results)
+                            if not error and route not in recorded]
+
+        self.raise_first_error(results)
+        return True
+
+    def get_route_to_create(self, route_table_id, route):
+
         route_to_create = dict(
             route_table_id=route_table_id,
             destination_cidr_block=route['destination_cidr_block'],
@@ -446,27 +587,24 @@ class RouteMixin(object):
                 'Missing valid values: {0}'.format(route)
             )
 
+        return route_to_create
+
+    def create_route_from_args(self, route_to_create):
+
         try:
             output = self.client.create_route(**route_to_create)
         except exception.EC2ResponseError as e:
             if '<Code>RouteAlreadyExists</Code>' in str(e):
-                if route_table_ctx_instance:
-                    self.add_route_to_runtime_properties(
-                        route_table_ctx_instance,
-                        route_to_create)
                 return True
             else:
                 raise RecoverableError('{0}'.format(str(e)))
 
-        if 'output' not in locals() or not output:
+        if not output:
             raise NonRecoverableError(
                 'create_route failed and no exception was thrown. '
                 'route: {0}'.format(route_to_create)
             )
 
-        if route_table_ctx_instance:
-            self.add_route_to_runtime_properties(route_table_ctx_instance,
-                                                 route_to_create)
         return True
 
     def add_route_to_runtime_properties(self,
@@ -478,28 +616,67 @@ class RouteMixin(object):
 
     def delete_route(self, route_table_id,
                      route, route_table_ctx_instance=None):
-        args = dict(
+
+        self.describe_cache.invalidate()
+        output = self.delete_route_from_args(dict(
             route_table_id=route_table_id,
             destination_cidr_block=route['destination_cidr_block']
-        )
+        ))
+
+        if output:
+            if route_table_ctx_instance:
+                self.remove_route_from_runtime_properties(
+                    route_table_ctx_instance, route)
+            return True
+        return False
+
+    def delete_route_batch(self, route_table_id,
+                           routes, route_table_ctx_instance=None):
+        """Deletes routes from a route table concurrently. Routes that
+        do not exist count as deleted. The deleted routes are removed
+        from the routes runtime property at once.
+
+        :returns True if all of the routes were deleted.
+        :raises the error of the first route that failed.
+        """
+
+        self.describe_cache.invalidate()
+        results = workers.run_concurrently(
+            self.delete_route_from_args,
+            [dict(route_table_id=route_table_id,
+                  destination_cidr_block=route['destination_cidr_block'])
+             for route in routes])
+
+        deleted = [route for route, (output, _) in zip(routes, results)
+                   if output]
+        if route_table_ctx_instance and \
+                'routes' in route_table_ctx_instance.runtime_properties:
+            route_table_ctx_instance.runtime_properties['routes'] = [
+                route for route
+                in route_table_ctx_instance.runtime_properties['routes']
+                if route not in deleted]
+
+        self.raise_first_error(results)
+        return len(deleted) == len(routes)
+
+    def delete_route_from_args(self, args):
 
         try:
-            output = self.client.delete_route(**args)
+            return self.client.delete_route(**args)
         except exception.EC2ResponseError as e:
             if vpc_constants.ROUTE_NOT_FOUND_ERROR in str(e):
                 ctx.logger.info(
                     'Could not delete route: {0} route not '
-                    'found on route_table.'
-                    .format(route, route_table_id))
+                    'found on route_table {1}.'
+                    .format(args['destination_cidr_block'],
+                            args['route_table_id']))
                 return True
             raise NonRecoverableError('{0}'.format(str(e)))
 
-        if output:
-            if route_table_ctx_instance:
-                self.remove_route_from_runtime_properties(
-                    route_table_ctx_instance, route)
-            return True
-        return False
+    def raise_first_error(self, results):
+        for _, error in results:
+            if error:
+                raise error
 
     def remove_route_from_runtime_properties(
             self, route_table_ctx_instance, route):
@@ -0,0 +1,263 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+# Built-in Imports
+import os
+import copy
+import time
+import fcntl
+import cPickle
+import StringIO
+import threading
+from collections import OrderedDict
+
+# Third-party Imports
+from boto.connection import AWSAuthConnection
+
+# Cloudify imports
+from ec2 import constants
+from core import metrics
+from cloudify import ctx
+
+# Values cached for the running operation of this process,
+# see get_operation_cache.
+_operation_cache = {}
+_operation_cache_lock = threading.Lock()
+
+
+def get_describe_cache():
+    """Returns the describe cache for the current operation.
+
+    If the AWS_DESCRIBE_CACHE_DIR environment variable is set, the cache
+    is a file in that directory, shared by all of the operations of the
+    deployment. Otherwise it is an in-memory cache.
+    """
+
+    cache_dir = os.environ.get(constants.DESCRIBE_CACHE_DIR_ENV_VAR_NAME)
+
+    if not cache_dir:
+        return DescribeCache()
+
+    return FileDescribeCache(_get_describe_cache_path(
+        cache_dir, ctx.deployment.id))
+
+
+def invalidate_describe_cache():
+    """Invalidates the describe cache file of the current deployment,
+    if there is one, after a write that did not go through
+    AwsBase.execute, such as a direct ec2_client call.
+    """
+
+    cache_dir = os.environ.get(constants.DESCRIBE_CACHE_DIR_ENV_VAR_NAME)
+    deployment_id = metrics.operation_key()[0]
+
+    if not cache_dir or not deployment_id:
+        return
+
+    path = _get_describe_cache_path(cache_dir, deployment_id)
+    if os.path.isfile(path):
+        FileDescribeCache(path).invalidate()
+
+
+def _get_describe_cache_path(cache_dir, deployment_id):
+    return os.path.join(cache_dir, '{0}.cache'.format(deployment_id))
+
+
+def get_operation_cache(name, factory=dict):
+    """Returns a value that lives until the end of the current operation,
+    such as the resources that the operation described. The value is
+    created with factory() the first time it is requested. Outside of an
+    operation, a new value is returned on each call.
+
+    :param name: The name of the value.
+    :param factory: A callable that creates the value.
+    """
+
+    key = metrics.operation_key()
+
+    if not key[1]:
+        return factory()
+
+    try:
+        key += (ctx.execution_id, ctx.operation.retry_number)
+    except (RuntimeError, AttributeError, KeyError):
+        pass
+
+    with _operation_cache_lock:
+        if _operation_cache.get('key') != key:
+            _operation_cache.clear()
+            _operation_cache['key'] = key
+            _operation_cache['values'] = {}
+        values = _operation_cache['values']
+        if name not in values:
+            values[name] = factory()
+        return values[name]
+
+
+class DescribeCache(object):
+    """Read-through cache of describe call results, with TTL and LRU
+    eviction. Entries are keyed by client endpoint, describe function
+    and filters.
+    """
+
+    def __init__(self,
+                 ttl=constants.DESCRIBE_CACHE_TTL,
+                 max_entries=constants.DESCRIBE_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, filter_function, filters):
+        client = getattr(filter_function, '__self__', None)
+        return (getattr(client, 'host', None),
+                getattr(filter_function, '__name__', repr(filter_function)),
+                repr(sorted(filters.items())))
+
+    def get_or_fetch(self, filter_function, filters, fetch):
+        """Returns the cached result of filter_function(**filters),
+        or calls fetch() and caches its result.
+        """
+
+        key = self.key(filter_function, filters)
+        found, value = self._lookup(self.entries, key)
+
+        if found:
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        value = fetch()
+        self._store(self.entries, key, value)
+
+        return value
+
+    def invalidate(self):
+        # Rebinds instead of clearing, so that worker threads that
+        # invalidate concurrently do not corrupt the OrderedDict.
+        self.entries = OrderedDict()
+
+    def _lookup(self, entries, key):
+
+        entry = entries.pop(key, None)
+
+        if entry is None or entry[0] < time.time():
+            return False, None
+
+        entries[key] = entry
+        return True, entry[1]
+
+    def _store(self, entries, key, value):
+
+        entries.pop(key, None)
+        entries[key] = (time.time() + self.ttl, value)
+
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+
+class FileDescribeCache(DescribeCache):
+    """A DescribeCache stored in a file, so that concurrent operations
+    of the same deployment share it, along with its hit/miss counters.
+    The file is locked while it is read or written. The boto connections
+    held by the cached objects are not stored, the objects are bound to
+    the caller's client when they are read back.
+    """
+
+    def __init__(self, path, **kwargs):
+        super(FileDescribeCache, self).__init__(**kwargs)
+        self.path = path
+
+    def get_or_fetch(self, filter_function, filters, fetch):
+
+        key = self.key(filter_function, filters)
+
+        with self._locked_state() as state:
+            found, data = self._lookup(state['entries'], key)
+            state['hits' if found else 'misses'] += 1
+            self._dump(state)
+        self.hits, self.misses = state['hits'], state['misses']
+
+        if found:
+            return self._loads(
+                data, getattr(filter_function, '__self__', None))
+
+        value = fetch()
+        data = self._dumps(value)
+
+        with self._locked_state() as state:
+            self._store(state['entries'], key, data)
+            self._dump(state)
+
+        return value
+
+    def invalidate(self):
+
+        with self._locked_state() as state:
+            state['entries'].clear()
+            self._dump(state)
+
+    def _locked_state(self):
+        return LockedState(
+            self.path, dict(entries=OrderedDict(), hits=0, misses=0))
+
+    def _dump(self, state):
+        with open(self.path, 'wb') as cache_file:
+            cPickle.dump(state, cache_file, cPickle.HIGHEST_PROTOCOL)
+
+    def _dumps(self, value):
+        stream = StringIO.StringIO()
+        pickler = cPickle.Pickler(stream, cPickle.HIGHEST_PROTOCOL)
+        pickler.persistent_id = \
+            lambda obj: 'client' \
+            if isinstance(obj, AWSAuthConnection) else None
+        pickler.dump(value)
+        return stream.getvalue()
+
+    def _loads(self, data, client):
+        unpickler = cPickle.Unpickler(StringIO.StringIO(data))
+        unpickler.persistent_load = lambda _: client
+        return unpickler.load()
+
+
+class LockedState(object):
+    """Context manager that holds an exclusive lock on a state file
+    and yields its content, or a copy of initial_state if the file
+    does not exist yet.
+    """
+
+    def __init__(self, path, initial_state):
+        self.path = path
+        self.initial_state = initial_state
+        self.lock_file = None
+
+    def __enter__(self):
+        self.lock_file = open('{0}.lock'.format(self.path), 'a')
+        fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+
+        state = copy.deepcopy(self.initial_state)
+        if os.path.isfile(self.path):
+            try:
+                with open(self.path, 'rb') as cache_file:
+                    state = cPickle.load(cache_file)
+            except (EOFError, cPickle.UnpicklingError):
+                pass
+
+        return state
+
+    def __exit__(self, *_):
+        fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+        self.lock_file.close()
@@ -0,0 +1,155 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+# Built-in Imports
+import os
+import time
+import uuid
+import cPickle
+import tempfile
+
+# Cloudify imports
+from ec2 import constants
+from core.cache import LockedState
+from cloudify import ctx
+
+
+def get_claim_table():
+    """Returns the claim table shared by the node instances of the
+    current node. It is stored in the directory named by the
+    AWS_CLAIM_TABLE_DIR environment variable, or in the temp directory.
+    """
+
+    table_dir = os.environ.get(
+        constants.CLAIM_TABLE_DIR_ENV_VAR_NAME, tempfile.gettempdir())
+
+    return ClaimTable(
+        os.path.join(table_dir, '{0}-{1}.claims'.format(
+            ctx.deployment.id, ctx.node.id)))
+
+
+class ClaimTable(object):
+    """Shares the resources created by one bulk API call between
+    the members (node instances) that asked for them.
+
+    Members join the table and wait. One of them becomes the leader,
+    opens a batch for the waiting members, makes the call with the
+    batch client token, and closes the batch with the IDs it got.
+    Each closed batch assigns an ID of its reservation to a member,
+    until the member releases it.
+    A batch that was opened but not closed is handed over, with the
+    same client token, to the next leader.
+    """
+
+    def __init__(self, path, lease=constants.BULK_LEADER_LEASE):
+        self.path = path
+        self.lease = lease
+
+    def claimed(self, member):
+        """Returns the (reservation_id, resource_id) claimed by member,
+        or None.
+        """
+
+        with self._locked_state() as state:
+            return state['claims'].get(member)
+
+    def join(self, member):
+        """Adds member to the waiting members.
+
+        :returns True if member is now the leader.
+        """
+
+        with self._locked_state() as state:
+            if member in state['claims']:
+                return False
+            if member not in state['pending']:
+                state['pending'].append(member)
+
+            leader = state['leader']
+            if leader and leader[0] != member and leader[1] > time.time():
+                self._dump(state)
+                return False
+
+            state['leader'] = (member, time.time() + self.lease)
+            self._dump(state)
+
+        return True
+
+    def open_batch(self, member, size):
+        """Returns the (client_token, members) of the batch that the
+        leader should create. It is either a batch that a previous leader
+        left open, or a new one of up to size waiting members, starting
+        with member.
+        """
+
+        with self._locked_state() as state:
+            for client_token, batch in state['batches'].items():
+                return client_token, batch['members']
+
+            pending = [member] + \
+                [m for m in state['pending'] if m != member]
+            members = pending[:size]
+            client_token = str(uuid.uuid4())
+            state['batches'][client_token] = dict(members=members)
+            self._dump(state)
+
+        return client_token, members
+
+    def close_batch(self, client_token, reservation_id, resource_ids):
+        """Assigns resource_ids to the members of the batch, in order.
+        Members left without a resource are still waiting.
+        """
+
+        with self._locked_state() as state:
+            batch = state['batches'].pop(client_token)
+            for member, resource_id in zip(batch['members'], resource_ids):
+                state['claims'][member] = (reservation_id, resource_id)
+                if member in state['pending']:
+                    state['pending'].remove(member)
+            state['leader'] = None
+            self._dump(state)
+
+    def abandon_batch(self, client_token):
+        """Drops a batch that could not be created. Its members are
+        still waiting.
+        """
+
+        with self._locked_state() as state:
+            state['batches'].pop(client_token, None)
+            state['leader'] = None
+            self._dump(state)
+
+    def release(self, member):
+        """Removes the claim of member, e.g. once its resource is
+        deleted, so that a member with the same name joins again.
+        The file is removed once it has nothing left to share.
+        """
+
+        with self._locked_state() as state:
+            state['claims'].pop(member, None)
+            if member in state['pending']:
+                state['pending'].remove(member)
+            if state['claims'] or state['pending'] or state['batches']:
+                self._dump(state)
+            elif os.path.isfile(self.path):
+                os.remove(self.path)
+
+    def _locked_state(self):
+        return LockedState(
+            self.path, dict(pending=[], batches={}, claims={}, leader=None))
+
+    def _dump(self, state):
+        with open(self.path, 'wb') as table_file:
+            cPickle.dump(state, table_file, cPickle.HIGHEST_PROTOCOL)
@@ -0,0 +1,163 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+
+# Built-in Imports
+import os
+import time
+import cPickle
+import tempfile
+from collections import namedtuple
+
+# Third-party Imports
+from boto import exception
+
+# Cloudify imports
+from ec2 import utils
+from ec2 import constants
+from core.cache import LockedState
+from cloudify.exceptions import NonRecoverableError
+
+# The AMI metadata that the plugin uses. block_device_mapping maps
+# device names to BlockDeviceType arguments.
+Image = namedtuple(
+    'Image',
+    'id state architecture root_device_type root_device_name '
+    'block_device_mapping')
+
+BLOCK_DEVICE_ATTRIBUTES = [
+    'snapshot_id', 'size', 'volume_type', 'iops', 'encrypted',
+    'delete_on_termination', 'ephemeral_name', 'no_device']
+
+
+def get_image_cache():
+    """Returns the AMI cache of this agent. It is stored in the directory
+    named by the AWS_DESCRIBE_CACHE_DIR environment variable, or in the
+    temp directory, and shared by all of the deployments of the agent.
+    """
+
+    cache_dir = os.environ.get(
+        constants.DESCRIBE_CACHE_DIR_ENV_VAR_NAME, tempfile.gettempdir())
+
+    return ImageCache(os.path.join(cache_dir, 'images.cache'))
+
+
+def get_image_metadata(image_object):
+    """Returns the Image of a boto image object."""
+
+    return Image(
+        image_object.id,
+        image_object.state,
+        image_object.architecture,
+        image_object.root_device_type,
+        image_object.root_device_name,
+        dict((device, dict(
+            (attribute, getattr(block_device, attribute))
+            for attribute in BLOCK_DEVICE_ATTRIBUTES
+            if getattr(block_device, attribute, None) is not None))
+            for device, block_device in
+            (image_object.block_device_mapping or {}).items()))
+
+
+class ImageCache(object):
+    """Cache of AMI metadata, keyed by region, access key ID and image
+    ID. Only available images are cached, for ttl seconds, so that
+    images that are still pending are described again. The file is
+    locked while it is read or written.
+    """
+
+    def __init__(self, path, ttl=constants.IMAGE_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+
+    def get(self, client, image_id):
+        """Returns the Image of an AMI.
+
+        :raises NonRecoverableError: If the AMI does not exist
+            or Boto errors.
+        """
+
+        images = self._cached(client, [image_id])
+
+        if image_id not in images:
+            try:
+                image_objects = client.get_all_images(image_ids=[image_id])
+            except (exception.EC2ResponseError,
+                    exception.BotoServerError) as e:
+                raise NonRecoverableError('{0}.'.format(str(e)))
+            if not image_objects:
+                raise NonRecoverableError(
+                    'Image {0} does not exist.'.format(image_id))
+            images = self._store(client, image_objects)
+
+        return images[image_id]
+
+    def prefetch(self, client, image_ids):
+        """Returns the Images of many AMIs, describing the ones that are
+        not cached with one DescribeImages call. The AMIs that do not
+        exist are left out.
+        """
+
+        images = self._cached(client, image_ids)
+        missing = sorted(set(image_ids) - set(images))
+
+        if missing:
+            images.update(self._store(client, utils.describe_existing(
+                client.get_all_images, 'image_ids', missing)))
+
+        return images
+
+    def _cached(self, client, image_ids):
+
+        now = time.time()
+
+        with self._locked_state() as state:
+            entries = [(image_id, state.get(self._key(client, image_id)))
+                       for image_id in set(image_ids)]
+
+        return dict((image_id, entry[1]) for image_id, entry in entries
+                    if entry and entry[0] > now)
+
+    def _store(self, client, image_objects):
+
+        images = dict((image_object.id, get_image_metadata(image_object))
+                      for image_object in image_objects)
+        now = time.time()
+
+        with self._locked_state() as state:
+            for key in [key for key, (expires, _) in state.items()
+                        if expires < now]:
+                del state[key]
+            for image in images.values():
+                if image.state == 'available':
+                    state[self._key(client, image.id)] = \
+                        (now + self.ttl, image)
+            self._dump(state)
+
+        return images
+
+    def _key(self, client, image_id):
+        # The access key ID keeps the images that one account can see,
+        # such as its private images, from validating for another.
+        return (getattr(getattr(client, 'region', None), 'name', None),
+                getattr(client, 'aws_access_key_id', None),
+                image_id)
+
+    def _locked_state(self):
+        return LockedState(self.path, {})
+
+    def _dump(self, state):
+        with open(self.path, 'wb') as cache_file:
+            cPickle.dump(state, cache_file, cPickle.HIGHEST_PROTOCOL)
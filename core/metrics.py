@@ -0,0 +1,144 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+# Built-in Imports
+import os
+import json
+import time
+import functools
+import threading
+
+# Cloudify imports
+from ec2 import constants
+from cloudify import ctx
+
+# API calls of the running operations of this process, keyed by
+# (deployment_id, operation name, node instance id).
+_calls = {}
+_calls_lock = threading.Lock()
+
+
+def record(action, endpoint, latency, retries, throttles,
+           params=None, response=None):
+    """Records an AWS API call made for the current operation, and emits
+    it as a JSON line to the file named by the AWS_API_METRICS_PATH
+    environment variable, or to the debug log.
+
+    :param action: The API action, e.g. DescribeInstances.
+    :param endpoint: The host the call was sent to.
+    :param latency: The duration of the call in seconds,
+        including retries.
+    :param retries: How many times the call was retried.
+    :param throttles: How many of its attempts were throttled.
+    :param params: The request parameters.
+    :param response: The last boto HTTPResponse, if any.
+    """
+
+    key = operation_key()
+    deployment_id, operation, node_instance_id = key
+    call = dict(
+        timestamp=time.time(),
+        deployment_id=deployment_id,
+        operation=operation,
+        node_instance_id=node_instance_id,
+        action=action,
+        endpoint=endpoint,
+        latency=round(latency, 4),
+        retries=retries,
+        throttles=throttles,
+        status=getattr(response, 'status', None),
+        request_bytes=len(json.dumps(params or {})),
+        response_bytes=len(response.read()) if response else 0)
+
+    with _calls_lock:
+        if key in _calls:
+            _calls[key].append(call)
+
+    line = json.dumps(call, sort_keys=True)
+    path = os.environ.get(constants.API_METRICS_PATH_ENV_VAR_NAME)
+    if path:
+        with open(path, 'a') as metrics_file:
+            metrics_file.write(line + '\n')
+    elif node_instance_id:
+        ctx.logger.debug(line)
+
+
+def get_calls():
+    """Returns the API calls recorded for the current operation."""
+
+    with _calls_lock:
+        return list(_calls.get(operation_key(), []))
+
+
+def summarize(calls):
+    """Summarizes API calls by action.
+
+    :returns a string.
+    """
+
+    actions = {}
+    for call in calls:
+        count, latency = actions.get(call['action'], (0, 0))
+        actions[call['action']] = (count + 1, latency + call['latency'])
+
+    return '{0} AWS API calls in {1:.3f}s, {2} retries, {3} throttled: ' \
+        '{4}.'.format(
+            len(calls),
+            sum(call['latency'] for call in calls),
+            sum(call['retries'] for call in calls),
+            sum(call['throttles'] for call in calls),
+            ', '.join('{0} x{1} {2:.3f}s'.format(action, count, latency)
+                      for action, (count, latency) in sorted(
+                          actions.items(), key=lambda a: -a[1][1])))
+
+
+def summarize_api_calls(func):
+    """Decorates an operation to log a summary of the AWS API calls
+    that it made when it ends.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        key = operation_key()
+        with _calls_lock:
+            _calls[key] = []
+
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with _calls_lock:
+                calls = _calls.pop(key, [])
+            if calls:
+                ctx.logger.info(summarize(calls))
+
+    return wrapper
+
+
+def operation_key():
+    """Returns (deployment_id, operation name, node instance id),
+    or Nones outside of an operation, so that recording never fails
+    the operation.
+    """
+
+    try:
+        if ctx.type == constants.RELATIONSHIP_INSTANCE:
+            node_instance_id = ctx.source.instance.id
+        elif ctx.type == constants.NODE_INSTANCE:
+            node_instance_id = ctx.instance.id
+        else:
+            node_instance_id = None
+        return ctx.deployment.id, ctx.operation.name, node_instance_id
+    except (RuntimeError, AttributeError, KeyError):
+        return None, None, None
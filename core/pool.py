@@ -0,0 +1,248 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+
+# Built-in Imports
+import os
+import json
+import time
+import cPickle
+import hashlib
+import tempfile
+
+# Third-party Imports
+from boto import exception
+
+# Cloudify imports
+from ec2 import utils
+from ec2 import constants
+from core.cache import LockedState
+from cloudify import ctx
+from cloudify.exceptions import NonRecoverableError
+
+
+def get_warm_pool(signature):
+    """Returns the warm pool of the instances with this signature, see
+    get_signature. It is shared by all of the deployments of the agent,
+    and its claims are stored in the directory named by the
+    AWS_CLAIM_TABLE_DIR environment variable, or in the temp directory.
+    """
+
+    pool_dir = os.environ.get(
+        constants.CLAIM_TABLE_DIR_ENV_VAR_NAME, tempfile.gettempdir())
+
+    return WarmPool(
+        os.path.join(pool_dir, 'warm-pool-{0}.claims'.format(signature)),
+        signature)
+
+
+def get_signature(instance_parameters):
+    """Returns the signature of the instances that are launched with
+    instance_parameters. It covers all of the parameters, including the
+    block device map, the instance profile and the placement, so only
+    instances with the same signature can replace each other.
+    """
+
+    values = dict(instance_parameters)
+    values['security_group_ids'] = \
+        sorted(values.get('security_group_ids') or [])
+
+    return hashlib.sha1(json.dumps(
+        values, sort_keys=True, default=_signature_value)).hexdigest()[:16]
+
+
+def _signature_value(value):
+    # Boto parameter objects, such as BlockDeviceType or
+    # NetworkInterfaceSpecification, are hashed by their attributes.
+    return dict((name, attribute) for name, attribute in vars(value).items()
+                if name != 'connection')
+
+
+class WarmPool(object):
+    """A pool of stopped instances that are ready to be claimed by
+    node instances, so that they only have to be started.
+
+    The instances of the pool are tagged with its signature. Claiming
+    one replaces that tag with the claiming member, under the lock of
+    the claims file, so that the operations of the agent never claim
+    the same instance and other agents no longer see it in the pool.
+    The instances left in the pool are terminated when its last member
+    is released.
+    """
+
+    def __init__(self, path, signature, ttl=constants.WARM_POOL_CLAIM_TTL):
+        self.path = path
+        self.signature = signature
+        self.ttl = ttl
+
+    def claimed(self, member):
+        """Returns the (reservation ID, instance ID) claimed by member,
+        or None.
+        """
+
+        with self._locked_state() as state:
+            claim = state['claims'].get(member)
+
+        return claim[:2] if claim else None
+
+    def claim(self, client, member):
+        """Claims a stopped instance of the pool for member, and makes
+        member a member of the pool until it is released.
+
+        :returns the claimed (reservation ID, instance ID), or None if
+            the pool has no stopped instances.
+        """
+
+        with self._locked_state() as state:
+            if member in state['claims']:
+                return state['claims'][member][:2]
+
+            state['members'].add(member)
+            stopped = sorted(
+                (instance_object.id, reservation_id)
+                for reservation_id, instance_object in
+                self._describe(client, ['stopped'])
+                if constants.WARM_POOL_CLAIM_TAG not in instance_object.tags)
+            if not stopped:
+                self._dump(state)
+                return None
+
+            instance_id, reservation_id = stopped[0]
+            utils.add_tags_to_resources(
+                client, [instance_id],
+                {constants.WARM_POOL_CLAIM_TAG: member})
+            try:
+                client.delete_tags(
+                    [instance_id], {constants.WARM_POOL_TAG: None})
+            except (exception.EC2ResponseError,
+                    exception.BotoServerError) as e:
+                raise NonRecoverableError('{0}'.format(str(e)))
+
+            now = time.time()
+            for expired in [m for m, (_, _, claimed_at) in
+                            state['claims'].items()
+                            if claimed_at + self.ttl < now]:
+                del state['claims'][expired]
+            state['claims'][member] = (reservation_id, instance_id, now)
+            self._dump(state)
+
+        return reservation_id, instance_id
+
+    def replenish(self, client, instance_parameters, size):
+        """Stops the instances of the pool that finished launching, and
+        launches the instances that the pool is missing, under the lock
+        of the claims file so that concurrent creates do not launch them
+        twice. It does not wait for them: the instances launched by one
+        claim are stopped by the next one, so that no node instance
+        waits for the pool. Errors are logged, the pool is replenished
+        by the next claim.
+
+        :param size: The number of instances the pool should have.
+        :returns the IDs of the launched instances.
+        """
+
+        with self._locked_state():
+            try:
+                pool = [instance_object for _, instance_object in
+                        self._describe(client, constants.WARM_POOL_STATES)]
+                running = [instance_object.id for instance_object in pool
+                           if instance_object.state == 'running']
+                missing = size - len(pool)
+
+                if running:
+                    client.stop_instances(instance_ids=running)
+                if missing <= 0:
+                    return []
+
+                reservation = client.run_instances(
+                    **dict(instance_parameters,
+                           min_count=missing, max_count=missing))
+                launched = [instance_object.id
+                            for instance_object in reservation.instances]
+                client.create_tags(
+                    launched, {constants.WARM_POOL_TAG: self.signature})
+            except (NonRecoverableError,
+                    exception.EC2ResponseError,
+                    exception.BotoServerError) as e:
+                ctx.logger.warning(
+                    'Unable to replenish warm pool {0}: {1}'.format(
+                        self.signature, str(e)))
+                return []
+
+        ctx.logger.info(
+            'Launched {0} instances for warm pool {1}.'.format(
+                len(launched), self.signature))
+
+        return launched
+
+    def release(self, client, member):
+        """Removes member from the pool, e.g. once its instance is
+        terminated. When it was the last member, the instances left in
+        the pool are terminated and the file is removed.
+
+        :returns the IDs of the terminated pool instances.
+        :raises NonRecoverableError: If Boto errors. The member is not
+            removed then, so that releasing it again cleans up the pool.
+        """
+
+        with self._locked_state() as state:
+            state['claims'].pop(member, None)
+            state['members'].discard(member)
+            if state['members']:
+                self._dump(state)
+                return []
+
+            left = [instance_object.id for _, instance_object in
+                    self._describe(client, constants.WARM_POOL_STATES)]
+            if left:
+                try:
+                    client.terminate_instances(instance_ids=left)
+                except (exception.EC2ResponseError,
+                        exception.BotoServerError) as e:
+                    raise NonRecoverableError('{0}'.format(str(e)))
+
+            if os.path.isfile(self.path):
+                os.remove(self.path)
+
+        ctx.logger.info(
+            'Terminated the instances {0} of warm pool {1}.'.format(
+                left, self.signature))
+
+        return left
+
+    def _describe(self, client, states):
+        """Returns (reservation ID, instance) pairs of the instances of
+        the pool in states.
+        """
+
+        try:
+            reservations = client.get_all_reservations(filters={
+                'tag:{0}'.format(constants.WARM_POOL_TAG): self.signature,
+                'instance-state-name': states})
+        except (exception.EC2ResponseError,
+                exception.BotoServerError) as e:
+            raise NonRecoverableError('{0}'.format(str(e)))
+
+        return [(reservation.id, instance_object)
+                for reservation in reservations
+                for instance_object in reservation.instances]
+
+    def _locked_state(self):
+        return LockedState(self.path, dict(claims={}, members=set()))
+
+    def _dump(self, state):
+        with open(self.path, 'wb') as pool_file:
+            cPickle.dump(state, pool_file, cPickle.HIGHEST_PROTOCOL)
+
@@ -0,0 +1,290 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+# Built-in Imports
+import os
+import re
+import time
+import cPickle
+import tempfile
+from collections import defaultdict
+
+# Third-party Imports
+from boto import exception
+
+# Cloudify imports
+from ec2 import utils
+from ec2 import constants
+from vpc import constants as vpc_constants
+from vpc import connection
+from core import images
+from core import workers
+from core.cache import LockedState
+from cloudify import ctx
+from cloudify import manager
+from cloudify.exceptions import NonRecoverableError
+
+
+def get_preflight():
+    """Returns the creation_validation pre-flight of the current
+    deployment. It is stored in the directory named by the
+    AWS_CLAIM_TABLE_DIR environment variable, or in the temp directory.
+    """
+
+    preflight_dir = os.environ.get(
+        constants.CLAIM_TABLE_DIR_ENV_VAR_NAME, tempfile.gettempdir())
+
+    return Preflight(
+        os.path.join(preflight_dir, '{0}.preflight'.format(
+            ctx.deployment.id)))
+
+
+def _by_ids(function_name, argument, attribute='id', prefix=None):
+    """Returns a function that takes a client and resource IDs, and
+    returns the set of the IDs that exist. IDs without prefix cannot
+    exist, and are not described.
+    """
+
+    def describe(client, resource_ids):
+        resource_ids = [resource_id for resource_id in resource_ids
+                        if not prefix or resource_id.startswith(prefix)]
+        return set(getattr(resource, attribute) for resource in
+                   utils.describe_existing(
+                       getattr(client, function_name), argument,
+                       resource_ids))
+
+    return describe
+
+
+def _describe_security_groups(client, ids_and_names):
+
+    groups = []
+    for filter_name, values in [
+            ('group-id', [value for value in ids_and_names
+                          if re.match(constants.SECURITY_GROUP_ID_FORMAT,
+                                      value)]),
+            ('group-name', ids_and_names)]:
+        if not values:
+            continue
+        try:
+            groups.extend(client.get_all_security_groups(
+                filters={filter_name: values}))
+        except (exception.EC2ResponseError,
+                exception.BotoServerError) as e:
+            raise NonRecoverableError('{0}'.format(str(e)))
+
+    return set(group.id for group in groups) | \
+        set(group.name for group in groups)
+
+
+# node type: (resource type, describe function, whether node instances
+# without a resource_id get a generated one, see utils.get_resource_id)
+RESOURCE_TYPES = {
+    'cloudify.aws.nodes.Instance': (
+        'instance', _by_ids('get_only_instances', 'instance_ids',
+                            prefix='i-'), True),
+    'cloudify.aws.nodes.Volume': (
+        'volume', _by_ids('get_all_volumes', 'volume_ids',
+                          prefix='vol-'), True),
+    'cloudify.aws.nodes.SecurityGroup': (
+        'security_group', _describe_security_groups, True),
+    'cloudify.aws.nodes.ElasticIP': (
+        'elasticip', _by_ids('get_all_addresses', 'addresses',
+                             attribute='public_ip'), False),
+    'cloudify.aws.nodes.KeyPair': (
+        'keypair', _by_ids('get_all_key_pairs', 'keynames',
+                           attribute='name'), False),
+}
+
+for _resource, _function_name in [
+        (vpc_constants.VPC, 'get_all_vpcs'),
+        (vpc_constants.SUBNET, 'get_all_subnets'),
+        (vpc_constants.ROUTE_TABLE, 'get_all_route_tables'),
+        (vpc_constants.NETWORK_ACL, 'get_all_network_acls'),
+        (vpc_constants.INTERNET_GATEWAY, 'get_all_internet_gateways'),
+        (vpc_constants.VPN_GATEWAY, 'get_all_vpn_gateways'),
+        (vpc_constants.CUSTOMER_GATEWAY, 'get_all_customer_gateways'),
+        (vpc_constants.DHCP_OPTIONS, 'get_all_dhcp_options')]:
+    RESOURCE_TYPES[_resource['CLOUDIFY_NODE_TYPE']] = (
+        _resource['AWS_RESOURCE_TYPE'],
+        _by_ids(_function_name,
+                '{0}_ids'.format(_resource['AWS_RESOURCE_TYPE'])),
+        False)
+
+
+def get_resource_type(type_hierarchy):
+    """Returns the RESOURCE_TYPES entry of the most derived
+    type of a node, or None.
+    """
+
+    for node_type in reversed(type_hierarchy or []):
+        if node_type in RESOURCE_TYPES:
+            return RESOURCE_TYPES[node_type]
+
+    return None
+
+
+class Preflight(object):
+    """Answers the creation_validation of all of the nodes of a
+    deployment with one describe call per resource type, and one
+    DescribeImages call for the images of all of the instances.
+
+    The first validation lists the nodes of the deployment with the
+    REST client, describes their resources and stores which of them
+    exist for ttl seconds. The validations that start meanwhile wait
+    for it on the lock of the file, and then read it.
+    """
+
+    def __init__(self, path, ttl=constants.PREFLIGHT_TTL):
+        self.path = path
+        self.ttl = ttl
+
+    def exists(self, resource_id):
+        """Checks whether the resource of the current node exists.
+
+        :returns True or False, or None if the pre-flight does
+            not cover the resource.
+        """
+
+        resource_type = get_resource_type(
+            getattr(ctx.node, 'type_hierarchy', None))
+
+        if not resource_type or not resource_id:
+            return None
+
+        checked, found = self._results()['resources'].get(
+            resource_type[0], ((), ()))
+
+        if resource_id not in checked:
+            return None
+
+        return resource_id in found
+
+    def image_state(self, image_id):
+        """Returns the state of an image, '' if it does not exist,
+        or None if the pre-flight does not cover the image.
+        """
+
+        states = self._results()['images']
+
+        if not image_id or image_id not in states:
+            return None
+
+        return states[image_id]
+
+    def _results(self):
+
+        with self._locked_state() as state:
+            if state['created'] + self.ttl > time.time():
+                return state
+
+            nodes = _list_deployment_nodes()
+            if nodes is None:
+                return dict(created=0, resources={}, images={})
+
+            state = _describe_deployment_resources(*nodes)
+            self._dump(state)
+
+        return state
+
+    def _locked_state(self):
+        return LockedState(
+            self.path, dict(created=0, resources={}, images={}))
+
+    def _dump(self, state):
+        with open(self.path, 'wb') as preflight_file:
+            cPickle.dump(state, preflight_file, cPickle.HIGHEST_PROTOCOL)
+
+
+def _list_deployment_nodes():
+    """Returns the (nodes, node_instances) of the current deployment,
+    or None if the REST client cannot list them, e.g. outside of
+    a manager.
+    """
+
+    try:
+        client = manager.get_rest_client()
+        return (client.nodes.list(deployment_id=ctx.deployment.id),
+                client.node_instances.list(deployment_id=ctx.deployment.id))
+    except Exception as e:
+        ctx.logger.debug(
+            'Validating without a pre-flight, because the nodes of the '
+            'deployment could not be listed: {0}'.format(str(e)))
+        return None
+
+
+def _describe_deployment_resources(nodes, node_instances):
+
+    instance_ids = defaultdict(list)
+    for node_instance in node_instances:
+        instance_ids[node_instance.node_id].append(node_instance.id)
+
+    resource_ids = defaultdict(set)
+    image_ids = set()
+
+    for node in nodes:
+        resource_type = get_resource_type(node.type_hierarchy)
+        if not resource_type:
+            continue
+        name, _, generated = resource_type
+
+        if node.properties.get('resource_id'):
+            resource_ids[name].add(node.properties['resource_id'])
+        elif generated:
+            resource_ids[name].update(
+                '{0}-{1}'.format(ctx.deployment.id, instance_id)
+                for instance_id in instance_ids[node.id])
+
+        if name == 'instance' and node.properties.get('image_id'):
+            image_ids.add(node.properties['image_id'])
+
+    describe_functions = dict(
+        (name, describe) for name, describe, _ in RESOURCE_TYPES.values())
+    client = connection.VPCConnectionClient().client()
+
+    def describe(name):
+        if name is None:
+            return dict((image_id, image.state) for image_id, image in
+                        images.get_image_cache().prefetch(
+                            client, image_ids).items())
+        return describe_functions[name](client, sorted(resource_ids[name]))
+
+    # None stands for the images.
+    names = sorted(resource_ids)
+    results = workers.run_concurrently(
+        describe, names + ([None] if image_ids else []))
+
+    # A type that fails to describe, e.g. because it is not authorized,
+    # is left out, so that its nodes fall back to their own describe.
+    for name, (_, error) in zip(names + ['images'], results):
+        if error:
+            ctx.logger.warning(
+                'Pre-flight could not describe the {0}: {1}'.format(
+                    name, str(error)))
+
+    resources = dict(
+        (name, (resource_ids[name], found))
+        for name, (found, error) in zip(names, results) if not error)
+    image_states = {}
+    if image_ids and not results[-1][1]:
+        image_states = dict((image_id, '') for image_id in image_ids)
+        image_states.update(results[-1][0])
+
+    ctx.logger.debug(
+        'Pre-flight of {0} resources and {1} images.'.format(
+            sum(len(ids) for ids in resource_ids.values()), len(image_ids)))
+
+    return dict(created=time.time(), resources=resources,
+                images=image_states)
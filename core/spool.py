@@ -0,0 +1,151 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+# Built-in Imports
+import os
+import time
+import cPickle
+import tempfile
+from collections import OrderedDict
+
+# Cloudify imports
+from ec2 import constants
+from core.cache import LockedState
+from cloudify import ctx
+
+
+def get_registration_spool(elb_name):
+    """Returns the registration spool of a load balancer of the current
+    deployment. It is stored in the directory named by the
+    AWS_CLAIM_TABLE_DIR environment variable, or in the temp directory.
+    """
+
+    spool_dir = os.environ.get(
+        constants.CLAIM_TABLE_DIR_ENV_VAR_NAME, tempfile.gettempdir())
+
+    return RegistrationSpool(
+        os.path.join(spool_dir, '{0}-elb-{1}.spool'.format(
+            ctx.deployment.id, elb_name)))
+
+
+class RegistrationSpool(object):
+    """Coalesces the registrations and deregistrations of instances
+    with one load balancer that node instances request at the same time.
+
+    Members submit a request, an (action, instance_id) pair, and wait.
+    One of them becomes the leader, takes all of the pending requests,
+    makes one call per action and completes the requests with the
+    result of their call. A later request for the same instance
+    replaces the pending one.
+    """
+
+    def __init__(self, path, lease=constants.BULK_LEADER_LEASE):
+        self.path = path
+        self.lease = lease
+
+    def submit(self, request):
+        """Adds request to the pending requests, unless it is completed.
+
+        :returns True if the caller is now the leader.
+        """
+
+        action, instance_id = request
+
+        with self._locked_state() as state:
+            self._expire(state)
+            if request in state['results']:
+                return False
+            state['pending'][instance_id] = action
+
+            leader = state['leader']
+            if leader and leader[0] != request and leader[1] > time.time():
+                self._dump(state)
+                return False
+
+            state['leader'] = (request, time.time() + self.lease)
+            self._dump(state)
+
+        return True
+
+    def take(self):
+        """Removes the pending requests and returns them, grouped by
+        action, in an OrderedDict of action to instance IDs.
+        """
+
+        batches = OrderedDict()
+
+        with self._locked_state() as state:
+            for instance_id, action in state['pending'].items():
+                batches.setdefault(action, []).append(instance_id)
+            state['pending'] = OrderedDict()
+            self._dump(state)
+
+        return batches
+
+    def complete(self, action, instance_ids, error=None):
+        """Records the result of the call made for a batch.
+
+        :param error: The error message of the call, or None.
+        """
+
+        with self._locked_state() as state:
+            for instance_id in instance_ids:
+                state['results'][(action, instance_id)] = \
+                    ((error,), time.time())
+            self._dump(state)
+
+    def release(self):
+        with self._locked_state() as state:
+            state['leader'] = None
+            self._save(state)
+
+    def result(self, request):
+        """Removes the result of a completed request and returns it,
+        as an (error,) tuple, or returns None if it is not completed.
+        """
+
+        with self._locked_state() as state:
+            result = state['results'].pop(request, None)
+            if result is not None:
+                self._save(state)
+            return result and result[0]
+
+    def _expire(self, state):
+        """Drops the results that their members did not read within
+        the lease, e.g. because their operation was cancelled.
+        """
+
+        for request, (_, completed) in state['results'].items():
+            if completed + self.lease < time.time():
+                del state['results'][request]
+
+    def _save(self, state):
+        """Writes the state, or removes the file once it has no
+        pending requests, results or leader.
+        """
+
+        self._expire(state)
+        if state['pending'] or state['results'] or state['leader']:
+            self._dump(state)
+        elif os.path.isfile(self.path):
+            os.remove(self.path)
+
+    def _locked_state(self):
+        return LockedState(
+            self.path, dict(pending=OrderedDict(), results={}, leader=None))
+
+    def _dump(self, state):
+        with open(self.path, 'wb') as spool_file:
+            cPickle.dump(state, spool_file, cPickle.HIGHEST_PROTOCOL)
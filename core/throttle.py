@@ -0,0 +1,159 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+# Built-in Imports
+import time
+import hashlib
+import threading
+
+# Cloudify imports
+from ec2 import constants
+from core import cache
+from core import metrics
+
+# Process wide rate limiter, shared by all of the pooled connections.
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """Returns the rate limiter shared by the operations of this process,
+    creating it on the first call.
+    """
+
+    global _rate_limiter
+
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = RateLimiter()
+        return _rate_limiter
+
+
+def throttle_client(client):
+    """Routes the API requests of a boto connection through the rate
+    limiter, and records them in the metrics of the current operation.
+    Requests that are not reads invalidate the describe cache file of
+    the deployment, so that the operations that share it do not read
+    the state from before the write.
+
+    Throttled responses are not retried here: boto already retries the
+    503 responses of RequestLimitExceeded with jittered exponential
+    backoff, and AwsBase turns the throttling errors that are left into
+    a RecoverableError.
+
+    :param client: An EC2, VPC or ELB connection.
+    :returns the same connection.
+    """
+
+    make_request = client.make_request
+    account = hashlib.sha1(client.aws_access_key_id or '').hexdigest()
+
+    def throttled_make_request(action, *args, **kwargs):
+        rate_limiter = get_rate_limiter()
+        key = (account, client.host, action)
+        start = time.time()
+        response = None
+        throttled = False
+        try:
+            rate_limiter.acquire(key)
+            response = make_request(action, *args, **kwargs)
+            throttled = is_throttled(response)
+            rate_limiter.adapt(key, throttled)
+            if not action.startswith(constants.READ_ACTION_PREFIXES):
+                cache.invalidate_describe_cache()
+        finally:
+            metrics.record(
+                action, client.host, time.time() - start, 0, int(throttled),
+                args[0] if args else kwargs.get('params'), response)
+        return response
+
+    client.make_request = throttled_make_request
+
+    return client
+
+
+def is_throttled(response):
+    """Checks whether AWS rejected a request because of its rate.
+
+    :param response: A boto HTTPResponse, which caches its body.
+    """
+
+    if response.status < 400:
+        return False
+
+    body = response.read()
+
+    return any('<Code>{0}</Code>'.format(code) in body
+               for code in constants.THROTTLING_ERROR_CODES)
+
+
+class RateLimiter(object):
+    """Token buckets keyed by (account, endpoint, API action), kept in
+    the memory of the process and shared by its threads.
+
+    The refill rate of a bucket adapts to the limits of AWS:
+    it increases additively after each accepted request and decreases
+    multiplicatively when a request is throttled.
+    """
+
+    def __init__(self,
+                 burst=constants.THROTTLE_BURST,
+                 initial_rate=constants.THROTTLE_INITIAL_RATE,
+                 min_rate=constants.THROTTLE_MIN_RATE,
+                 max_rate=constants.THROTTLE_MAX_RATE):
+        self.burst = burst
+        self.initial_rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, key):
+        """Takes a token from a bucket, waiting for it if the bucket
+        is empty. Waiting callers reserve their tokens in advance,
+        so that they are served in order.
+        """
+
+        with self.lock:
+            tokens, rate = self._refill(key)
+            tokens -= 1
+            self.buckets[key] = (tokens, time.time(), rate)
+
+        if tokens < 0:
+            time.sleep(-tokens / rate)
+
+    def adapt(self, key, throttled):
+        """Adapts the rate of a bucket after a request."""
+
+        with self.lock:
+            tokens, rate = self._refill(key)
+            if throttled:
+                rate = max(self.min_rate,
+                           rate * constants.THROTTLE_RATE_DECREASE)
+                tokens = min(tokens, 0)
+            else:
+                rate = min(self.max_rate,
+                           rate + constants.THROTTLE_RATE_INCREASE)
+            self.buckets[key] = (tokens, time.time(), rate)
+
+    def rate(self, key):
+        with self.lock:
+            return self._refill(key)[1]
+
+    def _refill(self, key):
+        tokens, updated, rate = self.buckets.get(
+            key, (self.burst, time.time(), self.initial_rate))
+        tokens = min(self.burst, tokens + (time.time() - updated) * rate)
+        return tokens, rate
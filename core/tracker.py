@@ -0,0 +1,132 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+# Built-in Imports
+import os
+import time
+import cPickle
+import tempfile
+
+# Cloudify imports
+from ec2 import utils
+from ec2 import constants
+from core.cache import LockedState
+from cloudify import ctx
+
+
+def get_state_tracker(name, describe_states):
+    """Returns the state tracker of a resource type for the current
+    deployment. It is stored in the directory named by the
+    AWS_CLAIM_TABLE_DIR environment variable, or in the temp directory.
+
+    :param name: The name of the resource type, e.g. 'volumes'.
+    :param describe_states: A callable that takes a list of resource IDs
+        and returns a dict of the states of the resources that exist.
+    """
+
+    tracker_dir = os.environ.get(
+        constants.CLAIM_TABLE_DIR_ENV_VAR_NAME, tempfile.gettempdir())
+
+    return StateTracker(
+        os.path.join(tracker_dir, '{0}-{1}.states'.format(
+            ctx.deployment.id, name)),
+        describe_states)
+
+
+class StateTracker(object):
+    """Polls the states of the resources that the concurrent operations
+    of a deployment wait for, with one describe call for all of them.
+
+    Waiters watch resource IDs. A waiter reuses the states that another
+    waiter polled since its own last check, and otherwise polls the
+    states of all of the watched resources for everyone. Resources that
+    nobody checked for watch_ttl seconds are no longer polled.
+    """
+
+    def __init__(self, path, describe_states,
+                 watch_ttl=constants.STATE_WATCH_TTL):
+        self.path = path
+        self.describe_states = describe_states
+        self.watch_ttl = watch_ttl
+
+    def wait_for(self, resource_ids, condition,
+                 timeout=constants.WAITER_TIMEOUT):
+        """Waits, with the backoff of utils.wait_for, until condition
+        is met by the states of resource_ids.
+
+        :param condition: A callable that takes a dict of resource ID
+            to state, where the state of a missing resource is None.
+        :returns the last states.
+        """
+
+        last = dict(polled=time.time(), states={})
+
+        def check():
+            last['polled'], last['states'] = \
+                self.states(resource_ids, last['polled'])
+            return condition(last['states'])
+
+        try:
+            utils.wait_for(check, timeout)
+        finally:
+            self.unwatch(resource_ids)
+
+        return last['states']
+
+    def states(self, resource_ids, since):
+        """Returns the (polled, states) of resource_ids, where polled
+        is the time of a poll made after since.
+        """
+
+        now = time.time()
+
+        with self._locked_state() as state:
+            watched = state['watched']
+            for resource_id in resource_ids:
+                watched[resource_id] = now
+            for resource_id, checked in watched.items():
+                if checked < now - self.watch_ttl:
+                    del watched[resource_id]
+
+            if state['polled'] <= since or \
+                    any(resource_id not in state['states']
+                        for resource_id in resource_ids):
+                resource_ids_to_poll = sorted(watched)
+                states = self.describe_states(resource_ids_to_poll)
+                state['states'] = dict(
+                    (resource_id, states.get(resource_id))
+                    for resource_id in resource_ids_to_poll)
+                state['polled'] = time.time()
+
+            self._dump(state)
+
+            return state['polled'], dict(
+                (resource_id, state['states'][resource_id])
+                for resource_id in resource_ids)
+
+    def unwatch(self, resource_ids):
+        with self._locked_state() as state:
+            for resource_id in resource_ids:
+                state['watched'].pop(resource_id, None)
+                state['states'].pop(resource_id, None)
+            self._dump(state)
+
+    def _locked_state(self):
+        return LockedState(
+            self.path, dict(watched={}, states={}, polled=0))
+
+    def _dump(self, state):
+        with open(self.path, 'wb') as tracker_file:
+            cPickle.dump(state, tracker_file, cPickle.HIGHEST_PROTOCOL)
@@ -0,0 +1,67 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+
+# Built-in Imports
+from multiprocessing.pool import ThreadPool
+
+# Cloudify imports
+from ec2 import constants
+from cloudify.state import current_ctx
+
+
+def run_concurrently(function, items, pool_size=constants.WORKER_POOL_SIZE):
+    """Calls a function with each item on a bounded pool of threads.
+    The threads share the Cloudify context of the caller, so that the
+    calls can log, and are recorded in the metrics of the operation.
+
+    :param function: A callable that takes one item.
+    :param items: The items.
+    :param pool_size: The maximum number of concurrent calls.
+    :returns a list of (result, error) tuples in the order of the items,
+        where error is the exception that the call raised, or None.
+    """
+
+    items = list(items)
+
+    def call(item):
+        try:
+            return function(item), None
+        except Exception as e:
+            return None, e
+
+    if len(items) <= 1 or pool_size <= 1:
+        return [call(item) for item in items]
+
+    try:
+        context = current_ctx.get_ctx()
+        parameters = current_ctx.get_parameters()
+    except RuntimeError:
+        context, parameters = None, None
+
+    def call_in_context(item):
+        if context:
+            current_ctx.set(context, parameters)
+        try:
+            return call(item)
+        finally:
+            current_ctx.clear()
+
+    pool = ThreadPool(min(pool_size, len(items)))
+    try:
+        return pool.map(call_in_context, items)
+    finally:
+        pool.close()
+        pool.join()
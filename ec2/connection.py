@@ -15,6 +15,9 @@
 
 # Builtin Imports
 import os
+import time
+import hashlib
+import threading
 import ConfigParser
 
 # Third-party Imports
@@ -27,8 +30,81 @@ from boto.ec2.elb import connect_to_region as connect_to_elb_region
 # Cloudify Imports
 from ec2 import utils
 from ec2 import constants
+from core import throttle
 from cloudify.exceptions import NonRecoverableError
 
+# Process wide registry of boto connections, so that every operation
+# running in this agent reuses the same keep-alive client instead of
+# building a new connection (and TLS handshake) per API call.
+_connections = {}
+_connections_lock = threading.Lock()
+
+# Parsed and validated Boto cfg files, keyed by path and
+# holding the (mtime, size) signature of the parsed version.
+_config_files = {}
+_config_files_lock = threading.Lock()
+
+
+def _connection_key(service, aws_config):
+    """Builds the registry key of a connection.
+
+    :param service: The name of the AWS service, e.g. ec2, vpc or elb.
+    :param aws_config: The keyword arguments passed to the boto connection.
+    :returns a tuple of (service, region, endpoint, credential fingerprint).
+    """
+
+    region = aws_config.get('region')
+    if isinstance(region, RegionInfo):
+        region_name, endpoint = region.name, region.endpoint
+    else:
+        region_name, endpoint = region, aws_config.get('host')
+
+    fingerprint = hashlib.sha1(repr(sorted(
+        (key, value) for key, value in aws_config.items()
+        if key != 'region'))).hexdigest()
+
+    return service, region_name, endpoint, fingerprint
+
+
+def get_pooled_connection(service, factory, aws_config):
+    """Returns a shared connection for service and aws_config,
+    creating it with factory(**aws_config) if none exists yet.
+    The API requests of the connection go through the rate limiter.
+    Connections unused for CONNECTION_IDLE_TIMEOUT seconds are evicted.
+    """
+
+    key = _connection_key(service, aws_config)
+    now = time.time()
+
+    with _connections_lock:
+        for idle_key, (_, last_used) in _connections.items():
+            if now - last_used > constants.CONNECTION_IDLE_TIMEOUT:
+                del _connections[idle_key]
+        if key in _connections:
+            client = _connections[key][0]
+            _connections[key] = (client, now)
+            return client
+
+    client = throttle.throttle_client(factory(**aws_config))
+
+    with _connections_lock:
+        _connections[key] = (client, now)
+
+    return client
+
+
+def reset_connections(client=None):
+    """Drops a connection from the registry, or all of them,
+    so that the next client() call builds a new one.
+
+    :param client: The connection to drop. None drops all connections.
+    """
+
+    with _connections_lock:
+        for key, (pooled_client, _) in _connections.items():
+            if client is None or pooled_client is client:
+                del _connections[key]
+
 
 class EC2ConnectionClient():
     """Provides functions for getting the EC2 Client
@@ -44,7 +120,7 @@ class EC2ConnectionClient():
         aws_config_property = (self._get_aws_config_property() or
                                self._get_aws_config_from_file())
         if not aws_config_property:
-            return EC2Connection()
+            return get_pooled_connection('ec2', EC2Connection, {})
         elif aws_config_property.get('ec2_region_name'):
             region_object = \
                 get_region(aws_config_property['ec2_region_name'])
@@ -58,7 +134,7 @@ class EC2ConnectionClient():
 
         aws_config = self.aws_config_cleanup(aws_config)
 
-        return EC2Connection(**aws_config)
+        return get_pooled_connection('ec2', EC2Connection, aws_config)
 
     def _get_aws_config_property(self):
         node_properties = \
@@ -77,12 +153,31 @@ class EC2ConnectionClient():
         return os.environ.get(constants.AWS_CONFIG_PATH_ENV_VAR_NAME)
 
     def _parse_config_file(self, path):
-        """Parse and validate Boto cfg file
+        """Parse and validate Boto cfg file, once per change of the file
         """
         path = str(path)
         if not os.path.isfile(path):
             raise NonRecoverableError('no aws config file at {0}'.format(path))
 
+        stat = os.stat(path)
+        signature = (stat.st_mtime, stat.st_size)
+
+        with _config_files_lock:
+            cached = _config_files.get(path)
+        if cached and cached[0] == signature:
+            return cached[1].copy()
+
+        config = self._read_config_file(path)
+
+        with _config_files_lock:
+            _config_files[path] = (signature, config)
+
+        return config.copy()
+
+    def _read_config_file(self, path):
+        """Read and validate Boto cfg file
+        """
+
         parser = ConfigParser.ConfigParser()
         parser.read(path)
 
@@ -135,6 +230,18 @@ class EC2ConnectionClient():
         return aws_config
 
 
+def _connect_to_elb_region(region, **aws_config):
+
+    client = connect_to_elb_region(region, **aws_config)
+
+    if client is None:
+        raise NonRecoverableError(
+            'Cannot connect to ELB endpoint. Unknown elb_region_name '
+            '{0}.'.format(region))
+
+    return client
+
+
 class ELBConnectionClient(EC2ConnectionClient):
 
     def client(self):
@@ -144,7 +251,7 @@ class ELBConnectionClient(EC2ConnectionClient):
         aws_config_property = (self._get_aws_config_property() or
                                self._get_aws_config_from_file())
         if not aws_config_property:
-            return ELBConnection()
+            return get_pooled_connection('elb', ELBConnection, {})
 
         aws_config = aws_config_property.copy()
 
@@ -163,11 +270,11 @@ class ELBConnectionClient(EC2ConnectionClient):
 
         if 'region' in aws_config:
             if type(aws_config['region']) is RegionInfo:
-                return ELBConnection(**aws_config)
-            elif type(aws_config['region']) is str:
-                elb_region = aws_config.pop('region')
-                return connect_to_elb_region(
-                    elb_region, **aws_config)
+                return get_pooled_connection(
+                    'elb', ELBConnection, aws_config)
+            elif isinstance(aws_config['region'], basestring):
+                return get_pooled_connection(
+                    'elb', _connect_to_elb_region, aws_config)
 
         raise NonRecoverableError(
             'Cannot connect to ELB endpoint. '
@@ -19,6 +19,11 @@ INSTANCE_STATE_STARTED = 16
 INSTANCE_STATE_TERMINATED = 48
 INSTANCE_STATE_STOPPED = 80
 
+WAITER_TIMEOUT = 30
+WAITER_INITIAL_DELAY = 1
+WAITER_MAX_DELAY = 8
+STATE_WATCH_TTL = 60
+
 AWS_TYPE_PROPERTY = 'external_type'  # resource's openstack type
 
 INSTANCE_REQUIRED_PROPERTIES = ['image_id', 'instance_type']
@@ -53,6 +58,10 @@ ADMIN_PASSWORD_PROPERTY = 'password'  # the server's password
 
 # securitygroup module constants
 SECURITY_GROUP_REQUIRED_PROPERTIES = ['description', 'rules']
+# 8 character IDs, and the 17 character IDs of newer accounts
+SECURITY_GROUP_ID_FORMAT = '^sg-([0-9a-z]{8}|[0-9a-z]{17})$'
+IP_PROTOCOL_NUMBERS = {'all': '-1', 'icmp': '1', 'tcp': '6', 'udp': '17',
+                       'icmpv6': '58'}
 
 # ELB Default Values
 HEALTH_CHECK_INTERVAL = 30
@@ -66,9 +75,12 @@ ELB_REQUIRED_PROPERTIES = ['elb_name', 'zones', 'listeners']
 ZONE = 'zone'
 VOLUME_REQUIRED_PROPERTIES = ['size', ZONE, 'device']
 VOLUME_SNAPSHOT_ATTRIBUTE = 'snapshots_ids'
+VOLUME_SNAPSHOTS_BY_VOLUME_ATTRIBUTE = 'snapshots_ids_by_volume'
 VOLUME_AVAILABLE = 'available'
 VOLUME_CREATING = 'creating'
 VOLUME_IN_USE = 'in-use'
+SNAPSHOT_COMPLETED = 'completed'
+SNAPSHOT_ERROR = 'error'
 
 # keypair module constants
 KEYPAIR_REQUIRED_PROPERTIES = ['private_key_path']
@@ -83,6 +95,41 @@ EXTERNAL_RESOURCE_ID = 'aws_resource_id'
 NODE_INSTANCE = 'node-instance'
 RELATIONSHIP_INSTANCE = 'relationship-instance'
 AWS_CONFIG_PATH_ENV_VAR_NAME = "AWS_CONFIG_PATH"
+CONNECTION_IDLE_TIMEOUT = 300
+AUTH_ERROR_CODES = ['AuthFailure', 'SignatureDoesNotMatch',
+                    'InvalidClientTokenId', 'ExpiredToken',
+                    'RequestExpired']
+DESCRIBE_CACHE_DIR_ENV_VAR_NAME = "AWS_DESCRIBE_CACHE_DIR"
+DESCRIBE_CACHE_TTL = 30
+DESCRIBE_CACHE_MAX_ENTRIES = 256
+IMAGE_CACHE_TTL = 3600
+DESCRIBE_FUNCTION_PREFIXES = ('get_', 'describe_')
+READ_ACTION_PREFIXES = ('Describe', 'Get', 'List')
+DESCRIBE_PAGE_SIZE = 100
+AVAILABLE_RESOURCES_LOG_LIMIT = 20
+AVAILABLE_RESOURCES_SCAN_LIMIT = 1000
+INVENTORY_DIR_ENV_VAR_NAME = "AWS_INVENTORY_DIR"
+CLAIM_TABLE_DIR_ENV_VAR_NAME = "AWS_CLAIM_TABLE_DIR"
+BULK_WINDOW = 5
+BULK_LEADER_LEASE = 120
+INSTANCE_LAUNCHED_STATES = ['pending', 'running']
+WARM_POOL_TAG = 'cloudify-warm-pool'
+WARM_POOL_CLAIM_TAG = 'cloudify-warm-pool-claim'
+WARM_POOL_CLAIM_TTL = 3600
+WARM_POOL_STATES = ['pending', 'running', 'stopping', 'stopped']
+WARM_POOL_SIGNATURE = 'warm_pool_signature'
+WARM_POOL_UNSUPPORTED_PARAMETERS = ['private_ip_address']
+PREFLIGHT_TTL = 60
+THROTTLING_ERROR_CODES = ['RequestLimitExceeded', 'Throttling',
+                          'ThrottlingException']
+THROTTLE_BURST = 20
+THROTTLE_INITIAL_RATE = 10
+THROTTLE_MIN_RATE = 0.5
+THROTTLE_MAX_RATE = 100
+THROTTLE_RATE_INCREASE = 0.1
+THROTTLE_RATE_DECREASE = 0.5
+API_METRICS_PATH_ENV_VAR_NAME = "AWS_API_METRICS_PATH"
+WORKER_POOL_SIZE = 8
 
 # Boto config schema (section > options)
 BOTO_CONFIG_SCHEMA = {
@@ -14,6 +14,8 @@
 #    * limitations under the License.
 
 # Built in Imports
+import re
+import time
 import datetime
 
 # Third-party Imports
@@ -23,12 +25,18 @@ import boto.exception
 from ec2 import utils
 from ec2 import constants
 from ec2 import connection
+from core import base
+from core import metrics
+from core import preflight
+from core import tracker
+from core import workers
 from cloudify import ctx
 from cloudify.exceptions import NonRecoverableError
 from cloudify.decorators import operation
 
 
 @operation
+@metrics.summarize_api_calls
 def creation_validation(**_):
     """ This validates all EBS volume Nodes before bootstrap.
     """
@@ -36,7 +44,10 @@ def creation_validation(**_):
     for property_key in constants.VOLUME_REQUIRED_PROPERTIES:
         utils.validate_node_property(property_key, ctx.node.properties)
 
-    volume_object = _get_volumes_from_id(utils.get_resource_id())
+    resource_id = utils.get_resource_id()
+    volume_object = preflight.get_preflight().exists(resource_id)
+    if volume_object is None:
+        volume_object = _get_volumes_from_id(resource_id)
 
     if ctx.node.properties['use_external_resource'] and not volume_object:
         raise NonRecoverableError(
@@ -50,6 +61,7 @@ def creation_validation(**_):
 
 
 @operation
+@metrics.summarize_api_calls
 def create(args, **_):
     """Creates an EBS volume.
     """
@@ -84,7 +96,8 @@ def create(args, **_):
 
 
 @operation
-def delete(**_):
+@metrics.summarize_api_calls
+def delete(wait_timeout=constants.WAITER_TIMEOUT, **_):
     """ Deletes an EBS Volume.
     """
 
@@ -96,7 +109,7 @@ def delete(**_):
 
     ctx.logger.debug('Deleting EBS volume: {0}'.format(volume_id))
 
-    if not _delete_volume(volume_id):
+    if not _delete_volume(volume_id, wait_timeout):
         return ctx.operation.retry(
             message='Failed to delete volume {0}.'
                     .format(volume_id))
@@ -113,7 +126,8 @@ def delete(**_):
 
 
 @operation
-def attach(**_):
+@metrics.summarize_api_calls
+def attach(wait_timeout=constants.WAITER_TIMEOUT, **_):
     """ Attaches an EBS volume created by Cloudify with an EC2 Instance
     that was also created by Cloudify.
     """
@@ -138,29 +152,32 @@ def attach(**_):
     if _attach_external_volume_or_instance(instance_id):
         return
 
-    volume_object = _get_volumes_from_id(volume_id)
+    status = _wait_for_volume_status(
+        volume_id, lambda status: status != constants.VOLUME_CREATING,
+        wait_timeout)
 
-    if not volume_object:
+    if status is None:
         raise NonRecoverableError(
             'EBS volume {0} not found in account.'.format(volume_id))
-
-    if constants.VOLUME_CREATING in volume_object.update():
+    elif status == constants.VOLUME_CREATING:
         return ctx.operation.retry(
             message='Waiting for volume to be ready. '
                     'Volume in state {0}'
-                    .format(volume_object.status))
-    elif constants.VOLUME_AVAILABLE not in volume_object.update():
+                    .format(status))
+    elif status != constants.VOLUME_AVAILABLE:
         raise NonRecoverableError(
             'Cannot attach Volume {0} because it is in state {1}.'
-            .format(volume_object.id, volume_object.status))
+            .format(volume_id, status))
 
     ctx.logger.debug(
         'Attempting to attach volume {0} to instance {1}.'
         .format(volume_id, instance_id))
 
+    ec2_client = connection.EC2ConnectionClient().client()
+
     try:
-        volume_object.attach(
-            instance_id,
+        ec2_client.attach_volume(
+            volume_id, instance_id,
             ctx.source.node.properties['device'])
     except (boto.exception.EC2ResponseError,
             boto.exception.BotoServerError) as e:
@@ -174,9 +191,10 @@ def attach(**_):
 
 
 @operation
-def detach(args, **_):
+@metrics.summarize_api_calls
+def detach(args, wait_timeout=constants.WAITER_TIMEOUT, **_):
     """ Detaches an EBS Volume created by Cloudify from an EC2 Instance
-    that was also created by Cloudify.
+    that was also created by Cloudify, and waits until it is available.
     """
 
     volume_id = \
@@ -189,34 +207,28 @@ def detach(args, **_):
     if _detach_external_volume_or_instance():
         return
 
-    ctx.logger.debug('Detaching EBS volume {0}'.format(volume_id))
-
-    volume_object = _get_volumes_from_id(volume_id)
+    # instance_id is unassigned once the volume is detaching,
+    # so that retries only wait for it to become available.
+    if 'instance_id' in ctx.source.instance.runtime_properties:
+        _detach_volume(volume_id, instance_id, args)
 
-    if not volume_object:
-        raise NonRecoverableError(
-            'EBS volume {0} not found in account.'.format(volume_id))
-
-    try:
-        detached = volume_object.detach(**args)
-    except (boto.exception.EC2ResponseError,
-            boto.exception.BotoServerError) as e:
-        raise NonRecoverableError('{0}'.format(str(e)))
+    status = _wait_for_volume_status(
+        volume_id, lambda status: status != constants.VOLUME_IN_USE,
+        wait_timeout)
 
-    if not detached:
-        raise NonRecoverableError(
-            'Failed to detach volume {0} from instance {1}'
-            .format(volume_id, instance_id))
+    if status == constants.VOLUME_IN_USE:
+        return ctx.operation.retry(
+            message='Waiting for volume {0} to be detached.'
+                    .format(volume_id))
 
-    utils.unassign_runtime_property_from_resource(
-        'instance_id', ctx.source.instance)
     ctx.logger.info(
         'Detached volume {0} from instance {1}.'
         .format(volume_id, instance_id))
 
 
 @operation
-def create_snapshot(args, **_):
+@metrics.summarize_api_calls
+def create_snapshot(args, wait_timeout=0, retention=0, **_):
     """ Create a snapshot of an EBS Volume
     """
 
@@ -230,10 +242,96 @@ def create_snapshot(args, **_):
 
     volume_object = _get_volumes_from_id(volume_id)
 
+    if not volume_object:
+        raise NonRecoverableError(
+            'EBS volume {0} does not exist.'.format(volume_id))
+
+    _create_snapshots([volume_object], args, wait_timeout, retention)
+
+
+@operation
+@metrics.summarize_api_calls
+def create_instance_snapshots(args=None, wait_timeout=0, retention=0, **_):
+    """ Create snapshots of all of the EBS Volumes attached to an instance
+    """
+
+    instance_id = \
+        utils.get_external_resource_id_or_raise(
+            'create snapshots', ctx.instance)
+
+    ec2_client = connection.EC2ConnectionClient().client()
+
+    try:
+        volumes = ec2_client.get_all_volumes(
+            filters={'attachment.instance-id': instance_id})
+    except (boto.exception.EC2ResponseError,
+            boto.exception.BotoServerError) as e:
+        raise NonRecoverableError('{0}'.format(str(e)))
+
+    if not volumes:
+        ctx.logger.info(
+            'No EBS volumes are attached to instance {0}.'
+            .format(instance_id))
+        return
+
+    ctx.logger.info(
+        'Trying to create snapshots of EBS volumes {0} of instance {1}.'
+        .format([volume.id for volume in volumes], instance_id))
+
+    _create_snapshots(volumes, args, wait_timeout, retention)
+
+
+def _create_snapshots(volumes, args, wait_timeout, retention):
+    """Creates a snapshot of each volume on a bounded pool of workers,
+    and appends their IDs to the snapshots_ids runtime property.
+
+    :param volumes: A list of boto volume objects.
+    :param args: The arguments of each create_snapshot call.
+    :param wait_timeout: How many seconds to wait for the snapshots
+        to complete. 0 does not wait.
+    :param retention: How many snapshot IDs to keep per volume.
+        The snapshots of older IDs are deleted. 0 keeps all of them.
+    :raises NonRecoverableError: If a snapshot is not created, or fails.
+    """
+
+    start = time.time()
+    results = workers.run_concurrently(
+        lambda volume: _create_snapshot(volume, args), volumes)
+
+    snapshots = [(volume.id, snapshot.id)
+                 for volume, (snapshot, _) in zip(volumes, results)
+                 if snapshot]
+    snapshot_ids = [snapshot_id for _, snapshot_id in snapshots]
+    _record_snapshots(snapshots, retention)
+
+    errors = [error for _, error in results if error]
+    if errors:
+        raise NonRecoverableError(
+            '{0} of {1} snapshots not created: {2}'
+            .format(len(errors), len(volumes), str(errors[0])))
+
+    size = sum(volume.size for volume in volumes)
+    if not wait_timeout:
+        ctx.logger.info(
+            'Started {0} snapshots of {1} GiB in {2:.1f} seconds.'
+            .format(len(snapshot_ids), size, time.time() - start))
+        return
+
+    completed = _wait_for_snapshots(snapshot_ids, wait_timeout)
+    elapsed = time.time() - start
+    ctx.logger.info(
+        '{0} of {1} snapshots of {2} GiB completed in {3:.1f} seconds '
+        '({4:.2f} GiB/s).'.format(
+            len(completed), len(snapshot_ids), size, elapsed,
+            size / elapsed if len(completed) == len(snapshot_ids) and elapsed
+            else 0))
+
+
+def _create_snapshot(volume_object, args):
+
     if not args:
         snapshot_desc = \
-            unicode(datetime.datetime.now()) + \
-            ctx.instance.runtime_properties[constants.EXTERNAL_RESOURCE_ID]
+            unicode(datetime.datetime.now()) + volume_object.id
         args = dict(description=snapshot_desc)
 
     try:
@@ -242,42 +340,174 @@ def create_snapshot(args, **_):
             boto.exception.BotoServerError) as e:
         raise NonRecoverableError('{0}'.format(str(e)))
 
-    ctx.logger.info(
-        'Created snapshot of EBS volume {0}.'.format(volume_id))
+    ctx.logger.debug(
+        'Created snapshot {0} of EBS volume {1}.'
+        .format(new_snapshot.id, volume_object.id))
 
-    if constants.VOLUME_SNAPSHOT_ATTRIBUTE not in \
-            ctx.instance.runtime_properties:
-        ctx.instance.runtime_properties[
-            constants.VOLUME_SNAPSHOT_ATTRIBUTE] = list()
+    return new_snapshot
+
+
+def _record_snapshots(snapshots, retention):
+    """Appends snapshot IDs to the snapshots_ids runtime property, and
+    to the snapshot IDs of their volume, in one update. Prunes the
+    oldest IDs of each volume beyond retention, but never the IDs
+    created by this call.
+
+    :param snapshots: A list of the (volume_id, snapshot_id) created.
+    """
+
+    created = [snapshot_id for _, snapshot_id in snapshots]
+    snapshots_ids = ctx.instance.runtime_properties.get(
+        constants.VOLUME_SNAPSHOT_ATTRIBUTE, []) + created
+    volume_snapshots = dict(
+        (volume_id, list(volume_snapshot_ids))
+        for volume_id, volume_snapshot_ids in
+        ctx.instance.runtime_properties.get(
+            constants.VOLUME_SNAPSHOTS_BY_VOLUME_ATTRIBUTE, {}).items())
+
+    for volume_id, snapshot_id in snapshots:
+        volume_snapshots.setdefault(volume_id, []).append(snapshot_id)
+
+    pruned = []
+    if retention:
+        for volume_snapshot_ids in volume_snapshots.values():
+            pruned.extend(snapshot_id for snapshot_id in
+                          volume_snapshot_ids[:-retention]
+                          if snapshot_id not in created)
+
+    if pruned:
+        deleted = set(pruned) - set(_delete_snapshots(pruned))
+        snapshots_ids = [snapshot_id for snapshot_id in snapshots_ids
+                         if snapshot_id not in deleted]
+        volume_snapshots = dict(
+            (volume_id, [snapshot_id for snapshot_id in volume_snapshot_ids
+                         if snapshot_id not in deleted])
+            for volume_id, volume_snapshot_ids in volume_snapshots.items())
 
     ctx.instance.runtime_properties[
-        constants.VOLUME_SNAPSHOT_ATTRIBUTE].append(new_snapshot.id)
+        constants.VOLUME_SNAPSHOT_ATTRIBUTE] = snapshots_ids
+    ctx.instance.runtime_properties[
+        constants.VOLUME_SNAPSHOTS_BY_VOLUME_ATTRIBUTE] = volume_snapshots
+
+
+def _delete_snapshots(snapshot_ids):
+    """Deletes snapshots on a bounded pool of workers.
+
+    :returns the IDs of the snapshots that were not deleted.
+    """
+
+    ec2_client = connection.EC2ConnectionClient().client()
+
+    def delete(snapshot_id):
+        try:
+            ec2_client.delete_snapshot(snapshot_id)
+        except boto.exception.EC2ResponseError as e:
+            if 'InvalidSnapshot.NotFound' not in str(e):
+                raise
+
+    results = workers.run_concurrently(delete, snapshot_ids)
+    remaining = []
+    for snapshot_id, (_, error) in zip(snapshot_ids, results):
+        if error:
+            ctx.logger.warning(
+                'Snapshot {0} not deleted: {1}'.format(snapshot_id, error))
+            remaining.append(snapshot_id)
+
+    ctx.logger.info('Pruned {0} snapshots.'.format(
+        len(snapshot_ids) - len(remaining)))
+
+    return remaining
+
 
+def _wait_for_snapshots(snapshot_ids, timeout):
+    """Polls the snapshots that are not completed yet, with one
+    DescribeSnapshots call per poll, until they complete or the
+    timeout is exhausted.
 
-def _delete_volume(volume_id):
+    :returns the IDs of the completed snapshots.
+    :raises NonRecoverableError: If Boto errors, or a snapshot fails.
     """
 
+    ec2_client = connection.EC2ConnectionClient().client()
+    completed = set()
+
+    def all_completed():
+        pending = [snapshot_id for snapshot_id in snapshot_ids
+                   if snapshot_id not in completed]
+        try:
+            snapshots = ec2_client.get_all_snapshots(snapshot_ids=pending)
+        except (boto.exception.EC2ResponseError,
+                boto.exception.BotoServerError) as e:
+            raise NonRecoverableError('{0}'.format(str(e)))
+
+        failed = [snapshot.id for snapshot in snapshots
+                  if snapshot.status == constants.SNAPSHOT_ERROR]
+        if failed:
+            raise NonRecoverableError(
+                'Snapshots {0} failed.'.format(failed))
+
+        completed.update(snapshot.id for snapshot in snapshots
+                         if snapshot.status == constants.SNAPSHOT_COMPLETED)
+        return len(completed) == len(snapshot_ids)
+
+    utils.wait_for(all_completed, timeout=timeout)
+
+    return [snapshot_id for snapshot_id in snapshot_ids
+            if snapshot_id in completed]
+
+
+def _detach_volume(volume_id, instance_id, args):
+
+    ctx.logger.debug('Detaching EBS volume {0}'.format(volume_id))
+
+    volume_object = _get_volumes_from_id(volume_id)
+
+    if not volume_object:
+        raise NonRecoverableError(
+            'EBS volume {0} not found in account.'.format(volume_id))
+
+    try:
+        detached = volume_object.detach(**args)
+    except (boto.exception.EC2ResponseError,
+            boto.exception.BotoServerError) as e:
+        raise NonRecoverableError('{0}'.format(str(e)))
+
+    if not detached:
+        raise NonRecoverableError(
+            'Failed to detach volume {0} from instance {1}'
+            .format(volume_id, instance_id))
+
+    utils.unassign_runtime_property_from_resource(
+        'instance_id', ctx.source.instance)
+
+
+def _delete_volume(volume_id, wait_timeout):
+    """Waits until the volume is available, and deletes it.
+
     :param volume_id:
+    :param wait_timeout: How many seconds to wait for the volume.
     :return: True if the item is deleted,
     False if the item cannot be deleted yet.
     """
 
-    volume_to_delete = _get_volumes_from_id(volume_id)
+    status = _wait_for_volume_status(
+        volume_id,
+        lambda status: status in (None, constants.VOLUME_AVAILABLE),
+        wait_timeout)
 
-    if not volume_to_delete:
+    if status is None:
         ctx.logger.info(
             'Volume id {0} does\'t exist.'
             .format(volume_id))
         return True
 
-    if volume_to_delete.status not in \
-            constants.VOLUME_AVAILABLE or \
-            volume_to_delete.status in \
-            constants.VOLUME_IN_USE:
+    if status != constants.VOLUME_AVAILABLE:
         return False
 
+    ec2_client = connection.EC2ConnectionClient().client()
+
     try:
-        output = volume_to_delete.delete()
+        output = ec2_client.delete_volume(volume_id)
     except (boto.exception.EC2ResponseError,
             boto.exception.BotoServerError) as e:
         raise NonRecoverableError('{0}'.format(str(e)))
@@ -285,6 +515,52 @@ def _delete_volume(volume_id):
     return output
 
 
+def _wait_for_volume_status(volume_id, condition, wait_timeout):
+    """Waits until the status of a volume meets condition. The status
+    is polled together with the volumes that the other operations
+    of the deployment wait for.
+
+    :returns the last status of the volume, or None if it does not exist.
+    """
+
+    volume_tracker = tracker.get_state_tracker(
+        'volumes', _describe_volume_statuses)
+
+    return volume_tracker.wait_for(
+        [volume_id], lambda statuses: condition(statuses[volume_id]),
+        wait_timeout)[volume_id]
+
+
+def _describe_volume_statuses(volume_ids):
+    """Returns the statuses of the volumes that exist, with one
+    DescribeVolumes call. Volumes that AWS reports as missing are
+    dropped, and the others are described again.
+
+    :param volume_ids: A list of EBS volume IDs.
+    :returns A dict of volume ID to status.
+    :raises NonRecoverableError: If Boto errors.
+    """
+
+    ec2_client = connection.EC2ConnectionClient().client()
+
+    while volume_ids:
+        try:
+            volumes = ec2_client.get_all_volumes(volume_ids=volume_ids)
+        except boto.exception.EC2ResponseError as e:
+            missing = set(re.findall(r'vol-[0-9a-z]+', str(e))) \
+                if 'InvalidVolume.NotFound' in str(e) else set()
+            if not missing.intersection(volume_ids):
+                raise NonRecoverableError('{0}'.format(str(e)))
+            volume_ids = [volume_id for volume_id in volume_ids
+                          if volume_id not in missing]
+        except boto.exception.BotoServerError as e:
+            raise NonRecoverableError('{0}'.format(str(e)))
+        else:
+            return dict((volume.id, volume.status) for volume in volumes)
+
+    return {}
+
+
 def _create_external_volume():
     """If use_external_resource is True, this will set the runtime_properties,
     and then exit.
@@ -399,8 +675,8 @@ def _get_volumes(list_of_volume_ids):
             volume_ids=list_of_volume_ids)
     except boto.exception.EC2ResponseError as e:
         if 'InvalidVolume.NotFound' in e:
-            all_volumes = ec2_client.get_all_volumes()
-            utils.log_available_resources(all_volumes)
+            utils.log_available_resources(
+                base.iter_resources(ec2_client.get_all_volumes))
         return None
     except boto.exception.BotoServerError as e:
         raise NonRecoverableError('{0}'.format(str(e)))
@@ -20,20 +20,27 @@ import boto.exception
 from ec2 import utils
 from ec2 import constants
 from ec2 import connection
+from core import base
+from core import metrics
+from core import preflight
 from cloudify import ctx
 from cloudify.exceptions import NonRecoverableError
 from cloudify.decorators import operation
 
 
 @operation
+@metrics.summarize_api_calls
 def creation_validation(**_):
     """ This checks that all user supplied info is valid """
 
     if not ctx.node.properties['resource_id']:
         address = None
     else:
-        address = _get_address_by_id(
+        address = preflight.get_preflight().exists(
             ctx.node.properties['resource_id'])
+        if address is None:
+            address = _get_address_by_id(
+                ctx.node.properties['resource_id'])
 
     if ctx.node.properties['use_external_resource'] and not address:
         raise NonRecoverableError(
@@ -47,6 +54,7 @@ def creation_validation(**_):
 
 
 @operation
+@metrics.summarize_api_calls
 def allocate(**_):
     """This allocates an Elastic IP in the connected account."""
 
@@ -81,7 +89,8 @@ def allocate(**_):
 
 
 @operation
-def release(**_):
+@metrics.summarize_api_calls
+def release(wait_timeout=constants.WAITER_TIMEOUT, **_):
     """This releases an Elastic IP created by Cloudify
     in the connected account.
     """
@@ -112,9 +121,11 @@ def release(**_):
             'Elastic IP {0} deletion failed for an unknown reason.'
             .format(address_object.public_ip))
 
-    address = _get_address_object_by_id(address_object.public_ip)
+    released = utils.wait_for(
+        lambda: not _get_address_object_by_id(address_object.public_ip),
+        wait_timeout)
 
-    if not address:
+    if released:
         for runtime_property in \
                 [constants.ALLOCATION_ID,
                  constants.EXTERNAL_RESOURCE_ID]:
@@ -126,6 +137,7 @@ def release(**_):
 
 
 @operation
+@metrics.summarize_api_calls
 def associate(**_):
     """ Associates an Elastic IP created by Cloudify with an EC2 Instance
     that was also created by Cloudify.
@@ -173,6 +185,7 @@ def associate(**_):
 
 
 @operation
+@metrics.summarize_api_calls
 def disassociate(**_):
     """ Disassocates an Elastic IP created by Cloudify from an EC2 Instance
     that was also created by Cloudify.
@@ -345,8 +358,8 @@ def _get_all_addresses(address=None):
         addresses = ec2_client.get_all_addresses(address)
     except boto.exception.EC2ResponseError as e:
         if 'InvalidAddress.NotFound' in e:
-            addresses = ec2_client.get_all_addresses()
-            utils.log_available_resources(addresses)
+            utils.log_available_resources(
+                base.iter_resources(ec2_client.get_all_addresses))
         return None
     except boto.exception.BotoServerError as e:
         raise NonRecoverableError('{0}'.format(str(e)))
@@ -13,6 +13,10 @@
 #    * See the License for the specific language governing permissions and
 #    * limitations under the License.
 
+# Built-in Imports
+import time
+import logging
+
 # Third-party Imports
 from boto.ec2.elb.healthcheck import HealthCheck
 import boto.exception
@@ -20,6 +24,9 @@ import boto.exception
 # Cloudify imports
 from ec2 import constants
 from ec2 import connection
+from core import cache
+from core import spool
+from core import metrics
 from ec2 import utils
 from cloudify import ctx
 from cloudify.decorators import operation
@@ -28,6 +35,7 @@ from cloudify.exceptions import RecoverableError
 
 
 @operation
+@metrics.summarize_api_calls
 def creation_validation(**_):
     """ This checks that all user supplied info is valid """
 
@@ -52,6 +60,7 @@ def creation_validation(**_):
 
 
 @operation
+@metrics.summarize_api_calls
 def create_elb(**_):
 
     if ctx.node.properties['use_external_resource']:
@@ -81,7 +90,8 @@ def _remove_instance_from_elb_list_in_properties(instance_id):
 
 
 @operation
-def remove_instance_from_elb(**_):
+@metrics.summarize_api_calls
+def remove_instance_from_elb(registration_window=0, **_):
 
     elb_name = \
         utils.get_external_resource_id_or_raise(
@@ -91,6 +101,18 @@ def remove_instance_from_elb(**_):
         utils.get_external_resource_id_or_raise(
             'instance_id', ctx.source.instance)
 
+    if registration_window:
+        result = _register_in_batch(
+            'deregister', elb_name, instance_id, registration_window)
+        if result is None:
+            return ctx.operation.retry(
+                message='Waiting for a batched call to remove instance '
+                '{0} from Load Balancer {1}.'.format(instance_id, elb_name))
+        if result[0]:
+            raise RecoverableError('Instance not removed from Load Balancer '
+                                   '{0}'.format(result[0]))
+        return
+
     instance_list = [instance_id]
     lb = _get_existing_elb(elb_name)
 
@@ -113,7 +135,8 @@ def remove_instance_from_elb(**_):
 
 
 @operation
-def add_instance_to_elb(**_):
+@metrics.summarize_api_calls
+def add_instance_to_elb(registration_window=0, **_):
 
     elb_name = \
         utils.get_external_resource_id_or_raise(
@@ -123,6 +146,18 @@ def add_instance_to_elb(**_):
         utils.get_external_resource_id_or_raise(
             'instance_id', ctx.source.instance)
 
+    if registration_window:
+        result = _register_in_batch(
+            'register', elb_name, instance_id, registration_window)
+        if result is None:
+            return ctx.operation.retry(
+                message='Waiting for a batched call to add instance '
+                '{0} to Load Balancer {1}.'.format(instance_id, elb_name))
+        if result[0]:
+            raise NonRecoverableError('Instance not added to Load Balancer '
+                                      '{0}'.format(result[0]))
+        return
+
     ctx.logger.info('Attemping to remove instance: {0} from elb {1}'
                     .format(instance_id, elb_name))
 
@@ -143,6 +178,80 @@ def add_instance_to_elb(**_):
     _add_instance_to_elb_list_in_properties(instance_id)
 
 
+def _register_in_batch(action, elb_name, instance_id, registration_window):
+    """Registers an instance with a load balancer, or deregisters it,
+    in one call with the instances that other node instances register
+    or deregister at the same time. The leader of the batch reconciles
+    the instance_list runtime property of the load balancer with the
+    instances that the load balancer reports after the calls.
+
+    :param action: 'register' or 'deregister'.
+    :param registration_window: How many seconds the leader waits for
+        other node instances to join the batch.
+    :returns an (error,) tuple, where error is the message of the
+        failed call or None, or None if the batch is not done yet.
+    """
+
+    registration_spool = spool.get_registration_spool(elb_name)
+    request = (action, instance_id)
+
+    if registration_spool.submit(request):
+        time.sleep(registration_window)
+        try:
+            _call_batches(elb_name, registration_spool)
+        finally:
+            registration_spool.release()
+
+    return utils.wait_for(lambda: registration_spool.result(request))
+
+
+def _call_batches(elb_name, registration_spool):
+
+    batches = registration_spool.take()
+    lb = _get_existing_elb(elb_name)
+
+    for action, instance_ids in batches.items():
+        if lb is None:
+            registration_spool.complete(
+                action, instance_ids,
+                'Load Balancer {0} does not exist.'.format(elb_name))
+            continue
+        error = _call_batch(lb, action, instance_ids)
+        ctx.logger.info(
+            'Called {0}_instances on Load Balancer {1} for {2} instances: '
+            '{3}'.format(action, elb_name, len(instance_ids),
+                         error or 'succeeded'))
+        if error and len(instance_ids) > 1:
+            # One invalid instance fails the whole call, so that the
+            # others do not get its error, they are called one by one.
+            for instance_id in instance_ids:
+                registration_spool.complete(
+                    action, [instance_id],
+                    _call_batch(lb, action, [instance_id]))
+        else:
+            registration_spool.complete(action, instance_ids, error)
+
+    if lb is not None:
+        ctx.target.instance.runtime_properties['instance_list'] = \
+            [instance.id for instance in lb.instances or []]
+
+
+def _call_batch(lb, action, instance_ids):
+    """Registers or deregisters instances with one call.
+
+    :returns the error message of the call, or None.
+    """
+
+    try:
+        getattr(lb, '{0}_instances'.format(action))(instance_ids)
+    except (boto.exception.EC2ResponseError,
+            boto.exception.BotoServerError,
+            boto.exception.BotoClientError) as e:
+        return str(e)
+
+    return None
+
+
 def _add_health_check_to_elb(elb, health_check):
 
     hc = _create_health_check(health_check)
@@ -166,6 +275,7 @@ def use_external_elb(**_):
 
 
 @operation
+@metrics.summarize_api_calls
 def delete_elb(**_):
 
     if ctx.node.properties['use_external_resource']:
@@ -190,6 +300,7 @@ def delete_elb(**_):
     ctx.logger.info(
         'Load Balancer {0} deleted. '
         .format(elb_name))
+    cache.get_operation_cache('elbs').pop(elb_name, None)
     if 'elb_name' in ctx.instance.runtime_properties:
         ctx.instance.runtime_properties.pop('elb_name')
 
@@ -264,6 +375,9 @@ def _get_instance_list():
     ctx.logger.info('Attempting to get Load Balancer Instance List.')
 
     elb_name = ctx.node.properties['elb_name']
+    # The cached load balancer holds the instances from before the
+    # calls of this operation.
+    cache.get_operation_cache('elbs').pop(elb_name, None)
     lb = _get_existing_elb(elb_name)
     list_of_instances = lb.instances
     ctx.instance.runtime_properties[constants.EXTERNAL_RESOURCE_ID] = lb.name
@@ -272,26 +386,55 @@ def _get_instance_list():
 
 
 def _get_elbs_by_names(list_of_names):
+    """Returns the load balancers with the given names. Load balancers
+    are described by name only, and cached until the end of the operation.
+
+    :param list_of_names: A list of load balancer names.
+    :returns A list of boto load balancer objects.
+    :raises NonRecoverableError: If Boto errors, or a load balancer
+        does not exist.
+    """
+
+    elbs = cache.get_operation_cache('elbs')
+    missing = [name for name in list_of_names if name not in elbs]
+
+    if missing:
+        ctx.logger.debug(
+            'Attempting to get Load Balancers {0}.'.format(missing))
+        elb_client = connection.ELBConnectionClient().client()
+
+        try:
+            elbs.update((elb.name, elb) for elb in
+                        elb_client.get_all_load_balancers(
+                            load_balancer_names=missing))
+        except (boto.exception.EC2ResponseError,
+                boto.exception.BotoServerError,
+                boto.exception.BotoClientError) as e:
+            if getattr(e, 'error_code', None) == 'LoadBalancerNotFound':
+                ctx.logger.info('Unable to find load balancers matching: '
+                                '{0}'.format(missing))
+                _log_available_elbs(elb_client)
+            raise NonRecoverableError('Error when accessing ELB interface '
+                                      '{0}'.format(str(e)))
 
-    ctx.logger.info(
-        'Attempting to get Load Balancers {0}.'.format(list_of_names))
-    elb_client = connection.ELBConnectionClient().client()
+    return [elbs[name] for name in list_of_names if name in elbs]
+
+
+def _log_available_elbs(elb_client):
+    """Lists the load balancers of the region at debug level only,
+    because the listing can be large.
+    """
+
+    if not ctx.logger.isEnabledFor(logging.DEBUG):
+        return
 
     try:
-        total_elb_list = elb_client.get_all_load_balancers()
-        elb_list = elb_client.get_all_load_balancers(
-            load_balancer_names=list_of_names)
+        ctx.logger.debug('load balancers available: {0}'.format(
+            elb_client.get_all_load_balancers()))
     except (boto.exception.EC2ResponseError,
             boto.exception.BotoServerError,
-            boto.exception.BotoClientError) as e:
-        if 'LoadBalancerNotFound' in e:
-            ctx.logger.info('Unable to find load balancers matching: '
-                            '{0}'.format(list_of_names))
-            ctx.logger.info('load balancers available: '
-                            '{0}'.format(total_elb_list))
-        raise NonRecoverableError('Error when accessing ELB interface '
-                                  '{0}'.format(str(e)))
-    return elb_list
+            boto.exception.BotoClientError):
+        pass
 
 
 def _get_existing_elb(elb_name):
@@ -14,14 +14,23 @@
 #    * limitations under the License.
 
 import os
+import time
 
 # Third-party Imports
 import boto.exception
+from boto.ec2.blockdevicemapping import BlockDeviceMapping
+from boto.ec2.blockdevicemapping import BlockDeviceType
 
 # Cloudify imports
 from ec2 import utils
 from ec2 import constants
 from ec2 import connection
+from core import base
+from core import claims
+from core import images
+from core import pool
+from core import preflight
+from core import metrics
 from cloudify import ctx
 from cloudify import compute
 from cloudify.exceptions import NonRecoverableError
@@ -31,13 +40,18 @@ from ec2.keypair import KEYPAIR_AWS_TYPE
 
 
 @operation
+@metrics.summarize_api_calls
 def creation_validation(**_):
     """ This checks that all user supplied info is valid """
 
     for property_key in constants.INSTANCE_REQUIRED_PROPERTIES:
         utils.validate_node_property(property_key, ctx.node.properties)
 
-    instance = _get_instance_from_id(utils.get_resource_id())
+    resource_id = utils.get_resource_id()
+    checks = preflight.get_preflight()
+    instance = checks.exists(resource_id)
+    if instance is None:
+        instance = _get_instance_from_id(resource_id)
 
     if ctx.node.properties['use_external_resource'] and not instance:
         raise NonRecoverableError(
@@ -50,15 +64,19 @@ def creation_validation(**_):
             'but the instance already exists.')
 
     image_id = ctx.node.properties['image_id']
-    image_object = _get_image(image_id)
+    image_state = checks.image_state(image_id)
+    if image_state is None:
+        image_state = _get_image(image_id).state
 
-    if 'available' not in image_object.state:
+    if 'available' not in image_state:
         raise NonRecoverableError(
             'image_id {0} not available to this account.'.format(image_id))
 
 
 @operation
-def run_instances(**_):
+@metrics.summarize_api_calls
+def run_instances(bulk_size=1, bulk_window=constants.BULK_WINDOW,
+                  warm_pool_size=0, **_):
     ec2_client = connection.EC2ConnectionClient().client()
 
     for property_name in constants.INSTANCE_REQUIRED_PROPERTIES:
@@ -73,7 +91,19 @@ def run_instances(**_):
         'Attempting to create EC2 Instance with these API parameters: {0}.'
         .format(instance_parameters))
 
-    instance_id = _run_instances_if_needed(ec2_client, instance_parameters)
+    if warm_pool_size > 0:
+        instance_id = _run_instances_from_warm_pool(
+            ec2_client, instance_parameters, warm_pool_size)
+    elif bulk_size > 1:
+        instance_id = _run_instances_in_bulk(
+            ec2_client, instance_parameters, bulk_size, bulk_window)
+        if instance_id is None:
+            return ctx.operation.retry(
+                message='Waiting for a bulk RunInstances call to launch '
+                'the instance of {0}.'.format(ctx.instance.id))
+    else:
+        instance_id = \
+            _run_instances_if_needed(ec2_client, instance_parameters)
 
     instance = _get_instance_from_id(instance_id)
 
@@ -84,10 +114,11 @@ def run_instances(**_):
 
     utils.set_external_resource_id(
         instance_id, ctx.instance, external=False)
-    _instance_created_assign_runtime_properties()
+    _instance_created_assign_runtime_properties(instance)
 
 
 @operation
+@metrics.summarize_api_calls
 def modify_instance_attributes(new_attributes, **_):
     _modify_instance_attributes(new_attributes)
 
@@ -112,7 +143,9 @@ def _modify_instance_attributes(new_attributes):
 
 
 @operation
-def start(start_retry_interval=30, private_key_path=None, **_):
+@metrics.summarize_api_calls
+def start(start_retry_interval=30, private_key_path=None,
+          wait_timeout=constants.WAITER_TIMEOUT, **_):
     ec2_client = connection.EC2ConnectionClient().client()
 
     instance_id = \
@@ -122,7 +155,9 @@ def start(start_retry_interval=30, private_key_path=None, **_):
     if _start_external_instance(instance_id):
         return
 
-    if _get_instance_state() == constants.INSTANCE_STATE_STARTED:
+    instance = _get_instance_object()
+
+    if instance.state_code == constants.INSTANCE_STATE_STARTED:
         if ctx.node.properties['use_password']:
             password_success = _retrieve_windows_pass(
                 ec2_client=ec2_client,
@@ -133,7 +168,7 @@ def start(start_retry_interval=30, private_key_path=None, **_):
                     message='Waiting for server to post generated password',
                     retry_after=start_retry_interval)
 
-        _instance_started_assign_runtime_properties_and_tag(instance_id)
+        _instance_started_assign_runtime_properties_and_tag(instance)
         return
 
     ctx.logger.debug('Attempting to start instance: {0}.)'.format(instance_id))
@@ -146,7 +181,8 @@ def start(start_retry_interval=30, private_key_path=None, **_):
 
     ctx.logger.debug('Attempted to start instance {0}.'.format(instance_id))
 
-    if _get_instance_state() == constants.INSTANCE_STATE_STARTED:
+    if _wait_for_instance_state(
+            instance, constants.INSTANCE_STATE_STARTED, wait_timeout):
         if ctx.node.properties['use_password']:
             password_success = _retrieve_windows_pass(
                 ec2_client=ec2_client,
@@ -156,7 +192,7 @@ def start(start_retry_interval=30, private_key_path=None, **_):
                 return ctx.operation.retry(
                     message='Waiting for server to post generated password',
                     retry_after=start_retry_interval)
-        _instance_started_assign_runtime_properties_and_tag(instance_id)
+        _instance_started_assign_runtime_properties_and_tag(instance)
     else:
         return ctx.operation.retry(
             message='Waiting server to be running. Retrying...',
@@ -164,7 +200,8 @@ def start(start_retry_interval=30, private_key_path=None, **_):
 
 
 @operation
-def stop(**_):
+@metrics.summarize_api_calls
+def stop(wait_timeout=constants.WAITER_TIMEOUT, **_):
     ec2_client = connection.EC2ConnectionClient().client()
 
     instance_id = \
@@ -185,7 +222,9 @@ def stop(**_):
 
     ctx.logger.debug('Attempted to stop instance {0}.'.format(instance_id))
 
-    if _get_instance_state() == constants.INSTANCE_STATE_STOPPED:
+    if _wait_for_instance_state(
+            _get_instance_object(), constants.INSTANCE_STATE_STOPPED,
+            wait_timeout):
         _unassign_runtime_properties(
             runtime_properties=constants.INSTANCE_INTERNAL_ATTRIBUTES,
             ctx_instance=ctx.instance)
@@ -196,7 +235,8 @@ def stop(**_):
 
 
 @operation
-def terminate(**_):
+@metrics.summarize_api_calls
+def terminate(wait_timeout=constants.WAITER_TIMEOUT, **_):
     ec2_client = connection.EC2ConnectionClient().client()
 
     instance_id = \
@@ -218,9 +258,12 @@ def terminate(**_):
     ctx.logger.debug(
         'Attemped to terminate instance {0}'.format(instance_id))
 
-    if _get_instance_state() == \
-            constants.INSTANCE_STATE_TERMINATED:
+    if _wait_for_instance_state(
+            _get_instance_object(), constants.INSTANCE_STATE_TERMINATED,
+            wait_timeout):
         ctx.logger.info('Terminated instance: {0}.'.format(instance_id))
+        claims.get_claim_table().release(ctx.instance.id)
+        _release_warm_pool_member(ec2_client)
         utils.unassign_runtime_property_from_resource(
             constants.EXTERNAL_RESOURCE_ID, ctx.instance)
     else:
@@ -228,33 +271,44 @@ def terminate(**_):
             message='Waiting server to terminate. Retrying...')
 
 
-def _assign_runtime_properties_to_instance(runtime_properties):
+def _assign_runtime_properties_to_instance(runtime_properties,
+                                           instance_object=None):
+    """Assigns instance attributes as runtime properties.
+
+    :param runtime_properties: The names of the runtime properties.
+    :param instance_object: The boto instance to read the attributes from.
+        If not provided, the instance is described once for all of them.
+    """
+
+    if not instance_object:
+        instance_object = _get_instance_object()
 
     for property_name in runtime_properties:
         if 'ip' is property_name:
             ctx.instance.runtime_properties[property_name] = \
-                _get_instance_attribute('private_ip_address')
+                instance_object.private_ip_address
         elif 'public_ip_address' is property_name:
             ctx.instance.runtime_properties[property_name] = \
-                _get_instance_attribute('ip_address')
+                instance_object.ip_address
         else:
             ctx.instance.runtime_properties[property_name] = \
-                _get_instance_attribute(property_name)
+                getattr(instance_object, property_name)
 
 
-def _instance_created_assign_runtime_properties():
+def _instance_created_assign_runtime_properties(instance_object=None):
     _assign_runtime_properties_to_instance(
-        runtime_properties=constants.INSTANCE_INTERNAL_ATTRIBUTES_POST_CREATE)
+        runtime_properties=constants.INSTANCE_INTERNAL_ATTRIBUTES_POST_CREATE,
+        instance_object=instance_object)
 
 
-def _instance_started_assign_runtime_properties_and_tag(instance_id):
+def _instance_started_assign_runtime_properties_and_tag(instance_object):
 
-    instance = _get_instance_from_id(instance_id)
-    utils.add_tag(instance)
+    utils.add_tag(instance_object)
 
     _assign_runtime_properties_to_instance(
-        runtime_properties=constants.INSTANCE_INTERNAL_ATTRIBUTES)
-    ctx.logger.info('Instance {0} is running.'.format(instance_id))
+        runtime_properties=constants.INSTANCE_INTERNAL_ATTRIBUTES,
+        instance_object=instance_object)
+    ctx.logger.info('Instance {0} is running.'.format(instance_object.id))
 
 
 def _retrieve_windows_pass(ec2_client,
@@ -333,7 +387,11 @@ def _run_instances_if_needed(ec2_client, instance_parameters):
 
     elif constants.EXTERNAL_RESOURCE_ID not in ctx.instance.runtime_properties:
 
-        instances = _get_instances_from_reservation_id(ec2_client)
+        # A bulk RunInstances call shares its reservation between the
+        # node instances that joined it.
+        claim = claims.get_claim_table().claimed(ctx.instance.id)
+        instances = _get_instances_from_reservation_id(
+            ec2_client, claim[1] if claim else None)
 
         if not instances:
             raise NonRecoverableError(
@@ -349,6 +407,133 @@ def _run_instances_if_needed(ec2_client, instance_parameters):
     return ctx.instance.runtime_properties[constants.EXTERNAL_RESOURCE_ID]
 
 
+def _run_instances_in_bulk(ec2_client, instance_parameters,
+                           bulk_size, bulk_window):
+    """Launches the instances of the node instances of this node that
+    are being created at the same time with a single RunInstances call,
+    and claims one of them for the current node instance.
+
+    :param bulk_size: The maximum number of instances per call.
+    :param bulk_window: How many seconds the leader waits for
+        other node instances to join the call.
+    :returns the claimed instance ID, or None if it is not launched yet.
+    """
+
+    if ctx.agent.init_script():
+        raise NonRecoverableError(
+            'Bulk provisioning is not supported with the init_script '
+            'agent install method, because its user data is specific '
+            'to each node instance.')
+
+    claim_table = claims.get_claim_table()
+    member = ctx.instance.id
+
+    # A claim left by a node instance with the same ID, e.g. before a
+    # heal, holds an instance that is no longer launched.
+    claim = claim_table.claimed(member)
+    if claim:
+        instance = _get_instance_from_id(claim[1])
+        if instance and instance.state not in \
+                constants.INSTANCE_LAUNCHED_STATES:
+            claim_table.release(member)
+
+    if not claim_table.join(member):
+        claim = utils.wait_for(lambda: claim_table.claimed(member))
+    else:
+        time.sleep(bulk_window)
+        client_token, members = claim_table.open_batch(member, bulk_size)
+        parameters = dict(instance_parameters, min_count=1,
+                          max_count=len(members), client_token=client_token)
+
+        ctx.logger.info(
+            'Launching {0} instances for node instances {1}.'
+            .format(len(members), members))
+
+        try:
+            reservation = ec2_client.run_instances(**parameters)
+        except (boto.exception.EC2ResponseError,
+                boto.exception.BotoServerError) as e:
+            claim_table.abandon_batch(client_token)
+            raise NonRecoverableError('{0}'.format(str(e)))
+
+        claim_table.close_batch(
+            client_token, reservation.id,
+            [instance_object.id for instance_object in reservation.instances])
+        claim = claim_table.claimed(member)
+
+    if claim is None:
+        return None
+
+    reservation_id, instance_id = claim
+    ctx.instance.runtime_properties['reservation_id'] = reservation_id
+
+    return instance_id
+
+
+def _run_instances_from_warm_pool(ec2_client, instance_parameters,
+                                  warm_pool_size):
+    """Claims a stopped instance of the warm pool of instances with the
+    same parameters for the current node instance, and replenishes the
+    pool. If the pool has no stopped instance, launches one.
+
+    :param warm_pool_size: The number of instances the pool should have.
+    :returns the claimed or launched instance ID.
+    """
+
+    if ctx.agent.init_script():
+        raise NonRecoverableError(
+            'Warm pools are not supported with the init_script '
+            'agent install method, because its user data is specific '
+            'to each node instance.')
+
+    for name in constants.WARM_POOL_UNSUPPORTED_PARAMETERS:
+        if instance_parameters.get(name):
+            raise NonRecoverableError(
+                'Warm pools are not supported with the {0} parameter, '
+                'because the instances of a pool cannot share it.'
+                .format(name))
+
+    warm_pool = pool.get_warm_pool(pool.get_signature(instance_parameters))
+    member = _get_warm_pool_member()
+    claim = warm_pool.claimed(member)
+
+    if claim is None and ctx.operation.retry_number == 0:
+        claim = warm_pool.claim(ec2_client, member)
+        ctx.instance.runtime_properties[constants.WARM_POOL_SIGNATURE] = \
+            warm_pool.signature
+        warm_pool.replenish(ec2_client, instance_parameters, warm_pool_size)
+
+    if claim is None:
+        return _run_instances_if_needed(ec2_client, instance_parameters)
+
+    reservation_id, instance_id = claim
+    ctx.instance.runtime_properties['reservation_id'] = reservation_id
+    ctx.logger.info(
+        'Claimed instance {0} of warm pool {1}.'.format(
+            instance_id, warm_pool.signature))
+
+    return instance_id
+
+
+def _release_warm_pool_member(ec2_client):
+    """Removes the current node instance from the warm pool it was
+    created from, if any. The last member terminates the instances
+    left in the pool.
+    """
+
+    signature = ctx.instance.runtime_properties.get(
+        constants.WARM_POOL_SIGNATURE)
+
+    if signature:
+        pool.get_warm_pool(signature).release(
+            ec2_client, _get_warm_pool_member())
+        del ctx.instance.runtime_properties[constants.WARM_POOL_SIGNATURE]
+
+
+def _get_warm_pool_member():
+    return '{0}-{1}'.format(ctx.deployment.id, ctx.instance.id)
+
+
 def _handle_userdata(parameters):
 
     existing_userdata = parameters.get('user_data')
@@ -370,7 +555,12 @@ def _handle_userdata(parameters):
     return parameters
 
 
-def _get_instances_from_reservation_id(ec2_client):
+def _get_instances_from_reservation_id(ec2_client, instance_id=None):
+    """Returns the instances of the reservation of this node instance.
+
+    :param instance_id: Only return the instance with this ID, for
+        reservations that are shared by several node instances.
+    """
 
     try:
         reservations = ec2_client.get_all_instances(
@@ -385,7 +575,8 @@ def _get_instances_from_reservation_id(ec2_client):
     if len(reservations) < 1:
         return None
 
-    return reservations[0].instances
+    return [instance_object for instance_object in reservations[0].instances
+            if instance_id in (None, instance_object.id)]
 
 
 def _create_external_instance():
@@ -411,7 +602,8 @@ def _start_external_instance(instance_id):
     ctx.logger.info(
         'Not starting instance {0}, because it is an external resource.'
         .format(instance_id))
-    _instance_started_assign_runtime_properties_and_tag(instance_id)
+    _instance_started_assign_runtime_properties_and_tag(
+        _get_instance_object())
     return True
 
 
@@ -455,9 +647,11 @@ def _get_all_instances(list_of_instance_ids=None):
         reservations = ec2_client.get_all_reservations(list_of_instance_ids)
     except boto.exception.EC2ResponseError as e:
         if 'InvalidInstanceID.NotFound' in e:
-            instances = [instance for res in ec2_client.get_all_reservations()
-                         for instance in res.instances]
-            utils.log_available_resources(instances)
+            utils.log_available_resources(
+                instance for reservation in base.iter_resources(
+                    ec2_client.get_all_reservations,
+                    max_results=constants.DESCRIBE_PAGE_SIZE)
+                for instance in reservation.instances)
         return None
     except boto.exception.BotoServerError as e:
         raise NonRecoverableError('{0}'.format(str(e)))
@@ -484,10 +678,10 @@ def _get_instance_from_id(instance_id):
 
 
 def _get_image(image_id):
-    """Gets the boto object that represents the AMI image for image id.
+    """Gets the metadata of the AMI image for image id from the image cache.
 
     :param image_id: The ID of the AMI image.
-    :returns an object that represents an AMI image.
+    :returns an images.Image that represents an AMI image.
     """
 
     ec2_client = connection.EC2ConnectionClient().client()
@@ -496,13 +690,33 @@ def _get_image(image_id):
         raise NonRecoverableError(
             'No image_id was provided.')
 
-    try:
-        image_object = ec2_client.get_image(image_id)
-    except (boto.exception.EC2ResponseError,
-            boto.exception.BotoServerError) as e:
-        raise NonRecoverableError('{0}.'.format(str(e)))
+    return images.get_image_cache().get(ec2_client, image_id)
+
+
+def _get_block_device_map(image_id, devices):
+    """Builds the block_device_map run_instances parameter from a
+    dictionary of device names to BlockDeviceType arguments, such as
+    size or volume_type. The devices that the AMI maps keep the AMI's
+    settings, such as its snapshot, unless they are overridden.
 
-    return image_object
+    :param image_id: The ID of the AMI image.
+    :param devices: The dictionary from the instance parameters.
+    :returns a BlockDeviceMapping.
+    """
+
+    image_devices = _get_image(image_id).block_device_mapping
+    block_device_map = BlockDeviceMapping()
+
+    for device, settings in devices.items():
+        try:
+            block_device_map[device] = BlockDeviceType(
+                **dict(image_devices.get(device, {}), **settings or {}))
+        except TypeError as e:
+            raise NonRecoverableError(
+                'Invalid block_device_map settings for {0}: {1}.'
+                .format(device, str(e)))
+
+    return block_device_map
 
 
 def _get_instance_attribute(attribute):
@@ -514,6 +728,21 @@ def _get_instance_attribute(attribute):
     :raises NonRecoverableError if no instance is found.
     """
 
+    return getattr(_get_instance_object(attribute), attribute)
+
+
+def _get_instance_object(attribute='object'):
+    """Gets the boto object that represents the EC2 Instance of this node,
+    with a single DescribeInstances call. The object serves all of the
+    instance attributes, the state code and the tags. Use
+    _refresh_instance_object when the state has to be polled again.
+
+    :param attribute: What the instance is needed for, for error messages.
+    :returns a boto object representing an EC2 instance.
+    :raises NonRecoverableError if constants.EXTERNAL_RESOURCE_ID not set
+    :raises NonRecoverableError if no instance is found.
+    """
+
     if constants.EXTERNAL_RESOURCE_ID not in ctx.instance.runtime_properties:
         raise NonRecoverableError(
             'Unable to get instance attibute {0}, because {1} is not set.'
@@ -526,25 +755,51 @@ def _get_instance_attribute(attribute):
     if not instance_object:
         if not ctx.node.properties['use_external_resource']:
             ec2_client = connection.EC2ConnectionClient().client()
-            instances = _get_instances_from_reservation_id(ec2_client)
+            instances = _get_instances_from_reservation_id(
+                ec2_client, instance_id)
             if not instances:
                 raise NonRecoverableError(
                     'Unable to get instance attibute {0}, because '
                     'no instance with id {1} exists in this account.'
                     .format(attribute, instance_id))
-            elif len(instances) != 1:
-                raise NonRecoverableError(
-                    'Unable to get instance attibute {0}, because more '
-                    'than one instance with id {1} exists in this account.'
-                    .format(attribute, instance_id))
             instance_object = instances[0]
         else:
             raise NonRecoverableError(
                 'External resource, but the supplied '
                 'instance id {0} is not in the account.'.format(instance_id))
 
-    attribute = getattr(instance_object, attribute)
-    return attribute
+    return instance_object
+
+
+def _refresh_instance_object(instance_object):
+    """Re-describes an instance in place, to poll its state.
+
+    :param instance_object: A boto object representing an EC2 instance.
+    :raises NonRecoverableError: If Boto errors.
+    """
+
+    try:
+        instance_object.update()
+    except (boto.exception.EC2ResponseError,
+            boto.exception.BotoServerError) as e:
+        raise NonRecoverableError('{0}'.format(str(e)))
+
+
+def _wait_for_instance_state(instance_object, state_code, wait_timeout):
+    """Polls an instance in-process until it reaches a state.
+
+    :param instance_object: A boto object representing an EC2 instance.
+    :param state_code: The state code to wait for.
+    :param wait_timeout: How many seconds to poll for.
+    :returns True if the instance reached the state, otherwise False.
+    """
+
+    def reached_state():
+        _refresh_instance_object(instance_object)
+        return instance_object.state_code == state_code
+
+    return instance_object.state_code == state_code or \
+        utils.wait_for(reached_state, wait_timeout)
 
 
 def _get_instance_state():
@@ -586,6 +841,10 @@ def _get_instance_parameters():
     parameters.update(ctx.node.properties['parameters'])
     parameters = _handle_userdata(parameters)
 
+    if isinstance(parameters.get('block_device_map'), dict):
+        parameters['block_device_map'] = _get_block_device_map(
+            parameters['image_id'], parameters['block_device_map'])
+
     return parameters
 
 
@@ -23,6 +23,8 @@ import boto.exception
 from ec2 import utils
 from ec2 import constants
 from ec2 import connection
+from core import metrics
+from core import preflight
 from cloudify import ctx
 from cloudify.exceptions import NonRecoverableError
 from cloudify.decorators import operation
@@ -33,6 +35,7 @@ RUNTIME_PROPERTIES = [constants.AWS_TYPE_PROPERTY,
 
 
 @operation
+@metrics.summarize_api_calls
 def creation_validation(**_):
     """ This validates all nodes before bootstrap.
     """
@@ -43,33 +46,45 @@ def creation_validation(**_):
     key_file = _get_path_to_key_file()
     key_file_in_filesystem = _search_for_key_file(key_file)
 
+    key_pair_exists = preflight.get_preflight().exists(
+        ctx.node.properties['resource_id'])
+
     if ctx.node.properties['use_external_resource']:
         if not key_file_in_filesystem:
             raise NonRecoverableError(
                 'External resource, but the key file does not exist locally.')
-        try:
-            _get_key_pair_by_id(ctx.node.properties['resource_id'])
-        except NonRecoverableError as e:
+        if key_pair_exists is False:
             raise NonRecoverableError(
                 'External resource, '
-                'but the key pair does not exist in the account: '
-                '{0}'.format(str(e)))
+                'but the key pair does not exist in the account.')
+        elif key_pair_exists is None:
+            try:
+                _get_key_pair_by_id(ctx.node.properties['resource_id'])
+            except NonRecoverableError as e:
+                raise NonRecoverableError(
+                    'External resource, '
+                    'but the key pair does not exist in the account: '
+                    '{0}'.format(str(e)))
     else:
         if key_file_in_filesystem:
             raise NonRecoverableError(
                 'Not external resource, '
                 'but the key file exists locally.')
-        try:
-            _get_key_pair_by_id(ctx.node.properties['resource_id'])
-        except NonRecoverableError:
-            pass
-        else:
+        if key_pair_exists is None:
+            try:
+                _get_key_pair_by_id(ctx.node.properties['resource_id'])
+            except NonRecoverableError:
+                key_pair_exists = False
+            else:
+                key_pair_exists = True
+        if key_pair_exists:
             raise NonRecoverableError(
                 'Not external resource, '
                 'but the key pair exists in the account.')
 
 
 @operation
+@metrics.summarize_api_calls
 def create(**kwargs):
     """Creates a keypair."""
 
@@ -98,6 +113,7 @@ def create(**kwargs):
 
 
 @operation
+@metrics.summarize_api_calls
 def delete(**kwargs):
     """Deletes a keypair."""
 
@@ -15,20 +15,28 @@
 
 # Built-in Imports
 import re
+from collections import OrderedDict
 
 # Third-party Imports
 from boto import exception
+from boto.ec2.securitygroup import IPPermissions
 
 # Cloudify imports
 from ec2 import utils
 from ec2 import constants
 from ec2 import connection
+from core import cache
+from core import metrics
+from core import preflight
 from cloudify import ctx
 from cloudify.exceptions import NonRecoverableError
 from cloudify.decorators import operation
 
+_SECURITY_GROUP_ID = re.compile(constants.SECURITY_GROUP_ID_FORMAT)
+
 
 @operation
+@metrics.summarize_api_calls
 def creation_validation(**_):
     """ This validates all Security Group Nodes before bootstrap.
     """
@@ -36,8 +44,11 @@ def creation_validation(**_):
     for property_key in constants.SECURITY_GROUP_REQUIRED_PROPERTIES:
         utils.validate_node_property(property_key, ctx.node.properties)
 
-    security_group = _get_security_group_from_id(
-        utils.get_resource_id())
+    resource_id = utils.get_resource_id()
+    security_group = preflight.get_preflight().exists(resource_id)
+    if security_group is None:
+        security_group = _get_security_group_from_id(
+            resource_id, _get_connected_vpc())
 
     if ctx.node.properties['use_external_resource'] and not security_group:
         raise NonRecoverableError(
@@ -51,7 +62,8 @@ def creation_validation(**_):
 
 
 @operation
-def create(**_):
+@metrics.summarize_api_calls
+def create(wait_timeout=constants.WAITER_TIMEOUT, **_):
     """Creates an EC2 security group.
     """
 
@@ -86,8 +98,10 @@ def create(**_):
         utils.set_external_resource_id(
                 security_group.id, ctx.instance, external=False)
 
-    security_group = _get_security_group_from_id(
-            ctx.instance.runtime_properties[constants.EXTERNAL_RESOURCE_ID])
+    security_group = utils.wait_for(
+        lambda: _get_security_group_from_id(
+            ctx.instance.runtime_properties[constants.EXTERNAL_RESOURCE_ID]),
+        wait_timeout)
 
     if not security_group:
         return ctx.operation.retry(
@@ -98,6 +112,7 @@ def create(**_):
 
 
 @operation
+@metrics.summarize_api_calls
 def start(**_):
     """Add tags to EC2 security group.
     """
@@ -109,6 +124,7 @@ def start(**_):
 
 
 @operation
+@metrics.summarize_api_calls
 def delete(**_):
     """ Deletes an EC2 security group.
     """
@@ -131,6 +147,64 @@ def delete(**_):
         .format(group_id))
 
 
+@operation
+@metrics.summarize_api_calls
+def update_rules(rules=None, **_):
+    """Reconciles the ingress rules of an EC2 security group with the
+    rules property of the node, or with the rules input if it is given.
+    The group is described once, and only the rules that differ are
+    authorized and revoked, with one request each.
+    """
+
+    group_id = utils.get_external_resource_id_or_raise(
+        'update security group rules', ctx.instance)
+
+    if utils.use_external_resource(ctx.node.properties):
+        ctx.logger.info(
+            'External resource. Not updating the rules of security '
+            'group {0}.'.format(group_id))
+        return
+
+    group_object = _get_security_group_from_id(group_id)
+
+    if not group_object:
+        raise NonRecoverableError(
+            'Unable to update the rules of security group {0}, because '
+            'the group does not exist in the account.'.format(group_id))
+
+    if rules is None:
+        rules = ctx.node.properties['rules']
+
+    desired = _desired_grants(group_object, rules)
+    current = _current_grants(group_object)
+    desired_keys = set(_grant_key(*grant) for grant in desired)
+    current_keys = set(_grant_key(*grant) for grant in current)
+
+    to_authorize = _group_grants(
+        grant for grant in desired if _grant_key(*grant) not in current_keys)
+    to_revoke = _group_grants(
+        grant for grant in current if _grant_key(*grant) not in desired_keys)
+
+    try:
+        if to_authorize:
+            _submit_permissions(
+                group_object, 'AuthorizeSecurityGroupIngress', to_authorize)
+        if to_revoke:
+            _submit_permissions(
+                group_object, 'RevokeSecurityGroupIngress', to_revoke)
+    except (exception.EC2ResponseError,
+            exception.BotoServerError) as e:
+        raise NonRecoverableError('{0}'.format(str(e)))
+    finally:
+        # The rules of the indexed group are no longer current.
+        _get_security_group_index().discard(group_id)
+
+    ctx.logger.info(
+        'Updated the rules of security group {0}: authorized {1} and '
+        'revoked {2} permissions.'.format(
+            group_id, len(to_authorize), len(to_revoke)))
+
+
 def _get_connected_vpc():
 
     list_of_vpcs = \
@@ -166,51 +240,220 @@ def _delete_security_group(group_id):
             exception.BotoServerError) as e:
         raise NonRecoverableError('{0}'.format(str(e)))
 
+    _get_security_group_index().discard(group_to_delete.id)
+
 
 def _create_group_rules(group_object):
-    """For each rule listed in the blueprint,
-    this will add the rule to the group with the given id.
-    :param group: The group object that you want to add rules to.
+    """Adds the rules listed in the blueprint to the group with a single
+    AuthorizeSecurityGroupIngress request.
+
+    :param group_object: The group object that you want to add rules to.
     :raises NonRecoverableError: src_group_id OR ip_protocol,
     from_port, to_port, and cidr_ip are not provided.
     """
 
-    for rule in ctx.node.properties['rules']:
+    permissions = _compile_rules(group_object, ctx.node.properties['rules'])
 
-        if 'src_group_id' in rule:
+    if not permissions:
+        return
 
-            if 'cidr_ip' in rule:
-                raise NonRecoverableError(
-                    'You need to pass either src_group_id OR cidr_ip.')
+    try:
+        _submit_permissions(
+            group_object, 'AuthorizeSecurityGroupIngress', permissions)
+    except (exception.EC2ResponseError,
+            exception.BotoServerError) as e:
+        raise NonRecoverableError('{0}'.format(str(e)))
+    except Exception:
+        _delete_security_group(group_object.id)
+        raise
 
-            if not group_object.vpc_id:
-                src_group_object = \
-                    _get_security_group_from_id(
-                        rule['src_group_id'])
-            else:
-                src_group_object = _get_vpc_security_group_from_name(
-                    rule['src_group_id'])
+    _add_local_rules(group_object, permissions)
+
+
+def _compile_rules(group_object, rules):
+    """Compiles blueprint rules into ingress permissions.
+
+    Source groups are resolved with one describe request, rules with
+    the same protocol and ports are merged into one permission, and
+    grants that the group already has are left out, so that a retried
+    operation does not fail with a duplicate rule error.
+
+    :param group_object: The group that the rules are added to.
+    :param rules: The rules property of the node.
+    :returns An ordered list of (ip_protocol, from_port, to_port, grants)
+        tuples. Each grant is a (cidr_ip, src_group_id, src_group_name,
+        src_group_owner_id) tuple.
+    :raises NonRecoverableError: If a rule has neither or both of
+        src_group_id and cidr_ip, or if a source group does not exist.
+    """
+
+    existing = set(
+        _grant_key(ports, grant)
+        for ports, grant in _current_grants(group_object))
+
+    return _group_grants(
+        (ports, grant)
+        for ports, grant in _desired_grants(group_object, rules)
+        if _grant_key(ports, grant) not in existing)
 
-            if not src_group_object:
+
+def _desired_grants(group_object, rules):
+    """Returns the (ports, grant) pairs of the rules, where ports is
+    (ip_protocol, from_port, to_port).
+    """
+
+    for rule in rules:
+        if ('src_group_id' in rule) == ('cidr_ip' in rule):
+            raise NonRecoverableError(
+                'You need to pass either src_group_id OR cidr_ip.')
+
+    source_groups = _index_source_groups(
+        group_object, [rule['src_group_id'] for rule in rules
+                       if 'src_group_id' in rule])
+
+    grants = []
+    for rule in rules:
+        ports = (rule['ip_protocol'],
+                 rule.get('from_port'), rule.get('to_port'))
+
+        if 'src_group_id' in rule:
+            src_group = source_groups.get(rule['src_group_id'])
+            if not src_group:
                 raise NonRecoverableError(
                     'Supplied src_group_id {0} doesn ot exist in '
                     'the given account.'.format(rule['src_group_id']))
+            grants.append((ports, (None, src_group.id, src_group.name,
+                                   src_group.owner_id)))
+        elif isinstance(rule['cidr_ip'], list):
+            grants.extend((ports, (cidr_ip, None, None, None))
+                          for cidr_ip in rule['cidr_ip'])
+        else:
+            grants.append((ports, (rule['cidr_ip'], None, None, None)))
 
-            del rule['src_group_id']
-            rule['src_group'] = src_group_object
+    return grants
 
-        elif 'cidr_ip' not in rule:
-            raise NonRecoverableError(
-                'You need to pass either src_group_id OR cidr_ip.')
 
-        try:
-            group_object.authorize(**rule)
-        except (exception.EC2ResponseError,
-                exception.BotoServerError) as e:
-            raise NonRecoverableError('{0}'.format(str(e)))
-        except Exception as e:
-            _delete_security_group(group_object.id)
-            raise
+def _current_grants(group_object):
+    """Returns the (ports, grant) pairs of the ingress rules that the
+    group object has.
+    """
+
+    return [((permission.ip_protocol,
+              permission.from_port, permission.to_port),
+             (grant.cidr_ip, grant.group_id, grant.name, grant.owner_id))
+            for permission in group_object.rules
+            for grant in permission.grants]
+
+
+def _grant_key(ports, grant):
+    return _ports_key(ports) + grant[:2]
+
+
+def _ports_key(ports):
+    """Normalizes (ip_protocol, from_port, to_port) the way AWS does, so
+    that rules from the blueprint compare equal to the rules that AWS
+    returns: protocol names become numbers, a missing port is -1, and
+    the ports of an all traffic rule are ignored.
+    """
+
+    ip_protocol, from_port, to_port = \
+        (str(value).lower() if value is not None else '-1'
+         for value in ports)
+    ip_protocol = constants.IP_PROTOCOL_NUMBERS.get(ip_protocol, ip_protocol)
+
+    if ip_protocol == '-1':
+        return ip_protocol, '-1', '-1'
+
+    return ip_protocol, from_port, to_port
+
+
+def _group_grants(grants):
+    """Merges (ports, grant) pairs into permissions, one per protocol and
+    port range, and drops duplicate grants.
+    """
+
+    permissions = OrderedDict()
+    keys = set()
+
+    for ports, grant in grants:
+        key = _grant_key(ports, grant)
+        if key in keys:
+            continue
+        keys.add(key)
+        permissions.setdefault(_ports_key(ports), ports + ([],))[3].append(
+            grant)
+
+    return permissions.values()
+
+
+def _index_source_groups(group_object, src_group_ids):
+    """Resolves the source groups of the rules with one describe request.
+
+    :param group_object: The group that the rules are added to.
+    :param src_group_ids: The src_group_id values of the rules,
+        each either a group ID or a group name.
+    :returns A dict of the groups that the rules can reference,
+        keyed by both ID and name.
+    """
+
+    if not src_group_ids:
+        return {}
+
+    return _get_security_group_index().get_vpc_groups(
+        group_object.vpc_id, src_group_ids)
+
+
+def _submit_permissions(group_object, action, permissions):
+    """Sends all of the permissions in one request.
+
+    :param group_object: The group that the permissions apply to.
+    :param action: AuthorizeSecurityGroupIngress or
+        RevokeSecurityGroupIngress.
+    :param permissions: A list of permissions, as returned by
+        _compile_rules.
+    """
+
+    params = {'GroupId': group_object.id}
+
+    for n, (ip_protocol, from_port, to_port, grants) in \
+            enumerate(permissions, 1):
+        prefix = 'IpPermissions.{0}.'.format(n)
+        params[prefix + 'IpProtocol'] = ip_protocol
+        if from_port is not None:
+            params[prefix + 'FromPort'] = from_port
+        if to_port is not None:
+            params[prefix + 'ToPort'] = to_port
+
+        cidr_ips = [grant[0] for grant in grants if grant[0]]
+        for m, cidr_ip in enumerate(cidr_ips, 1):
+            params[prefix + 'IpRanges.{0}.CidrIp'.format(m)] = cidr_ip
+
+        src_groups = [grant[1:] for grant in grants if grant[1]]
+        for m, (group_id, group_name, owner_id) in enumerate(src_groups, 1):
+            group_prefix = prefix + 'Groups.{0}.'.format(m)
+            if group_object.vpc_id:
+                params[group_prefix + 'GroupId'] = group_id
+            else:
+                params[group_prefix + 'GroupName'] = group_name
+                params[group_prefix + 'UserId'] = owner_id
+
+    group_object.connection.get_status(action, params, verb='POST')
+
+
+def _add_local_rules(group_object, permissions):
+    """Adds authorized permissions to the rules of the local group object,
+    as boto does after each authorize.
+    """
+
+    for ip_protocol, from_port, to_port, grants in permissions:
+        rule = IPPermissions(group_object)
+        rule.ip_protocol = ip_protocol
+        rule.from_port = from_port
+        rule.to_port = to_port
+        for cidr_ip, group_id, group_name, owner_id in grants:
+            rule.add_grant(name=group_name, owner_id=owner_id,
+                           cidr_ip=cidr_ip, group_id=group_id)
+        group_object.rules.append(rule)
 
 
 def _create_external_securitygroup(name):
@@ -225,7 +468,7 @@ def _create_external_securitygroup(name):
     if not utils.use_external_resource(ctx.node.properties):
         return False
 
-    group = _get_security_group_from_id(name)
+    group = _get_security_group_from_id(name, _get_connected_vpc())
     if not group:
         raise NonRecoverableError(
             'External security group was indicated, but the given '
@@ -254,44 +497,150 @@ def _delete_external_securitygroup():
     return True
 
 
-def _get_security_group_from_id(group_id):
+def _get_security_group_from_id(group_id, vpc_id=None):
     """Returns the security group object for a given security group id.
 
-    :param group_id: The ID of a security group.
+    :param group_id: The ID of a security group. A name is accepted too.
+    :param vpc_id: The VPC of a group that is given by name.
     :returns The boto security group object.
     """
 
-    if not re.match('^sg\-[0-9a-z]{8}$', group_id):
-        group = _get_security_group_from_name(group_id)
-        return group
+    return _get_security_group_index().get(group_id, vpc_id)
 
-    group = _get_all_security_groups(list_of_group_ids=group_id)
 
-    return group[0] if group else group
-
-
-def _get_security_group_from_name(group_name):
+def _get_security_group_from_name(group_name, vpc_id=None):
     """Returns the security group object for a given group name.
 
-    :param group_name: The name of a security group.
+    :param group_name: The name of a security group. An ID is accepted too.
+    :param vpc_id: The VPC of the group.
     :returns The boto security group object.
     """
 
-    if re.match('^sg\-[0-9a-z]{8}$', group_name):
-        group = _get_security_group_from_id(group_name)
-        return group
+    return _get_security_group_index().get(group_name, vpc_id)
 
-    group = _get_all_security_groups(list_of_group_names=group_name)
 
-    return group[0] if group else group
+def _get_security_group_index():
+    """Returns the security group index of the current operation.
+    Outside of an operation, a new index is returned on each call.
+    """
+
+    ec2_client = connection.EC2ConnectionClient().client()
+
+    return cache.get_operation_cache(
+        'security_groups', lambda: SecurityGroupIndex(ec2_client))
+
+
+class SecurityGroupIndex(object):
+    """Security groups indexed by ID and by VPC and name, and the groups of
+    each VPC indexed by ID and name. The index is filled from describe
+    requests filtered by group-id, group-name and vpc-id. Groups that
+    were not found are not remembered, so a group that is created later
+    is found.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.by_id = {}
+        self.by_name = {}
+        self.vpcs = {}
+
+    def get(self, group_id_or_name, vpc_id=None):
+        """Returns the group with this ID or name, or None.
+
+        :param vpc_id: The VPC that a group looked up by name is in.
+            Names are only unique within a VPC.
+        """
+
+        if _SECURITY_GROUP_ID.match(group_id_or_name):
+            if group_id_or_name not in self.by_id:
+                self._describe({'group-id': group_id_or_name})
+            return self.by_id.get(group_id_or_name)
+
+        key = (vpc_id, group_id_or_name)
+        if key not in self.by_name:
+            filters = {'group-name': group_id_or_name}
+            if vpc_id:
+                filters['vpc-id'] = vpc_id
+            self._describe(filters)
+        return self.by_name.get(key)
+
+    def get_vpc_groups(self, vpc_id, group_ids_or_names):
+        """Returns the groups that can be referenced by the rules of a
+        group in a VPC, keyed by ID and by name. The groups of the VPC
+        are described once. Without a VPC, only the referenced groups
+        are described, filtered by group-id and by group-name.
+
+        :param group_ids_or_names: The groups that the rules reference.
+        """
+
+        if not vpc_id:
+            return self._get_classic_groups(group_ids_or_names)
+
+        if vpc_id not in self.vpcs:
+            groups = self._describe({'vpc-id': vpc_id})
+            vpc_groups = {}
+            for group in groups:
+                vpc_groups[group.id] = group
+                if group.vpc_id == vpc_id:
+                    vpc_groups.setdefault(group.name, group)
+            self.vpcs[vpc_id] = vpc_groups
+
+        return self.vpcs[vpc_id]
+
+    def _get_classic_groups(self, group_ids_or_names):
+
+        group_ids = set(group_id_or_name
+                        for group_id_or_name in group_ids_or_names
+                        if _SECURITY_GROUP_ID.match(group_id_or_name))
+        names = set(group_ids_or_names) - group_ids
+
+        missing_ids = sorted(group_ids - set(self.by_id))
+        if missing_ids:
+            self._describe({'group-id': missing_ids})
+        missing_names = sorted(name for name in names
+                               if not self._get_classic_group(name))
+        if missing_names:
+            self._describe({'group-name': missing_names})
+
+        groups = dict((group_id, self.by_id[group_id])
+                      for group_id in group_ids if group_id in self.by_id)
+        for name in names:
+            group = self._get_classic_group(name)
+            if group:
+                groups[name] = group
+
+        return groups
+
+    def _get_classic_group(self, name):
+        # by_name falls back to a VPC group for (None, name).
+        group = self.by_name.get((None, name))
+        return group if group and not group.vpc_id else None
+
+    def discard(self, group_id):
+        """Removes a deleted group from the index."""
+
+        group = self.by_id.pop(group_id, None)
+        if not group:
+            return
+        for groups in [self.by_name] + self.vpcs.values():
+            for key, value in groups.items():
+                if value is group:
+                    del groups[key]
+
+    def _describe(self, filters):
+
+        try:
+            groups = self.client.get_all_security_groups(filters=filters)
+        except (exception.EC2ResponseError,
+                exception.BotoServerError) as e:
+            raise NonRecoverableError('{0}'.format(str(e)))
 
+        for group in groups:
+            self.by_id[group.id] = group
+            self.by_name[(group.vpc_id, group.name)] = group
+            self.by_name.setdefault((None, group.name), group)
 
-def _get_vpc_security_group_from_name(name):
-    groups = _get_all_security_groups()
-    for group in groups:
-        if group.name == name:
-            return group
-    return None
+        return groups
 
 
 def _get_all_security_groups(list_of_group_names=None, list_of_group_ids=None):
@@ -311,8 +660,7 @@ def _get_all_security_groups(list_of_group_names=None, list_of_group_ids=None):
             group_ids=list_of_group_ids)
     except exception.EC2ResponseError as e:
         if 'InvalidGroup.NotFound' in e:
-            groups = ec2_client.get_all_security_groups()
-            utils.log_available_resources(groups)
+            ctx.logger.debug('Security groups not found: {0}'.format(e))
         return None
     except exception.BotoServerError as e:
         raise NonRecoverableError('{0}'.format(str(e)))
@@ -14,9 +14,14 @@
 #    * limitations under the License.
 
 # Built-in Imports
+import os
+import json
+import hashlib
+import tempfile
 import testtools
 
 # Third Party Imports
+import mock
 from moto import mock_ec2
 from moto import mock_elb
 from boto.ec2 import EC2Connection
@@ -24,6 +29,8 @@ from boto.ec2 import EC2Connection
 # Cloudify Imports is imported and used in operations
 from ec2 import constants
 from ec2 import connection
+from core import metrics
+from core import throttle
 from cloudify.state import current_ctx
 from cloudify.mocks import MockCloudifyContext
 from cloudify.exceptions import NonRecoverableError
@@ -95,3 +102,86 @@ class TestConnection(testtools.TestCase):
         self.assertEqual(
             ec2_client.DefaultRegionName,
             ec2_client.region.name)
+
+    @mock_ec2
+    def test_connection_is_pooled(self):
+        ctx = self.get_mock_context('test_connection_is_pooled')
+        current_ctx.set(ctx=ctx)
+        ec2_client = connection.EC2ConnectionClient().client()
+        self.assertIs(ec2_client, connection.EC2ConnectionClient().client())
+
+        ctx.node.properties[constants.AWS_CONFIG_PROPERTY] = {
+            'ec2_region_name': 'us-west-1'
+        }
+        other_client = connection.EC2ConnectionClient().client()
+        self.assertIsNot(ec2_client, other_client)
+        self.assertEqual('us-west-1', other_client.region.name)
+
+    @mock_elb
+    def test_elb_connection_is_pooled(self):
+        ctx = self.get_mock_context('test_elb_connection_is_pooled')
+        current_ctx.set(ctx=ctx)
+
+        for aws_config in [
+                {'elb_region_name': 'us-east-1'},
+                {'elb_region_name': 'us-east-1',
+                 'elb_region_endpoint':
+                     'elasticloadbalancing.us-east-1.amazonaws.com'}]:
+            ctx.node.properties[constants.AWS_CONFIG_PROPERTY] = aws_config
+            elb_client = connection.ELBConnectionClient().client()
+            self.assertIs(
+                elb_client, connection.ELBConnectionClient().client())
+            self.assertEqual('us-east-1', elb_client.region.name)
+
+    @mock_ec2
+    def test_reset_connections(self):
+        ctx = self.get_mock_context('test_reset_connections')
+        current_ctx.set(ctx=ctx)
+        ec2_client = connection.EC2ConnectionClient().client()
+        connection.reset_connections(ec2_client)
+        self.assertIsNot(
+            ec2_client, connection.EC2ConnectionClient().client())
+
+    def test_throttled_request_slows_down_the_bucket(self):
+        throttled = mock.Mock(status=503)
+        throttled.read.return_value = \
+            '<Response><Errors><Error><Code>RequestLimitExceeded</Code>'
+        client = mock.Mock(host='ec2', aws_access_key_id='a')
+        client.make_request.return_value = throttled
+        key = (hashlib.sha1('a').hexdigest(), 'ec2', 'DescribeInstances')
+
+        with mock.patch('core.throttle._rate_limiter', None), \
+                mock.patch('core.metrics.record') as record:
+            rate_limiter = throttle.get_rate_limiter()
+            throttle.throttle_client(client)
+            self.assertIs(throttled, client.make_request('DescribeInstances'))
+            self.assertIs(rate_limiter, throttle.get_rate_limiter())
+
+        self.assertEqual(1, record.call_count)
+        self.assertEqual(1, record.call_args[0][4])
+        self.assertLess(rate_limiter.rate(key),
+                        constants.THROTTLE_INITIAL_RATE)
+
+    @mock_ec2
+    def test_api_calls_are_recorded(self):
+        ctx = self.get_mock_context('test_api_calls_are_recorded')
+        current_ctx.set(ctx=ctx)
+        metrics_path = tempfile.mkstemp()[1]
+
+        @metrics.summarize_api_calls
+        def operation():
+            connection.EC2ConnectionClient().client().get_all_instances()
+            return metrics.get_calls()
+
+        with mock.patch.dict(os.environ, {
+                constants.API_METRICS_PATH_ENV_VAR_NAME: metrics_path}), \
+                mock.patch.object(ctx.logger, 'info') as log_info:
+            calls = operation()
+
+        self.assertEqual(['DescribeInstances'],
+                         [call['action'] for call in calls])
+        self.assertIn('1 AWS API calls', log_info.call_args[0][0])
+        with open(metrics_path) as metrics_file:
+            self.assertEqual(
+                'DescribeInstances',
+                json.loads(metrics_file.readline())['action'])
@@ -14,15 +14,19 @@
 #    * limitations under the License.
 
 # Built-in Imports
+import os
+import tempfile
 import testtools
 
 # Third Party Imports
+import mock
 from boto.ec2 import EC2Connection
 from moto import mock_ec2
 
 # Cloudify Imports is imported and used in operations
 from ec2 import ebs
 from ec2 import constants
+from core import tracker
 from cloudify.state import current_ctx
 from cloudify.mocks import MockContext
 from cloudify.mocks import MockCloudifyContext
@@ -526,3 +530,98 @@ class TestEBS(testtools.TestCase):
         self.assertIn(
             constants.VOLUME_SNAPSHOT_ATTRIBUTE,
             ctx.instance.runtime_properties)
+
+    @mock_ec2
+    def test_snapshot_retention(self):
+        """ Tests that snapshots_ids keeps the newest snapshot IDs,
+            and that the snapshots of the pruned IDs are deleted.
+        """
+
+        ctx = self.mock_ctx('test_snapshot_retention')
+        current_ctx.set(ctx=ctx)
+        ebs.create(dict(), ctx=ctx)
+
+        for _ in range(3):
+            ebs.create_snapshot(
+                dict(), wait_timeout=10, retention=2, ctx=ctx)
+
+        snapshots_ids = ctx.instance.runtime_properties[
+            constants.VOLUME_SNAPSHOT_ATTRIBUTE]
+        self.assertEqual(2, len(snapshots_ids))
+        self.assertEqual(
+            sorted(snapshots_ids),
+            sorted(snapshot.id for snapshot in
+                   EC2Connection().get_all_snapshots(owner='self')))
+
+    @mock_ec2
+    def test_instance_snapshots(self):
+        """ Tests that the volumes of an instance are snapshotted
+            together, polled with one DescribeSnapshots call, and
+            pruned per volume.
+        """
+
+        ctx = self.mock_ctx('test_instance_snapshots')
+        current_ctx.set(ctx=ctx)
+        client = EC2Connection()
+        instance_id = client.run_instances(
+            TEST_AMI_IMAGE_ID, instance_type=TEST_INSTANCE_TYPE,
+            placement=TEST_ZONE).instances[0].id
+        for device in ['/dev/sdf', '/dev/sdg']:
+            volume = client.create_volume(TEST_SIZE, TEST_ZONE)
+            client.attach_volume(volume.id, instance_id, device)
+        ctx.instance.runtime_properties['aws_resource_id'] = instance_id
+
+        get_all_snapshots = EC2Connection.get_all_snapshots
+        with mock.patch.object(EC2Connection, 'get_all_snapshots',
+                               autospec=True,
+                               side_effect=get_all_snapshots) as describe:
+            ebs.create_instance_snapshots(
+                dict(), wait_timeout=10, ctx=ctx)
+
+        # moto also attaches a root volume.
+        volumes = client.get_all_volumes(
+            filters={'attachment.instance-id': instance_id})
+        self.assertEqual(1, describe.call_count)
+        self.assertEqual(len(volumes), len(ctx.instance.runtime_properties[
+            constants.VOLUME_SNAPSHOT_ATTRIBUTE]))
+
+        # Retention applies to the snapshots of each volume.
+        ebs.create_instance_snapshots(
+            dict(), wait_timeout=10, retention=1, ctx=ctx)
+        volume_snapshots = ctx.instance.runtime_properties[
+            constants.VOLUME_SNAPSHOTS_BY_VOLUME_ATTRIBUTE]
+        self.assertEqual(
+            sorted(volume.id for volume in volumes), sorted(volume_snapshots))
+        self.assertEqual(
+            [1] * len(volumes),
+            [len(snapshot_ids) for snapshot_ids in volume_snapshots.values()])
+        self.assertEqual(
+            sorted(ctx.instance.runtime_properties[
+                constants.VOLUME_SNAPSHOT_ATTRIBUTE]),
+            sorted(snapshot.id for snapshot in
+                   client.get_all_snapshots(owner='self')))
+
+    @mock_ec2
+    def test_volume_state_tracker(self):
+        """ Tests that waiters share the DescribeVolumes polls of the
+            volumes that they watch.
+        """
+
+        ctx = self.mock_ctx('test_volume_state_tracker')
+        current_ctx.set(ctx=ctx)
+        client = self.get_client()
+        volume_ids = sorted(self.create_volume(client).id for _ in range(2))
+        describe = mock.Mock(side_effect=ebs._describe_volume_statuses)
+
+        with mock.patch.dict(os.environ, {
+                constants.CLAIM_TABLE_DIR_ENV_VAR_NAME: tempfile.mkdtemp()}):
+            volume_tracker = tracker.get_state_tracker('volumes', describe)
+            first_polled, _ = volume_tracker.states(volume_ids[:1], 0)
+            second_polled, _ = volume_tracker.states(volume_ids[1:], 0)
+            volume_tracker.states(volume_ids[:1], first_polled)
+            _, statuses = volume_tracker.states(volume_ids[1:], second_polled)
+
+        self.assertEqual(3, describe.call_count)
+        describe.assert_called_with(volume_ids)
+        self.assertEqual(
+            {volume_ids[1]: constants.VOLUME_AVAILABLE}, statuses)
@@ -14,6 +14,8 @@
 #    * limitations under the License.
 
 # Built-in Imports
+import os
+import tempfile
 import testtools
 
 # Third Party Imports
@@ -21,10 +23,13 @@ from moto import mock_elb
 from moto import mock_ec2
 import boto
 import mock
+from boto.ec2.elb import ELBConnection
+from boto.exception import BotoServerError
 
 # Cloudify Imports is imported and used in operations
 from ec2 import constants
 from ec2 import elasticloadbalancer
+from core import spool
 from cloudify.state import current_ctx
 from cloudify.mocks import MockCloudifyContext
 from cloudify.exceptions import NonRecoverableError
@@ -106,7 +111,7 @@ class TestLoadBalancer(testtools.TestCase):
 
     def mock_elb_ctx(self, test_name, use_external_resource=False,
                      elb_name='myelb', instance_list=[], resource_id='',
-                     bad_health_checks=False):
+                     bad_health_checks=False, operation=None):
         """ Creates a mock context for the elb
             tests
         """
@@ -134,7 +139,8 @@ class TestLoadBalancer(testtools.TestCase):
         ctx = MockCloudifyContext(
             node_id=test_node_id,
             properties=test_properties,
-            runtime_properties=runtime_properties
+            runtime_properties=runtime_properties,
+            operation=operation
         )
         ctx.node.type_hierarchy = ['cloudify.nodes.LoadBalancer']
 
@@ -201,6 +207,93 @@ class TestLoadBalancer(testtools.TestCase):
                           'instance_list'))
         self.assertIn(instance_id, self._get_elb_instances())
 
+    @mock_ec2
+    @mock_elb
+    def test_add_instances_to_elb_in_batch(self):
+        """ this tests that instances which are added to a load
+        balancer at the same time are registered with one call.
+        """
+
+        self._create_external_elb()
+        instance_id = self._create_external_instance().id
+        sibling_id = self._create_external_instance().id
+        instance_ctx = self.mock_instance_ctx(
+            'source_test_add_instances_to_elb_in_batch',
+            instance_id=instance_id, use_external_resource=True)
+        ctx = self.mock_relationship_context(
+            'test_add_instances_to_elb_in_batch',
+            use_external_resource=True, instance_context=instance_ctx)
+        current_ctx.set(ctx=ctx)
+        spool_dir = tempfile.mkdtemp()
+        register_instances = ELBConnection.register_instances
+
+        with mock.patch.dict(os.environ, {
+                constants.CLAIM_TABLE_DIR_ENV_VAR_NAME: spool_dir}):
+            registration_spool = spool.get_registration_spool('myelb')
+
+            # A sibling submits while the leader waits for others.
+            with mock.patch(
+                    'time.sleep',
+                    side_effect=lambda _: registration_spool.submit(
+                        ('register', sibling_id))), \
+                    mock.patch.object(
+                        ELBConnection, 'register_instances', autospec=True,
+                        side_effect=register_instances) as register:
+                elasticloadbalancer.add_instance_to_elb(
+                    ctx=ctx, registration_window=5)
+
+        self.assertEqual(1, register.call_count)
+        self.assertEqual((None,), registration_spool.result(
+            ('register', sibling_id)))
+        self.assertEqual(
+            sorted([instance_id, sibling_id]),
+            sorted(ctx.target.instance.runtime_properties['instance_list']))
+        self.assertEqual(sorted([instance_id, sibling_id]),
+                         sorted(self._get_elb_instances()))
+        self.assertFalse(os.path.isfile(registration_spool.path))
+
+    @mock_ec2
+    @mock_elb
+    def test_add_instances_to_elb_in_batch_with_invalid_sibling(self):
+        """ this tests that an invalid instance, which fails the batched
+        call, does not fail the other instances of the batch.
+        """
+
+        self._create_external_elb()
+        instance_id = self._create_external_instance().id
+        instance_ctx = self.mock_instance_ctx(
+            'source_test_add_instances_to_elb_in_batch_with_invalid_sibling',
+            instance_id=instance_id, use_external_resource=True)
+        ctx = self.mock_relationship_context(
+            'test_add_instances_to_elb_in_batch_with_invalid_sibling',
+            use_external_resource=True, instance_context=instance_ctx)
+        current_ctx.set(ctx=ctx)
+        register_instances = ELBConnection.register_instances
+
+        def register_valid_instances(connection, name, instance_ids):
+            if 'i-invalid' in instance_ids:
+                raise BotoServerError(400, 'InvalidInstance')
+            return register_instances(connection, name, instance_ids)
+
+        with mock.patch.dict(os.environ, {
+                constants.CLAIM_TABLE_DIR_ENV_VAR_NAME: tempfile.mkdtemp()}):
+            registration_spool = spool.get_registration_spool('myelb')
+            with mock.patch(
+                    'time.sleep',
+                    side_effect=lambda _: registration_spool.submit(
+                        ('register', 'i-invalid'))), \
+                    mock.patch.object(
+                        ELBConnection, 'register_instances', autospec=True,
+                        side_effect=register_valid_instances) as register:
+                elasticloadbalancer.add_instance_to_elb(
+                    ctx=ctx, registration_window=5)
+
+            self.assertIn('InvalidInstance', registration_spool.result(
+                ('register', 'i-invalid'))[0])
+
+        self.assertEqual(3, register.call_count)
+        self.assertEqual([instance_id], self._get_elb_instances())
+
     @mock_ec2
     @mock_elb
     def test_remove_instance_from_elb(self):
@@ -244,6 +337,29 @@ class TestLoadBalancer(testtools.TestCase):
                           elasticloadbalancer._get_elbs_by_names,
                           ['fake'])
 
+    @mock_elb
+    def test_get_elbs_by_names_targeted_and_cached(self):
+        ctx = self.mock_elb_ctx(
+            'test_get_elbs_by_names_targeted_and_cached',
+            operation={'name': 'cloudify.interfaces.lifecycle.delete',
+                       'retry_number': 0})
+        self._create_external_elb()
+        current_ctx.set(ctx=ctx)
+        get_all_load_balancers = ELBConnection.get_all_load_balancers
+
+        with mock.patch.object(ELBConnection, 'get_all_load_balancers',
+                               autospec=True,
+                               side_effect=get_all_load_balancers) \
+                as describe:
+            self.assertEqual(
+                'myelb', elasticloadbalancer._get_existing_elb('myelb').name)
+            self.assertEqual(
+                'myelb', elasticloadbalancer._get_existing_elb('myelb').name)
+
+        self.assertEqual(1, describe.call_count)
+        self.assertEqual(
+            ['myelb'], describe.call_args[1]['load_balancer_names'])
+
     @mock_elb
     def test_get_instance_list(self):
         ctx = self.mock_elb_ctx('test_get_instance_list')
@@ -252,6 +368,27 @@ class TestLoadBalancer(testtools.TestCase):
         l = elasticloadbalancer._get_instance_list()
         self.assertEquals([], l)
 
+    @mock_ec2
+    @mock_elb
+    def test_get_instance_list_is_not_cached(self):
+        """ Tests that the instance list is described again, and not
+        read from the load balancer cached earlier in the operation.
+        """
+
+        ctx = self.mock_elb_ctx('test_get_instance_list_is_not_cached')
+        self._create_external_elb()
+        instance_id = self._create_external_instance().id
+        current_ctx.set(ctx=ctx)
+
+        with mock.patch('core.metrics.operation_key',
+                        return_value=('d', 'unlink', 'i')):
+            elasticloadbalancer._get_existing_elb('myelb')
+            ELBConnection().register_instances('myelb', [instance_id])
+            instances = elasticloadbalancer._get_instance_list()
+
+        self.assertEqual(
+            [instance_id], [instance.id for instance in instances])
+
     @mock_elb
     def test_validation_not_external(self):
         """ Tests that creation_validation raises an error
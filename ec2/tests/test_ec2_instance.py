@@ -14,6 +14,7 @@
 #    * limitations under the License.
 
 # Built-in Imports
+import os
 import testtools
 import tempfile
 import uuid
@@ -21,12 +22,20 @@ import uuid
 # Third Party Imports
 from moto import mock_ec2
 import mock
+from boto.ec2 import EC2Connection
 from boto.vpc import VPCConnection
+from boto.exception import EC2ResponseError
+from boto.ec2.blockdevicemapping import BlockDeviceMapping
+from boto.ec2.blockdevicemapping import BlockDeviceType
 
 # Cloudify Imports is imported and used in operations
 from ec2 import constants
 from ec2 import connection
 from ec2 import instance
+from core import claims
+from core import images
+from core import pool
+from core import throttle
 from cloudify.context import BootstrapContext
 from cloudify.state import current_ctx
 from cloudify.mocks import MockCloudifyContext
@@ -379,6 +388,225 @@ class TestInstance(testtools.TestCase):
         state = instance_object.update()
         self.assertEqual(state, 'running')
 
+    @mock_ec2
+    def test_start_describes_instance_once(self):
+        """ this tests that the instance start function
+        assigns all runtime properties from a single describe call.
+        """
+
+        ctx = self.mock_ctx('test_start_describes_instance_once')
+        current_ctx.set(ctx=ctx)
+
+        ec2_client = connection.EC2ConnectionClient().client()
+        reservation = ec2_client.run_instances(
+            TEST_AMI_IMAGE_ID, instance_type=TEST_INSTANCE_TYPE)
+        instance_id = reservation.instances[0].id
+        ctx.instance.runtime_properties['aws_resource_id'] = instance_id
+
+        with mock.patch('ec2.instance._get_all_instances',
+                        wraps=instance._get_all_instances) \
+                as get_all_instances:
+            instance.start(ctx=ctx)
+        self.assertEqual(1, get_all_instances.call_count)
+        for property_name in constants.INSTANCE_INTERNAL_ATTRIBUTES:
+            self.assertIn(property_name, ctx.instance.runtime_properties)
+
+    @mock_ec2
+    def test_run_instances_in_bulk(self):
+        """ this tests that node instances which join a bulk
+        RunInstances call share its reservation, and find their own
+        instance in it.
+        """
+
+        ctx = self.mock_ctx('test_run_instances_in_bulk')
+        current_ctx.set(ctx=ctx)
+        table_dir = tempfile.mkdtemp()
+
+        with mock.patch.dict(os.environ, {
+                constants.CLAIM_TABLE_DIR_ENV_VAR_NAME: table_dir}):
+            claim_table = claims.get_claim_table()
+            self.assertTrue(claim_table.join(ctx.instance.id))
+
+            # A sibling joins while the leader waits for others.
+            # moto launches min_count instances, real EC2 up to max_count.
+            launch = EC2Connection().run_instances
+            with mock.patch(
+                    'time.sleep',
+                    side_effect=lambda _: claim_table.join('sibling')), \
+                    mock.patch.object(
+                        EC2Connection, 'run_instances',
+                        side_effect=lambda **kw: launch(
+                            **dict(kw, min_count=kw['max_count']))) \
+                    as run_instances:
+                instance.run_instances(ctx=ctx, bulk_size=10)
+
+        self.assertEqual(1, run_instances.call_count)
+        self.assertEqual(2, run_instances.call_args[1]['max_count'])
+        reservation_id, sibling_instance_id = claim_table.claimed('sibling')
+        self.assertEqual(reservation_id,
+                         ctx.instance.runtime_properties['reservation_id'])
+        self.assertNotEqual(
+            sibling_instance_id,
+            ctx.instance.runtime_properties['aws_resource_id'])
+
+        # While DescribeInstances does not see the instance yet, it is
+        # found in the shared reservation by its claimed ID. moto does not
+        # filter by reservation-id.
+        instance_id = ctx.instance.runtime_properties.pop('aws_resource_id')
+        reservations = [reservation for reservation in
+                        EC2Connection().get_all_reservations()
+                        if reservation.id == reservation_id]
+        self.assertEqual(2, len(reservations[0].instances))
+        with mock.patch('ec2.instance._get_instance_from_id',
+                        return_value=None), \
+                mock.patch.object(EC2Connection, 'get_all_instances',
+                                  return_value=reservations), \
+                mock.patch.dict(os.environ, {
+                    constants.CLAIM_TABLE_DIR_ENV_VAR_NAME: table_dir}), \
+                mock.patch.object(
+                    type(ctx.operation), 'retry_number',
+                    new_callable=mock.PropertyMock, return_value=1):
+            self.assertEqual(
+                instance_id,
+                instance._run_instances_if_needed(EC2Connection(), {}))
+            ctx.instance.runtime_properties['aws_resource_id'] = instance_id
+            self.assertEqual(instance_id, instance._get_instance_object().id)
+
+    @mock_ec2
+    def test_run_instances_in_bulk_releases_claims(self):
+        """ this tests that terminate releases the claim of a node
+        instance, and that a claim of an instance that is no longer
+        launched is not reused.
+        """
+
+        ctx = self.mock_ctx('test_run_instances_in_bulk_releases_claims')
+        current_ctx.set(ctx=ctx)
+        ec2_client = EC2Connection()
+
+        with mock.patch.dict(os.environ, {
+                constants.CLAIM_TABLE_DIR_ENV_VAR_NAME: tempfile.mkdtemp()}), \
+                mock.patch('time.sleep'):
+            claim_table = claims.get_claim_table()
+            instance.run_instances(ctx=ctx, bulk_size=10)
+            instance_id = ctx.instance.runtime_properties['aws_resource_id']
+            instance.terminate(ctx=ctx)
+            self.assertIsNone(claim_table.claimed(ctx.instance.id))
+            self.assertFalse(os.path.isfile(claim_table.path))
+
+            # A claim left behind, e.g. by a node instance that was healed.
+            claim_table.join(ctx.instance.id)
+            client_token, _ = claim_table.open_batch(ctx.instance.id, 1)
+            claim_table.close_batch(client_token, 'r-1', [instance_id])
+            instance.run_instances(ctx=ctx, bulk_size=10)
+
+        new_instance_id = ctx.instance.runtime_properties['aws_resource_id']
+        self.assertNotEqual(instance_id, new_instance_id)
+        self.assertIn(
+            ec2_client.get_only_instances(
+                instance_ids=[new_instance_id])[0].state,
+            constants.INSTANCE_LAUNCHED_STATES)
+
+    @mock_ec2
+    def test_run_instances_from_warm_pool(self):
+        """ this tests that start does not wait for the instances
+        launched for the warm pool, that the next claim stops them, that
+        a node instance claims one of them, that failing to replenish
+        the pool does not fail the claim, and that terminating the last
+        node instance terminates the pool.
+        """
+
+        ec2_client = EC2Connection()
+        pool_filter = {'tag-key': constants.WARM_POOL_TAG}
+        contexts = [self.mock_ctx('test_run_instances_from_warm_pool')
+                    for _ in range(3)]
+        pool_dir = tempfile.mkdtemp()
+
+        with mock.patch.dict(os.environ, {
+                constants.CLAIM_TABLE_DIR_ENV_VAR_NAME: pool_dir}):
+            current_ctx.set(ctx=contexts[0])
+            instance.run_instances(ctx=contexts[0], warm_pool_size=2)
+            instance.start(ctx=contexts[0])
+            pool_instances = ec2_client.get_only_instances(
+                filters=pool_filter)
+            self.assertEqual(
+                ['running', 'running'],
+                [pool_instance.state for pool_instance in pool_instances])
+
+            current_ctx.set(ctx=contexts[1])
+            instance.run_instances(ctx=contexts[1], warm_pool_size=2)
+
+            current_ctx.set(ctx=contexts[2])
+            with mock.patch.object(
+                    EC2Connection, 'run_instances',
+                    side_effect=EC2ResponseError(
+                        400, 'Bad Request', 'InstanceLimitExceeded')):
+                instance.run_instances(ctx=contexts[2], warm_pool_size=2)
+            instance.start(ctx=contexts[2])
+
+        instance_id = \
+            contexts[2].instance.runtime_properties['aws_resource_id']
+        self.assertIn(instance_id, [pool_instance.id
+                                    for pool_instance in pool_instances])
+        instance_object = \
+            ec2_client.get_only_instances(instance_ids=[instance_id])[0]
+        self.assertEqual('running', instance_object.state)
+        self.assertNotIn(constants.WARM_POOL_TAG, instance_object.tags)
+        self.assertIn(constants.WARM_POOL_CLAIM_TAG, instance_object.tags)
+        self.assertEqual(
+            ['stopped'],
+            [pool_instance.state for pool_instance in
+             ec2_client.get_only_instances(filters=pool_filter)])
+        self.assertEqual(
+            ec2_client.get_all_reservations(instance_ids=[instance_id])[0].id,
+            contexts[2].instance.runtime_properties['reservation_id'])
+
+        with mock.patch.dict(os.environ, {
+                constants.CLAIM_TABLE_DIR_ENV_VAR_NAME: pool_dir}):
+            warm_pool = pool.get_warm_pool(
+                contexts[0].instance.runtime_properties[
+                    constants.WARM_POOL_SIGNATURE])
+            for ctx in contexts:
+                current_ctx.set(ctx=ctx)
+                instance.terminate(ctx=ctx)
+                self.assertNotIn(constants.WARM_POOL_SIGNATURE,
+                                 ctx.instance.runtime_properties)
+                self.assertEqual(
+                    ctx is contexts[-1],
+                    all(pool_instance.state == 'terminated'
+                        for pool_instance in
+                        ec2_client.get_only_instances(filters=pool_filter)))
+
+        self.assertFalse(os.path.isfile(warm_pool.path))
+
+    @mock_ec2
+    def test_warm_pool_signature(self):
+        """ this tests that the warm pool signature covers all of the
+        parameters, and that a pool is refused for a private IP address.
+        """
+
+        ctx = self.mock_ctx('test_warm_pool_signature')
+        current_ctx.set(ctx=ctx)
+        block_device_maps = [BlockDeviceMapping() for _ in range(2)]
+        block_device_maps[0]['/dev/sda1'] = BlockDeviceType(size=20)
+        block_device_maps[1]['/dev/sda1'] = BlockDeviceType(size=30)
+        parameters = dict(image_id=TEST_AMI_IMAGE_ID,
+                          security_group_ids=['sg-2', 'sg-1'])
+
+        self.assertEqual(
+            pool.get_signature(parameters),
+            pool.get_signature(
+                dict(parameters, security_group_ids=['sg-1', 'sg-2'])))
+        signatures = set(
+            [pool.get_signature(parameters),
+             pool.get_signature(dict(parameters, instance_profile_name='a'))]
+            + [pool.get_signature(dict(parameters, block_device_map=mapping))
+               for mapping in block_device_maps])
+        self.assertEqual(4, len(signatures))
+
+        ctx.node.properties['parameters']['private_ip_address'] = '10.0.0.5'
+        with self.assertRaisesRegexp(NonRecoverableError, 'private_ip'):
+            instance.run_instances(ctx=ctx, warm_pool_size=2)
+
     @mock_ec2
     def test_terminate_clean(self):
         """ this tests that the instance.terminate function
@@ -522,6 +750,88 @@ class TestInstance(testtools.TestCase):
             'Not external resource, but the supplied',
             ex.message)
 
+    def mock_deployment(self, external):
+        """ Creates an instance and its image, and the mock contexts of
+        instance nodes, which use the instance if they are external,
+        and a REST client that lists them.
+        """
+
+        ec2_client = EC2Connection()
+        instance_id = ec2_client.run_instances(
+            TEST_AMI_IMAGE_ID,
+            instance_type=TEST_INSTANCE_TYPE).instances[0].id
+        image_id = ec2_client.create_image(instance_id, 'image')
+        type_hierarchy = ['cloudify.nodes.Root', 'cloudify.nodes.Compute',
+                          'cloudify.aws.nodes.Instance']
+        contexts = []
+        for n, use_external_resource in enumerate(external):
+            ctx = self.mock_ctx('vm_{0}'.format(n))
+            ctx.node.type_hierarchy = type_hierarchy
+            ctx.node.properties['resource_id'] = \
+                instance_id if use_external_resource else ''
+            ctx.node.properties['image_id'] = image_id
+            ctx.node.properties['use_external_resource'] = \
+                use_external_resource
+            contexts.append(ctx)
+            ctx._context['deployment_id'] = contexts[0].deployment.id
+
+        rest_client = mock.Mock()
+        rest_client.nodes.list.return_value = [
+            mock.Mock(id=node_ctx.node.id, type_hierarchy=type_hierarchy,
+                      properties=node_ctx.node.properties)
+            for node_ctx in contexts]
+        rest_client.node_instances.list.return_value = [
+            mock.Mock(id=node_ctx.instance.id, node_id=node_ctx.node.id)
+            for node_ctx in contexts]
+
+        return contexts, rest_client
+
+    @mock_ec2
+    def test_creation_validation_preflight(self):
+        """ this tests that the creation_validation of all of the
+        instances of a deployment share one DescribeInstances and
+        one DescribeImages call.
+        """
+
+        contexts, rest_client = self.mock_deployment([False, False, True])
+        actions = []
+
+        with mock.patch.dict(os.environ, {
+                constants.CLAIM_TABLE_DIR_ENV_VAR_NAME: tempfile.mkdtemp()}), \
+                mock.patch('cloudify.manager.get_rest_client',
+                           return_value=rest_client), \
+                mock.patch('core.metrics.record',
+                           side_effect=lambda action, *_: actions.append(
+                               action)):
+            for ctx in contexts:
+                current_ctx.set(ctx=ctx)
+                instance.creation_validation(ctx=ctx)
+
+        self.assertEqual(['DescribeImages', 'DescribeInstances'],
+                         sorted(actions))
+
+    @mock_ec2
+    def test_creation_validation_preflight_describe_error(self):
+        """ this tests that the nodes of a resource type that the
+        pre-flight fails to describe fall back to their own describe.
+        """
+
+        contexts, rest_client = self.mock_deployment([False, True])
+        unauthorized = EC2ResponseError(
+            403, 'Forbidden', 'UnauthorizedOperation')
+
+        with mock.patch.dict(os.environ, {
+                constants.CLAIM_TABLE_DIR_ENV_VAR_NAME: tempfile.mkdtemp()}), \
+                mock.patch('cloudify.manager.get_rest_client',
+                           return_value=rest_client), \
+                mock.patch.object(EC2Connection, 'get_only_instances',
+                                  side_effect=unauthorized) as describe:
+            for ctx in contexts:
+                current_ctx.set(ctx=ctx)
+                instance.creation_validation(ctx=ctx)
+
+        self.assertEqual(1, describe.call_count)
+
     @mock_ec2
     def test_no_instance_get_instance_from_id(self):
         """ this tests that a NonRecoverableError is thrown
@@ -621,6 +931,74 @@ class TestInstance(testtools.TestCase):
                 'Invalid id:'):
             instance.creation_validation(ctx=ctx)
 
+    @mock_ec2
+    def test_block_device_map_from_image_cache(self):
+        """This tests that the block_device_map parameter is built from
+        the cached AMI metadata, and that the AMI is described once.
+        """
+
+        ctx = self.mock_ctx('test_block_device_map_from_image_cache')
+        current_ctx.set(ctx=ctx)
+        ec2_client = EC2Connection()
+        instance_id = ec2_client.run_instances(
+            TEST_AMI_IMAGE_ID,
+            instance_type=TEST_INSTANCE_TYPE).instances[0].id
+        image_id = ec2_client.create_image(instance_id, 'image')
+        snapshot_id = \
+            ec2_client.get_image(image_id).block_device_mapping[
+                '/dev/sda1'].snapshot_id
+        ctx.node.properties['image_id'] = image_id
+        ctx.node.properties['parameters']['block_device_map'] = {
+            '/dev/sda1': {'size': 20, 'volume_type': 'gp2'}}
+        actions = []
+
+        cache_dir = tempfile.mkdtemp()
+
+        with mock.patch.dict(os.environ, {
+                constants.DESCRIBE_CACHE_DIR_ENV_VAR_NAME: cache_dir}), \
+                mock.patch('core.metrics.record',
+                           side_effect=lambda action, *_: actions.append(
+                               action)):
+            for _ in range(2):
+                block_device_map = \
+                    instance._get_instance_parameters()['block_device_map']
+
+        root_device = block_device_map['/dev/sda1']
+        self.assertEqual(20, root_device.size)
+        self.assertEqual('gp2', root_device.volume_type)
+        self.assertEqual(snapshot_id, root_device.snapshot_id)
+        self.assertEqual(['DescribeImages'], actions)
+
+    @mock_ec2
+    def test_image_cache_is_keyed_by_access_key_id(self):
+        """This tests that an AMI cached for one access key ID is
+        described again for another.
+        """
+
+        ctx = self.mock_ctx('test_image_cache_is_keyed_by_access_key_id')
+        current_ctx.set(ctx=ctx)
+        ec2_client = EC2Connection()
+        instance_id = ec2_client.run_instances(
+            TEST_AMI_IMAGE_ID,
+            instance_type=TEST_INSTANCE_TYPE).instances[0].id
+        image_id = ec2_client.create_image(instance_id, 'image')
+        actions = []
+
+        cache_dir = tempfile.mkdtemp()
+
+        with mock.patch.dict(os.environ, {
+                constants.DESCRIBE_CACHE_DIR_ENV_VAR_NAME: cache_dir}), \
+                mock.patch('core.metrics.record',
+                           side_effect=lambda action, *_: actions.append(
+                               action)):
+            for access_key_id in ['first', 'first', 'second']:
+                images.get_image_cache().get(
+                    throttle.throttle_client(
+                        EC2Connection(access_key_id, 'secret')),
+                    image_id)
+
+        self.assertEqual(['DescribeImages', 'DescribeImages'], actions)
+
     @mock_ec2
     def test_start_and_tag_name(self):
         """ this tests that the instance start function
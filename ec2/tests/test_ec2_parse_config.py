@@ -19,6 +19,7 @@ import tempfile
 from ConfigParser import ConfigParser
 
 # Third Party Imports
+import mock
 import testtools
 from nose.tools import nottest
 
@@ -101,6 +102,28 @@ class TestParser(testtools.TestCase):
             for opt in opt_group:
                 self.assertIn(opt, config)
 
+    @test_config(type="valid")
+    def test_aws_config_file_parsed_once_per_change(self):
+        client = connection.EC2ConnectionClient()
+        config_path = os.environ[constants.AWS_CONFIG_PATH_ENV_VAR_NAME]
+
+        with mock.patch.object(
+                connection.EC2ConnectionClient, '_read_config_file',
+                wraps=client._read_config_file) as read_config_file:
+            first = client._get_aws_config_from_file()
+            connection.ELBConnectionClient()._get_aws_config_from_file()
+            self.assertEqual(1, read_config_file.call_count)
+
+            first['aws_access_key_id'] = 'changed'
+            self.assertEqual('aws_access_key_id',
+                             client._get_aws_config_from_file()
+                             ['aws_access_key_id'])
+
+            with open(config_path, 'a') as config_file:
+                config_file.write('\n')
+            client._get_aws_config_from_file()
+            self.assertEqual(2, read_config_file.call_count)
+
     @test_config(type="no_file")
     def test_aws_config_no_file(self):
         client = connection.EC2ConnectionClient()
@@ -18,7 +18,9 @@ import testtools
 import uuid
 
 # Third Party Imports
+import mock
 from moto import mock_ec2
+from boto.vpc import VPCConnection
 
 # Cloudify Imports is imported and used in operations
 from ec2 import constants
@@ -306,6 +308,57 @@ class TestSecurityGroup(testtools.TestCase):
                 group.id)
             self.assertEqual(group.id, output.id)
 
+    @mock_ec2
+    def test_get_security_group_from_name_in_vpc(self):
+        """This tests that a group looked up by name is the one in
+        the given VPC.
+        """
+
+        test_properties = self.get_mock_properties()
+        ctx = self.security_group_mock(
+            'test_get_security_group_from_name_in_vpc', test_properties)
+        current_ctx.set(ctx=ctx)
+        vpc_client = VPCConnection()
+        groups = [vpc_client.create_security_group(
+            'shared_name', 'this is test',
+            vpc_id=vpc_client.create_vpc('10.0.0.0/16').id)
+            for _ in range(2)]
+
+        index = securitygroup.SecurityGroupIndex(vpc_client)
+        for group in reversed(groups):
+            output = index.get('shared_name', group.vpc_id)
+            self.assertEqual(group.id, output.id)
+
+    @mock_ec2
+    def test_security_group_index(self):
+        """ This tests that the index answers repeated lookups by ID and
+        name from one describe, and recognizes 17 character IDs.
+        """
+
+        test_properties = self.get_mock_properties()
+        ctx = self.security_group_mock(
+            'test_security_group_index', test_properties)
+        current_ctx.set(ctx=ctx)
+        ec2_client = connection.EC2ConnectionClient().client()
+        group = ec2_client.create_security_group(
+            'test_security_group_index', 'this is test')
+        index = securitygroup.SecurityGroupIndex(ec2_client)
+
+        with mock.patch.object(
+                ec2_client, 'get_all_security_groups',
+                wraps=ec2_client.get_all_security_groups) as describe:
+            self.assertEqual(group.id, index.get(group.id).id)
+            self.assertEqual(group.id, index.get(group.id).id)
+            self.assertEqual(
+                group.id, index.get('test_security_group_index').id)
+            self.assertIsNone(index.get('sg-0123456789abcdef0'))
+            index.discard(group.id)
+            self.assertIsNone(index.by_name.get('test_security_group_index'))
+
+        self.assertEqual(
+            [{'group-id': group.id}, {'group-id': 'sg-0123456789abcdef0'}],
+            [call[1]['filters'] for call in describe.call_args_list])
+
     @mock_ec2
     def test_get_all_groups(self):
         """ This tests that all created groups are returned
@@ -401,6 +454,160 @@ class TestSecurityGroup(testtools.TestCase):
             str(ec2_client.get_all_security_groups(
                 groupnames='test_create_group_rules_src_group')[0].rules))
 
+    @mock_ec2
+    def test_create_group_rules_single_request(self):
+        """ This tests that _create_group_rules resolves the source
+        groups with one describe, merges and dedupes the rules and
+        authorizes them with one request.
+        """
+
+        ec2_client = connection.EC2ConnectionClient().client()
+        vpc_id = VPCConnection().create_vpc('10.0.0.0/16').id
+        test_properties = self.get_mock_properties()
+        ctx = self.security_group_mock(
+            'test_create_group_rules_single_request', test_properties)
+        current_ctx.set(ctx=ctx)
+        src_group = ec2_client.create_security_group(
+            'source', 'this is test', vpc_id=vpc_id)
+        ctx.node.properties['rules'].extend([
+            dict(ip_protocol='tcp', from_port='22', to_port='22',
+                 cidr_ip='127.0.0.1/32'),
+            dict(ip_protocol='tcp', from_port='22', to_port='22',
+                 cidr_ip='10.0.0.0/8'),
+            dict(ip_protocol='tcp', from_port='443', to_port='443',
+                 src_group_id='source'),
+            dict(ip_protocol='tcp', from_port='443', to_port='443',
+                 src_group_id=src_group.id)
+        ])
+        group = ec2_client.create_security_group(
+            'test_create_group_rules_single_request', 'this is test',
+            vpc_id=vpc_id)
+
+        with mock.patch.object(
+                ec2_client, 'get_all_security_groups',
+                wraps=ec2_client.get_all_security_groups) as describe, \
+                mock.patch.object(
+                    group.connection, 'get_status',
+                    wraps=group.connection.get_status) as get_status:
+            securitygroup._create_group_rules(group)
+
+        self.assertEqual(1, describe.call_count)
+        self.assertEqual(1, get_status.call_count)
+        rules = ec2_client.get_all_security_groups(
+            group_ids=[group.id])[0].rules
+        self.assertEqual(str(group.rules), str(rules))
+        self.assertEqual(
+            [2, 1, 1], [len(rule.grants) for rule in rules])
+
+    @mock_ec2
+    def test_create_group_rules_classic_src_groups(self):
+        """ This tests that without a VPC, _create_group_rules only
+        describes the source groups that the rules reference.
+        """
+
+        ec2_client = connection.EC2ConnectionClient().client()
+        test_properties = self.get_mock_properties()
+        ctx = self.security_group_mock(
+            'test_create_group_rules_classic_src_groups', test_properties)
+        current_ctx.set(ctx=ctx)
+        by_id = ec2_client.create_security_group('by_id', 'this is test')
+        ec2_client.create_security_group('by_name', 'this is test')
+        ctx.node.properties['rules'] = [
+            dict(ip_protocol='tcp', from_port='22', to_port='22',
+                 src_group_id=by_id.id),
+            dict(ip_protocol='tcp', from_port='443', to_port='443',
+                 src_group_id='by_name')
+        ]
+        group = ec2_client.create_security_group(
+            'test_create_group_rules_classic_src_groups', 'this is test')
+
+        with mock.patch.object(
+                ec2_client, 'get_all_security_groups',
+                wraps=ec2_client.get_all_security_groups) as describe:
+            securitygroup._create_group_rules(group)
+
+        self.assertEqual(
+            [{'group-id': [by_id.id]}, {'group-name': ['by_name']}],
+            [call[1]['filters'] for call in describe.call_args_list])
+        rules = ec2_client.get_all_security_groups(
+            group_ids=[group.id])[0].rules
+        self.assertEqual(
+            ['by_id', 'by_name'],
+            sorted(rule.grants[0].name for rule in rules))
+
+    @mock_ec2
+    def test_update_rules(self):
+        """ This tests that update_rules authorizes the added rules and
+        revokes the removed ones, with one request each.
+        """
+
+        test_properties = self.get_mock_properties()
+        ctx = self.security_group_mock('test_update_rules', test_properties)
+        current_ctx.set(ctx=ctx)
+        ec2_client = connection.EC2ConnectionClient().client()
+        group = ec2_client.create_security_group(
+            'test_update_rules', 'this is test')
+        securitygroup._create_group_rules(group)
+        ctx.instance.runtime_properties['aws_resource_id'] = group.id
+        original_rules = list(ctx.node.properties['rules'])
+        ctx.node.properties['rules'][1] = dict(
+            ip_protocol='tcp', from_port='443', to_port='443',
+            cidr_ip='127.0.0.1/32')
+
+        # Both updates share the operation cache, as two executions
+        # on the same worker could.
+        with mock.patch.object(
+                ec2_client, 'get_status',
+                wraps=ec2_client.get_status) as get_status, \
+                mock.patch('core.metrics.operation_key',
+                           return_value=('d', 'update_rules', 'i')):
+            securitygroup.update_rules(ctx=ctx)
+            rules = ec2_client.get_all_security_groups(
+                group_ids=[group.id])[0].rules
+            self.assertEqual(
+                ['22', '443'], sorted(rule.from_port for rule in rules))
+            securitygroup.update_rules(rules=original_rules, ctx=ctx)
+
+        self.assertEqual(
+            ['AuthorizeSecurityGroupIngress', 'RevokeSecurityGroupIngress'] *
+            2, [call[0][0] for call in get_status.call_args_list])
+        rules = ec2_client.get_all_security_groups(
+            group_ids=[group.id])[0].rules
+        self.assertEqual(
+            ['22', '80'], sorted(rule.from_port for rule in rules))
+
+    @mock_ec2
+    def test_update_rules_normalized_by_aws(self):
+        """ This tests that update_rules leaves all traffic and ICMP
+        rules alone when AWS returns them with protocol numbers and
+        without ports.
+        """
+
+        test_properties = self.get_mock_properties()
+        ctx = self.security_group_mock(
+            'test_update_rules_normalized_by_aws', test_properties)
+        current_ctx.set(ctx=ctx)
+        ec2_client = connection.EC2ConnectionClient().client()
+        group = ec2_client.create_security_group(
+            'test_update_rules_normalized_by_aws', 'this is test')
+        # As AWS returns them.
+        group.authorize('-1', None, None, '10.0.0.0/8')
+        group.authorize('icmp', -1, -1, '127.0.0.1/32')
+        ctx.instance.runtime_properties['aws_resource_id'] = group.id
+        ctx.node.properties['rules'] = [
+            dict(ip_protocol='-1', from_port=-1, to_port=-1,
+                 cidr_ip='10.0.0.0/8'),
+            dict(ip_protocol='1', from_port='-1', to_port='-1',
+                 cidr_ip='127.0.0.1/32')
+        ]
+
+        with mock.patch.object(
+                ec2_client, 'get_status',
+                wraps=ec2_client.get_status) as get_status:
+            securitygroup.update_rules(ctx=ctx)
+
+        self.assertEqual(0, get_status.call_count)
+
     @mock_ec2
     def test_create_external_securitygroup_not_external(self):
         """ This checks that _create_external_securitygroup
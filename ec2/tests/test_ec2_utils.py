@@ -14,10 +14,13 @@
 #    * limitations under the License.
 
 # Builtin Imports
+import os
+import gzip
 import tempfile
 import testtools
 
 # Third Party Imports
+import mock
 from moto import mock_ec2
 from boto.ec2 import EC2Connection
 
@@ -34,7 +37,7 @@ TEST_INSTANCE_TYPE = 't1.micro'
 
 class TestUtils(testtools.TestCase):
 
-    def mock_ctx(self, test_name):
+    def mock_ctx(self, test_name, deployment_id=None):
 
         test_node_id = test_name
         test_properties = {
@@ -63,6 +66,7 @@ class TestUtils(testtools.TestCase):
 
         ctx = MockCloudifyContext(
             node_id=test_node_id,
+            deployment_id=deployment_id,
             properties=test_properties,
             provider_context=provider_context
         )
@@ -87,6 +91,34 @@ class TestUtils(testtools.TestCase):
         current_ctx.set(ctx=ctx)
         utils.log_available_resources(list_of_resources)
 
+    def test_log_available_resources_summary(self):
+        ctx = self.mock_ctx('test_log_available_resources_summary')
+        current_ctx.set(ctx=ctx)
+        inventory_dir = tempfile.mkdtemp()
+        resources = [
+            mock.Mock(state='running' if n % 3 else 'stopped',
+                      vpc_id='vpc-1234abcd', __str__=lambda self: 'i-res')
+            for n in range(30)]
+
+        with mock.patch.object(ctx.logger, 'debug') as debug, \
+                mock.patch.dict(os.environ, {
+                    constants.INVENTORY_DIR_ENV_VAR_NAME: inventory_dir}):
+            utils.log_available_resources(iter(resources), limit=5)
+
+        lines = debug.call_args[0][0].splitlines()
+        self.assertEqual('Available resources: 30', lines[0])
+        self.assertIn('  20 in state running, VPC vpc-1234abcd', lines)
+        self.assertIn('  10 in state stopped, VPC vpc-1234abcd', lines)
+        self.assertEqual(5, lines.count('i-res'))
+        inventory_path = lines[-1].split()[-1]
+        self.assertEqual(30, len(gzip.open(inventory_path).readlines()))
+
+        with mock.patch.object(ctx.logger, 'debug') as debug:
+            consumed = iter(resources)
+            utils.log_available_resources(consumed)
+        self.assertFalse(debug.called)
+        self.assertEqual(30, len(list(consumed)))
+
     @mock_ec2
     def test_get_provider_variable(self):
         ctx = self.mock_ctx('test_get_provider_variables')
@@ -291,3 +323,56 @@ class TestUtils(testtools.TestCase):
             ctx.instance)
 
         self.assertEquals(0, len(output))
+
+    def test_wait_for(self):
+
+        results = iter([None, False, 'ready'])
+        with mock.patch('time.sleep') as sleep:
+            output = utils.wait_for(lambda: next(results),
+                                    timeout=10, delay=1, max_delay=1.5)
+        self.assertEquals('ready', output)
+        self.assertEquals(2, sleep.call_count)
+        for call in sleep.call_args_list:
+            self.assertTrue(0.5 <= call[0][0] <= 1.5)
+
+    def test_wait_for_timeout(self):
+
+        condition = mock.Mock(return_value=False)
+        self.assertFalse(utils.wait_for(condition, timeout=0))
+        self.assertEquals(1, condition.call_count)
+
+    @mock_ec2
+    def test_add_tag_single_call(self):
+
+        ctx = self.mock_ctx('test_add_tag_single_call', 'test_deployment')
+        ctx.node.properties['tags'] = {'owner': 'test'}
+        current_ctx.set(ctx=ctx)
+        client = EC2Connection()
+        volume = client.create_volume(1, 'us-east-1a')
+
+        with mock.patch.object(EC2Connection, 'create_tags',
+                               wraps=client.create_tags) as create_tags:
+            utils.add_tag(volume)
+
+        self.assertEquals(1, create_tags.call_count)
+        tags = client.get_all_volumes(volume_ids=[volume.id])[0].tags
+        self.assertEquals('test', tags['owner'])
+        self.assertEquals(ctx.instance.id, tags['resource_id'])
+        self.assertIn('Name', tags)
+        self.assertEquals('test_deployment', tags['deployment_id'])
+
+    @mock_ec2
+    def test_add_tags_to_resources(self):
+
+        client = EC2Connection()
+        volume_ids = [client.create_volume(1, 'us-east-1a').id
+                      for _ in range(3)]
+
+        with mock.patch.object(EC2Connection, 'create_tags',
+                               wraps=client.create_tags) as create_tags:
+            utils.add_tags_to_resources(client, volume_ids, {'Name': 'a'})
+            utils.add_tags_to_resources(client, [], {'Name': 'a'})
+
+        self.assertEquals(1, create_tags.call_count)
+        for volume in client.get_all_volumes(volume_ids=volume_ids):
+            self.assertEquals('a', volume.tags['Name'])
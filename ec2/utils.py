@@ -15,7 +15,14 @@
 
 # Built-in Imports
 import os
+import re
+import gzip
+import time
 import uuid
+import random
+import logging
+import itertools
+from collections import Counter
 
 # Cloudify Imports
 from ec2 import constants
@@ -37,16 +44,113 @@ def validate_node_property(key, ctx_node_properties):
             '{0} is a required input. Unable to create.'.format(key))
 
 
-def log_available_resources(list_of_resources):
-    """This logs a list of available resources.
+def is_cidr_block(value):
+    """Checks if a value is an IPv4 CIDR block, e.g. 10.0.0.0/16."""
+
+    try:
+        address, prefix = value.split('/')
+        octets = [int(octet) for octet in address.split('.')]
+        return len(octets) == 4 and \
+            all(0 <= octet <= 255 for octet in octets) and \
+            0 <= int(prefix) <= 32
+    except (AttributeError, ValueError):
+        return False
+
+
+def log_available_resources(
+        list_of_resources,
+        limit=constants.AVAILABLE_RESOURCES_LOG_LIMIT,
+        scan_limit=constants.AVAILABLE_RESOURCES_SCAN_LIMIT):
+    """Logs a summary of a list or iterator of available resources
+    at debug level: their counts per state and VPC, and the first limit
+    of them. Only the first scan_limit resources are read, and none if
+    debug logging is disabled.
+
+    If the AWS_INVENTORY_DIR environment variable is set, all of the
+    resources are also written to a gzip file in that directory.
     """
 
-    message = 'Available resources: \n'
+    inventory_dir = os.environ.get(constants.INVENTORY_DIR_ENV_VAR_NAME)
+
+    if not inventory_dir and not ctx.logger.isEnabledFor(logging.DEBUG):
+        return
 
-    for resource in list_of_resources:
-        message = '{0}{1}\n'.format(message, resource)
+    resources = iter(list_of_resources)
+    if not inventory_dir:
+        resources = itertools.islice(resources, scan_limit + 1)
 
-    ctx.logger.debug(message)
+    inventory_path = None
+    inventory_file = None
+    if inventory_dir:
+        inventory_path = os.path.join(
+            inventory_dir, '{0}-{1}.inventory.gz'.format(
+                ctx.deployment.id, int(time.time())))
+        inventory_file = gzip.open(inventory_path, 'wb')
+
+    count = 0
+    counts = Counter()
+    sample = []
+    try:
+        for resource in resources:
+            count += 1
+            description = '{0}'.format(resource)
+            state = getattr(resource, 'state', None) or \
+                getattr(resource, 'status', None)
+            vpc_id = getattr(resource, 'vpc_id', None)
+            if inventory_file:
+                inventory_file.write('{0}\t{1}\t{2}\n'.format(
+                    description, state, vpc_id))
+            if count > scan_limit:
+                continue
+            counts[(state, vpc_id)] += 1
+            if count <= limit:
+                sample.append(description)
+    finally:
+        if inventory_file:
+            inventory_file.close()
+
+    lines = ['Available resources: {0}{1}'.format(
+        min(count, scan_limit), '+' if count > scan_limit else '')]
+    lines.extend('  {0} in state {1}, VPC {2}'.format(number, state, vpc_id)
+                 for (state, vpc_id), number in counts.most_common())
+    lines.extend(sample)
+    if count > limit:
+        lines.append('(only the first {0} are listed)'.format(limit))
+    if inventory_path:
+        lines.append('All {0} resources are listed in {1}'.format(
+            count, inventory_path))
+
+    ctx.logger.debug('\n'.join(lines))
+
+
+def wait_for(condition, timeout=constants.WAITER_TIMEOUT,
+             delay=constants.WAITER_INITIAL_DELAY,
+             max_delay=constants.WAITER_MAX_DELAY):
+    """Polls a condition in-process until it is met or the timeout
+    is exhausted, so that resources which become ready within seconds
+    do not cost a full ctx.operation.retry cycle. The delay between polls
+    doubles up to max_delay, with jitter.
+
+    :param condition: A callable that takes no arguments.
+    :param timeout: How many seconds to poll for. 0 checks only once.
+    :param delay: The delay in seconds before the second check.
+    :param max_delay: The maximum delay in seconds between checks.
+    :returns the last value returned by condition.
+    """
+
+    deadline = time.time() + timeout
+    result = condition()
+
+    while not result:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+        time.sleep(min(delay / 2.0 + random.uniform(0, delay / 2.0),
+                       remaining))
+        delay = min(delay * 2, max_delay)
+        result = condition()
+
+    return result
 
 
 def get_external_resource_id_or_raise(operation, ctx_instance):
@@ -228,25 +332,79 @@ def get_connected_nodes_by_type(ctx, type_name):
                 constants.AWS_TYPE_PROPERTY) == type_name]
 
 
-def add_tag(resource):
+def get_tags():
+    """Returns the full set of tags of the current node instance:
+    the tags node property, Name, resource_id and deployment_id.
+    """
 
-    name = ctx.node.properties.get('name')
-    if name:
-        _add_tag(resource, 'Name', name)
-    else:
-        _add_tag(resource, 'Name', str(uuid.uuid4()))
+    tags = dict(ctx.node.properties.get('tags') or {})
+    tags['Name'] = ctx.node.properties.get('name') or \
+        tags.get('Name') or str(uuid.uuid4())
+    tags['resource_id'] = ctx.instance.id
+    if ctx.deployment.id:
+        tags['deployment_id'] = ctx.deployment.id
 
-    _add_tag(resource, 'resource_id', ctx.instance.id)
-    _add_tag(resource, 'deployment_id', ctx.deployment.id)
+    return tags
 
 
-def _add_tag(resource, tag_key, tag_value):
+def add_tag(resource):
 
     try:
-        output = resource.add_tag(tag_key, tag_value)
+        output = resource.add_tags(get_tags())
     except (exception.EC2ResponseError,
             exception.BotoServerError) as e:
         raise NonRecoverableError(
             'unable to tag resource name: {0}'.format(str(e)))
 
     return output
+
+
+def add_tags_to_resources(client, resource_ids, tags):
+    """Applies the same tags to several resources in a single
+    CreateTags call.
+
+    :param client: The EC2 or VPC connection.
+    :param resource_ids: A list of AWS resource IDs.
+    :param tags: A dictionary of tags.
+    """
+
+    if not resource_ids:
+        return None
+
+    try:
+        output = client.create_tags(list(resource_ids), tags)
+    except (exception.EC2ResponseError,
+            exception.BotoServerError) as e:
+        raise NonRecoverableError(
+            'unable to tag resources {0}: {1}'.format(resource_ids, str(e)))
+
+    return output
+
+
+def describe_existing(describe_function, argument, resource_ids):
+    """Describes resources by ID. The IDs that AWS reports as missing
+    or malformed are dropped, and the others are described again.
+
+    :param describe_function: A boto get_all_* function.
+    :param argument: The IDs argument of describe_function.
+    :returns a list of the resources that exist.
+    :raises NonRecoverableError: If Boto errors.
+    """
+
+    resource_ids = list(resource_ids)
+
+    while resource_ids:
+        try:
+            return describe_function(**{argument: resource_ids})
+        except exception.EC2ResponseError as e:
+            missing = [resource_id for resource_id in resource_ids
+                       if re.search(r'\b{0}\b'.format(
+                           re.escape(resource_id)), str(e))]
+            if not missing:
+                raise NonRecoverableError('{0}'.format(str(e)))
+            resource_ids = [resource_id for resource_id in resource_ids
+                            if resource_id not in missing]
+        except exception.BotoServerError as e:
+            raise NonRecoverableError('{0}'.format(str(e)))
+
+    return []
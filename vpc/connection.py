@@ -18,7 +18,7 @@ from boto.ec2 import get_region
 from boto.vpc import VPCConnection
 
 # Cloudify imports
-from ec2.connection import EC2ConnectionClient
+from ec2.connection import EC2ConnectionClient, get_pooled_connection
 from ec2 import utils as ec2_utils
 from ec2 import constants
 
@@ -34,7 +34,7 @@ class VPCConnectionClient(EC2ConnectionClient):
         aws_config_property = (self._get_aws_config_property(aws_config) or
                                self._get_aws_config_from_file())
         if not aws_config_property:
-            return VPCConnection()
+            return get_pooled_connection('vpc', VPCConnection, {})
         elif aws_config_property.get('ec2_region_name'):
             region_object = \
                 get_region(aws_config_property['ec2_region_name'])
@@ -54,7 +54,7 @@ class VPCConnectionClient(EC2ConnectionClient):
         if 'ec2_region_endpoint' in aws_config:
             del(aws_config["ec2_region_endpoint"])
 
-        return VPCConnection(**aws_config)
+        return get_pooled_connection('vpc', VPCConnection, aws_config)
 
     def _get_aws_config_property(self, aws_config=None):
         if aws_config:
@@ -47,7 +47,9 @@ NETWORK_ACL = dict(
     CLOUDIFY_NODE_TYPE='cloudify.aws.nodes.ACL',
     ID_FORMAT='^acl\-[0-9a-z]{8}$',
     NOT_FOUND_ERROR='InvalidNetworkAclID.NotFound',
-    REQUIRED_PROPERTIES=[]
+    REQUIRED_PROPERTIES=[],
+    ENTRY_REQUIRED_PROPERTIES=[
+        'rule_number', 'protocol', 'rule_action', 'cidr_block']
 )
 
 INTERNET_GATEWAY = dict(
@@ -16,36 +16,43 @@
 # Cloudify imports
 from . import constants
 from core.base import AwsBaseNode, AwsBaseRelationship
+from core import metrics
 from cloudify import ctx
 from cloudify.decorators import operation
 
 
 @operation
+@metrics.summarize_api_calls
 def creation_validation(**_):
     return DhcpOptions().creation_validation()
 
 
 @operation
+@metrics.summarize_api_calls
 def create_dhcp_options(**_):
     return DhcpOptions().created()
 
 
 @operation
+@metrics.summarize_api_calls
 def start_dhcp_options(**_):
     return DhcpOptions().started()
 
 
 @operation
+@metrics.summarize_api_calls
 def delete_dhcp_options(**_):
     return DhcpOptions().deleted()
 
 
 @operation
+@metrics.summarize_api_calls
 def associate_dhcp_options(**_):
     return DhcpAssociation().associated()
 
 
 @operation
+@metrics.summarize_api_calls
 def restore_dhcp_options(**_):
     return DhcpAssociation().disassociated()
 
@@ -17,11 +17,13 @@
 from ec2 import utils as ec2_utils
 from . import constants
 from core.base import AwsBaseNode, AwsBaseRelationship
+from core import metrics
 from cloudify import ctx
 from cloudify.decorators import operation
 
 
 @operation
+@metrics.summarize_api_calls
 def creation_validation(**_):
     if 'cloudify.aws.nodes.InternetGateway' in ctx.node.type_hierarchy:
         return InternetGateway().creation_validation()
@@ -32,6 +34,7 @@ def creation_validation(**_):
 
 
 @operation
+@metrics.summarize_api_calls
 def create_internet_gateway(**_):
     return InternetGateway().created()
 
@@ -41,56 +44,67 @@ def start_internet_gateway(**_):
 
 
 @operation
+@metrics.summarize_api_calls
 def delete_internet_gateway(**_):
     return InternetGateway().deleted()
 
 
 @operation
+@metrics.summarize_api_calls
 def create_vpn_gateway(**_):
     return VpnGateway().created()
 
 
 @operation
+@metrics.summarize_api_calls
 def start_vpn_gateway(**_):
     return VpnGateway().started()
 
 
 @operation
+@metrics.summarize_api_calls
 def delete_vpn_gateway(**_):
     return VpnGateway().deleted()
 
 
 @operation
+@metrics.summarize_api_calls
 def create_customer_gateway(**_):
     return CustomerGateway().created()
 
 
 @operation
+@metrics.summarize_api_calls
 def start_customer_gateway(**_):
     return CustomerGateway().started()
 
 
 @operation
+@metrics.summarize_api_calls
 def delete_customer_gateway(**_):
     return CustomerGateway().deleted()
 
 
 @operation
+@metrics.summarize_api_calls
 def create_vpn_connection(routes, **_):
     return VpnConnection(routes).associated()
 
 
 @operation
+@metrics.summarize_api_calls
 def delete_vpn_connection(**_):
     return VpnConnection().disassociated()
 
 
 @operation
+@metrics.summarize_api_calls
 def attach_gateway(**_):
     return GatewayVpcAttachment().associated()
 
 
 @operation
+@metrics.summarize_api_calls
 def detach_gateway(**_):
     return GatewayVpcAttachment().disassociated()
 
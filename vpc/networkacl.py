@@ -13,41 +13,52 @@
 #    * See the License for the specific language governing permissions and
 #    * limitations under the License.
 
+# Built-in Imports
+import time
+
 # Cloudify imports
 from ec2 import utils as ec2_utils
 from . import constants
 from core.base import AwsBaseNode, AwsBaseRelationship
+from core import metrics
+from core import workers
 from cloudify import ctx
 from cloudify.decorators import operation
 from cloudify.exceptions import NonRecoverableError
 
 
 @operation
+@metrics.summarize_api_calls
 def creation_validation(**_):
     return NetworkAcl().creation_validation()
 
 
 @operation
+@metrics.summarize_api_calls
 def create_network_acl(**_):
     return NetworkAcl().created()
 
 
 @operation
+@metrics.summarize_api_calls
 def start_network_acl(**_):
     return NetworkAcl().started()
 
 
 @operation
+@metrics.summarize_api_calls
 def delete_network_acl(**_):
     return NetworkAcl().deleted()
 
 
 @operation
+@metrics.summarize_api_calls
 def associate_network_acl(**_):
     return NetworkAclSubnetAssociation().associated()
 
 
 @operation
+@metrics.summarize_api_calls
 def disassociate_network_acl(**_):
     return NetworkAclSubnetAssociation().disassociated()
 
@@ -109,13 +120,20 @@ class NetworkAcl(AwsBaseNode):
             '{0}_ids'.format(constants.NETWORK_ACL['AWS_RESOURCE_TYPE'])
         }
 
+    def creation_validation(self):
+        super(NetworkAcl, self).creation_validation()
+        self.validate_network_acl_entries(
+            ctx.node.properties['acl_network_entries'])
+
     def create(self):
+        entries = self.validate_network_acl_entries(
+            ctx.node.properties['acl_network_entries'])
         create_args = self.generate_create_args()
         network_acl = self.execute(self.client.create_network_acl,
                                    create_args, raise_on_falsy=True)
         self.resource_id = network_acl.id
         ctx.instance.runtime_properties['vpc_id'] = create_args['vpc_id']
-        self.add_entries_to_network_acl()
+        self.add_entries_to_network_acl(entries)
         return True
 
     def generate_create_args(self):
@@ -127,27 +145,112 @@ class NetworkAcl(AwsBaseNode):
         if not len(vpc_ids) == 1:
             raise NonRecoverableError(
                 'network acl can only be connected to one vpc')
-        vpc = \
-            self.filter_for_single_resource(
-                self.client.get_all_vpcs,
-                {'vpc_ids': vpc_ids[0]},
-                constants.VPC['NOT_FOUND_ERROR']
-            )
-        create_args = dict(vpc_id=vpc.id)
+        vpcs = self.describe_filtered(
+            self.client.get_all_vpcs,
+            {'vpc-id': vpc_ids[0]},
+            constants.VPC['NOT_FOUND_ERROR']
+        )
+        if not vpcs:
+            raise NonRecoverableError(
+                'vpc {0} of network acl does not exist'.format(vpc_ids[0]))
+        create_args = dict(vpc_id=vpcs[0].id)
         return create_args
 
-    def add_entries_to_network_acl(self):
+    def add_entries_to_network_acl(self, entries):
+        """Adds entries to the network acl, concurrently. If an entry
+        fails, the network acl is deleted, so that it is not left with
+        only some of its entries.
+
+        :param entries: The entries that validate_network_acl_entries
+            returned.
+        """
+
+        if not entries:
+            return
+
+        entries = [dict(entry, network_acl_id=self.resource_id)
+                   for entry in entries]
+
+        start = time.time()
+        results = workers.run_concurrently(
+            self.create_network_acl_entry, entries)
+        errors = [error for _, error in results if error]
+
+        if errors:
+            ctx.logger.error(
+                'Failed to add {0} of {1} entries to network acl {2}, '
+                'deleting it: {3}'.format(
+                    len(errors), len(entries), self.resource_id,
+                    '; '.join(str(error) for error in errors)))
+            self.execute(self.client.delete_network_acl,
+                         dict(network_acl_id=self.resource_id))
+            raise errors[0]
 
         ctx.logger.info(
-            'adding network acl entries to network acl {0}'
-            .format(self.resource_id))
+            'Added {0} entries to network acl {1} in {2:.3f}s.'.format(
+                len(entries), self.resource_id, time.time() - start))
+
+    def validate_network_acl_entries(self, acl_network_entries):
+        """Checks that the rule numbers are unique, and that the port
+        ranges and CIDR blocks are valid.
+
+        :param acl_network_entries: The acl_network_entries property.
+        :returns the arguments of create_network_acl_entry for each entry,
+            without the network_acl_id.
+        :raises NonRecoverableError: If an entry is not valid.
+        """
+
+        entries = []
+        rule_numbers = set()
+
+        for acl_network_entry in acl_network_entries:
+            entry = dict(acl_network_entry)
+
+            for key in constants.NETWORK_ACL['ENTRY_REQUIRED_PROPERTIES']:
+                if key not in entry:
+                    raise NonRecoverableError(
+                        'network acl entry {0} is missing {1}.'
+                        .format(acl_network_entry, key))
+
+            try:
+                rule = (int(entry['rule_number']), bool(entry.get('egress')))
+                ports = [None if port is None else int(port) for port in
+                         (entry.get('port_range_from'),
+                          entry.get('port_range_to'))]
+            except (TypeError, ValueError):
+                raise NonRecoverableError(
+                    'network acl entry {0} has a rule_number or port range '
+                    'that is not a number.'.format(acl_network_entry))
+
+            if rule in rule_numbers:
+                raise NonRecoverableError(
+                    'network acl entry {0} duplicates rule number {1}.'
+                    .format(acl_network_entry, rule[0]))
+            rule_numbers.add(rule)
+
+            if str(entry['rule_action']).lower() not in ('allow', 'deny'):
+                raise NonRecoverableError(
+                    'network acl entry {0} has rule_action {1}, '
+                    'not allow or deny.'
+                    .format(acl_network_entry, entry['rule_action']))
+
+            if not ec2_utils.is_cidr_block(entry['cidr_block']):
+                raise NonRecoverableError(
+                    'network acl entry {0} has an invalid cidr_block.'
+                    .format(acl_network_entry))
+
+            if None not in ports and not \
+                    0 <= ports[0] <= ports[1] <= 65535:
+                raise NonRecoverableError(
+                    'network acl entry {0} has an invalid port range.'
+                    .format(acl_network_entry))
+
+            entries.append(entry)
 
-        for acl_network_entry in ctx.node.properties['acl_network_entries']:
-            acl_network_entry['network_acl_id'] = self.resource_id
-            self.create_network_acl_entry(acl_network_entry)
+        return entries
 
     def create_network_acl_entry(self, args):
-        ctx.logger.info('create network acl entry {0}'.format(args))
+        ctx.logger.debug('create network acl entry {0}'.format(args))
         return self.execute(self.client.create_network_acl_entry,
                             args, raise_on_falsy=True)
 
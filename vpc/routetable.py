@@ -16,6 +16,7 @@
 # Cloudify imports
 from . import constants
 from core.base import AwsBaseNode, AwsBaseRelationship, RouteMixin
+from core import metrics
 from cloudify import ctx
 from cloudify.decorators import operation
 from cloudify.exceptions import NonRecoverableError
@@ -23,42 +24,50 @@ from ec2 import utils as ec2_utils
 
 
 @operation
+@metrics.summarize_api_calls
 def creation_validation(**_):
     return RouteTable().creation_validation()
 
 
 @operation
+@metrics.summarize_api_calls
 def create_route_table(routes, **_):
     return RouteTable(routes).created()
 
 
 @operation
+@metrics.summarize_api_calls
 def start_route_table(**_):
     return RouteTable().started()
 
 
 @operation
+@metrics.summarize_api_calls
 def delete_route_table(**_):
     return RouteTable().deleted()
 
 
 @operation
+@metrics.summarize_api_calls
 def associate_route_table(**_):
     return RouteTableSubnetAssociation().associated()
 
 
 @operation
+@metrics.summarize_api_calls
 def disassociate_route_table(**_):
     return RouteTableSubnetAssociation().disassociated()
 
 
 @operation
+@metrics.summarize_api_calls
 def create_route_to_gateway(destination_cidr_block, **_):
     return RouteTableGatewayAssociation(
         destination_cidr_block).associated()
 
 
 @operation
+@metrics.summarize_api_calls
 def delete_route_from_gateway(**_):
     return RouteTableGatewayAssociation().disassociated()
 
@@ -168,8 +177,7 @@ class RouteTable(AwsBaseNode, RouteMixin):
             self.execute(self.client.create_route_table,
                          create_args, raise_on_falsy=True)
         self.resource_id = route_table.id
-        for route in self.routes:
-            self.create_route(route_table.id, route, ctx.instance)
+        self.create_route_batch(route_table.id, self.routes, ctx.instance)
         return True
 
     def _generate_creation_args(self):
@@ -185,12 +193,12 @@ class RouteTable(AwsBaseNode, RouteMixin):
         if not len(vpc_ids) == 1:
             raise NonRecoverableError(
                 'routetable can only be connected to one vpc')
-        vpc = self.filter_for_single_resource(
+        vpcs = self.describe_filtered(
             self.client.get_all_vpcs,
-            {'vpc_ids': vpc_ids[0]},
+            {'vpc-id': vpc_ids[0]},
             constants.VPC['NOT_FOUND_ERROR']
         )
-        return vpc
+        return vpcs[0] if vpcs else None
 
     def post_create(self):
         vpc = self.get_containing_vpc()
@@ -206,13 +214,12 @@ class RouteTable(AwsBaseNode, RouteMixin):
         return True
 
     def delete(self):
-        for route in self.routes:
-            self.delete_route(
-                ctx.instance.runtime_properties.get(
-                    constants.EXTERNAL_RESOURCE_ID),
-                route,
-                route_table_ctx_instance=ctx.instance
-            )
+        self.delete_route_batch(
+            ctx.instance.runtime_properties.get(
+                constants.EXTERNAL_RESOURCE_ID),
+            self.routes,
+            route_table_ctx_instance=ctx.instance
+        )
         delete_args = dict(
             route_table_id=ctx.instance.runtime_properties.get(
                 constants.EXTERNAL_RESOURCE_ID
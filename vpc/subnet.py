@@ -16,27 +16,32 @@
 # Cloudify imports
 from . import constants
 from core.base import AwsBaseNode
+from core import metrics
 from cloudify import ctx
 from cloudify.decorators import operation
 from cloudify.exceptions import NonRecoverableError
 
 
 @operation
+@metrics.summarize_api_calls
 def creation_validation(**_):
     return Subnet().creation_validation()
 
 
 @operation
+@metrics.summarize_api_calls
 def create_subnet(**_):
     return Subnet().created()
 
 
 @operation
+@metrics.summarize_api_calls
 def start_subnet(**_):
     return Subnet().started()
 
 
 @operation
+@metrics.summarize_api_calls
 def delete_subnet(**_):
     return Subnet().deleted()
 
@@ -73,14 +78,18 @@ class Subnet(AwsBaseNode):
             raise NonRecoverableError(
                 'subnet can only be connected to one vpc')
 
-        vpc = self.filter_for_single_resource(
+        vpcs = self.describe_filtered(
             self.client.get_all_vpcs,
-            {'vpc_ids': vpc_ids[0]},
+            {'vpc-id': vpc_ids[0]},
             constants.VPC['NOT_FOUND_ERROR']
         )
 
+        if not vpcs:
+            raise NonRecoverableError(
+                'vpc {0} of subnet does not exist'.format(vpc_ids[0]))
+
         create_args = dict(
-            vpc_id=vpc.id,
+            vpc_id=vpcs[0].id,
             cidr_block=ctx.node.properties['cidr_block']
         )
 
@@ -14,23 +14,27 @@
 #    * limitations under the License.
 
 # Built-in Imports
+import os
 import mock
+import tempfile
 
 # Third-party Imports
 from moto import mock_ec2
 
 # Cloudify Imports
-from vpc import vpc, subnet, routetable, dhcp
+from vpc import vpc, subnet, routetable, dhcp, networkacl
 
 from vpc_testcase import VpcTestCase
 from cloudify.state import current_ctx
 from cloudify.exceptions import NonRecoverableError
 from vpc import constants
+from ec2 import constants as ec2_constants
 
 VPC_TYPE = 'cloudify.aws.nodes.VPC'
 SUBNET_TYPE = 'cloudify.aws.nodes.Subnet'
 DHCP_OPTIONS_TYPE = 'cloudify.aws.nodes.DHCPOptions'
 ROUTE_TABLE_TYPE = 'cloudify.aws.nodes.RouteTable'
+ACL_TYPE = 'cloudify.aws.nodes.ACL'
 TEST_VPC_CIDR = '10.10.10.0/16'
 TEST_SUBNET_CIDR = '10.10.10.0/24'
 
@@ -86,6 +90,137 @@ class TestVpcModule(VpcTestCase):
             'vpc-0123abcd is not in this account',
             error.message)
 
+    @mock_ec2
+    def test_describe_cache_read_through(self):
+        ctx = self.get_mock_vpc_node_instance_context(
+            'test_describe_cache_read_through')
+        vpc_client = self.create_client()
+        vpc_id = vpc_client.create_vpc(TEST_VPC_CIDR).id
+        ctx.instance.runtime_properties['aws_resource_id'] = vpc_id
+
+        test_vpc = vpc.Vpc()
+        with mock.patch.object(test_vpc.client, 'get_all_vpcs',
+                               wraps=test_vpc.client.get_all_vpcs) \
+                as get_all_vpcs:
+            test_vpc.get_all_handler['function'] = get_all_vpcs
+            self.assertEqual(vpc_id, test_vpc.get_resource().id)
+            self.assertEqual(vpc_id, test_vpc.get_resource().id)
+            self.assertEqual(1, get_all_vpcs.call_count)
+            test_vpc.execute(test_vpc.client.create_vpc,
+                             dict(cidr_block=TEST_VPC_CIDR))
+            test_vpc.get_resource()
+            self.assertEqual(2, get_all_vpcs.call_count)
+        self.assertEqual(1, test_vpc.describe_cache.hits)
+        self.assertEqual(2, test_vpc.describe_cache.misses)
+
+    @mock_ec2
+    def test_describe_filtered(self):
+        ctx = self.get_mock_vpc_node_instance_context(
+            'test_describe_filtered')
+        vpc_client = self.create_client()
+        vpc_ids = [vpc_client.create_vpc(TEST_VPC_CIDR).id
+                   for _ in range(3)]
+        ctx.instance.runtime_properties['aws_resource_id'] = vpc_ids[0]
+        test_vpc = vpc.Vpc()
+
+        self.assertEqual(
+            [vpc_ids[1]],
+            [resource.id for resource in test_vpc.describe_filtered(
+                test_vpc.client.get_all_vpcs, {'vpc-id': vpc_ids[1]})])
+
+        get_all_vpcs = test_vpc.client.get_all_vpcs
+
+        def paginated_get_all_vpcs(filters=None, next_token=None):
+            page = get_all_vpcs(filters={'vpc-id': vpc_ids[
+                2 if next_token else 0]})
+            page.next_token = None if next_token else 'page-2'
+            return page
+
+        with mock.patch.object(test_vpc.client, 'get_all_vpcs',
+                               side_effect=paginated_get_all_vpcs) \
+                as paginated:
+            resources = test_vpc.describe_filtered(
+                test_vpc.client.get_all_vpcs, {'state': 'available'})
+
+        self.assertEqual([vpc_ids[0], vpc_ids[2]],
+                         [resource.id for resource in resources])
+        self.assertEqual(
+            [mock.call(filters={'state': 'available'}),
+             mock.call(filters={'state': 'available'},
+                       next_token='page-2')],
+            paginated.call_args_list)
+
+    @mock_ec2
+    def test_find_resource_stops_paging(self):
+        ctx = self.get_mock_vpc_node_instance_context(
+            'test_find_resource_stops_paging')
+        vpc_client = self.create_client()
+        vpc_ids = [vpc_client.create_vpc(TEST_VPC_CIDR).id
+                   for _ in range(2)]
+        ctx.instance.runtime_properties['aws_resource_id'] = vpc_ids[0]
+        test_vpc = vpc.Vpc()
+        get_all_vpcs = test_vpc.client.get_all_vpcs
+
+        def paginated_get_all_vpcs(next_token=None):
+            page = get_all_vpcs(filters={'vpc-id': vpc_ids[
+                1 if next_token else 0]})
+            page.next_token = None if next_token else 'page-2'
+            return page
+
+        with mock.patch.object(test_vpc.client, 'get_all_vpcs',
+                               side_effect=paginated_get_all_vpcs) \
+                as paginated:
+            self.assertEqual(vpc_ids[0], test_vpc.find_resource(
+                test_vpc.client.get_all_vpcs,
+                lambda resource: resource.id == vpc_ids[0]).id)
+            self.assertEqual(1, paginated.call_count)
+            self.assertEqual(vpc_ids[1], test_vpc.find_resource(
+                test_vpc.client.get_all_vpcs,
+                lambda resource: resource.id == vpc_ids[1]).id)
+            self.assertEqual(3, paginated.call_count)
+
+    @mock_ec2
+    def test_file_describe_cache_is_shared(self):
+        ctx = self.get_mock_vpc_node_instance_context(
+            'test_file_describe_cache_is_shared')
+        vpc_client = self.create_client()
+        vpc_id = vpc_client.create_vpc(TEST_VPC_CIDR).id
+        ctx.instance.runtime_properties['aws_resource_id'] = vpc_id
+
+        with mock.patch.dict(
+                os.environ,
+                {ec2_constants.DESCRIBE_CACHE_DIR_ENV_VAR_NAME:
+                 tempfile.mkdtemp()}):
+            first, second = vpc.Vpc(), vpc.Vpc()
+            self.assertEqual(vpc_id, first.get_resource().id)
+            cached = second.get_resource()
+
+        self.assertEqual(vpc_id, cached.id)
+        self.assertIs(second.client, cached.connection)
+        self.assertEqual(1, second.describe_cache.hits)
+        self.assertEqual(1, second.describe_cache.misses)
+
+    @mock_ec2
+    def test_file_describe_cache_is_invalidated_by_direct_writes(self):
+        ctx = self.get_mock_vpc_node_instance_context(
+            'test_file_describe_cache_is_invalidated_by_direct_writes')
+        vpc_client = self.create_client()
+        vpc_id = vpc_client.create_vpc(TEST_VPC_CIDR).id
+        ctx.instance.runtime_properties['aws_resource_id'] = vpc_id
+
+        with mock.patch.dict(
+                os.environ,
+                {ec2_constants.DESCRIBE_CACHE_DIR_ENV_VAR_NAME:
+                 tempfile.mkdtemp()}):
+            first, second = vpc.Vpc(), vpc.Vpc()
+            first.get_resource()
+            first.client.create_tags([vpc_id], {'Name': 'renamed'})
+            refreshed = second.get_resource()
+
+        self.assertEqual('renamed', refreshed.tags['Name'])
+        self.assertEqual(0, second.describe_cache.hits)
+        self.assertEqual(2, second.describe_cache.misses)
+
 
 class TestSubnetModule(VpcTestCase):
 
@@ -231,6 +366,141 @@ class TestRouteTableModule(VpcTestCase):
         self.assertNotIn(ctx.instance.runtime_properties,
                          constants.EXTERNAL_RESOURCE_ID)
 
+    @mock_ec2
+    def test_create_and_delete_route_batch(self, *_):
+        client = self.create_client()
+        vpc = self.create_vpc(client)
+        route_table = self.create_route_table(client, vpc)
+        gateway = client.create_internet_gateway()
+        client.attach_internet_gateway(gateway.id, vpc.id)
+        ctx = self.get_mock_route_table_node_instance_context(
+            'test_create_and_delete_route_batch', vpc)
+        routes = [dict(destination_cidr_block='172.16.{0}.0/24'.format(n),
+                       gateway_id=gateway.id) for n in range(10)]
+        create_route = client.create_route
+
+        def fail_route_5(**args):
+            if args['destination_cidr_block'] == '172.16.5.0/24':
+                raise NonRecoverableError('route 5 failed')
+            return create_route(**args)
+
+        route_mixin = routetable.RouteTable(routes)
+        with mock.patch.object(route_mixin.client, 'create_route',
+                               side_effect=fail_route_5):
+            error = self.assertRaises(
+                NonRecoverableError, route_mixin.create_route_batch,
+                route_table.id, routes, ctx.instance)
+        self.assertIn('route 5 failed', error.message)
+        self.assertEqual(
+            9, len(ctx.instance.runtime_properties['routes']))
+
+        route_mixin.create_route_batch(route_table.id, routes, ctx.instance)
+        self.assertEqual(
+            10, len(ctx.instance.runtime_properties['routes']))
+        self.assertEqual(
+            set(route['destination_cidr_block'] for route in routes),
+            set(route.destination_cidr_block for route in
+                client.get_all_route_tables([route_table.id])[0].routes
+                if route.gateway_id == gateway.id))
+
+        self.assertTrue(route_mixin.delete_route_batch(
+            route_table.id,
+            ctx.instance.runtime_properties['routes'], ctx.instance))
+        self.assertEqual([], ctx.instance.runtime_properties['routes'])
+
+
+class TestNetworkAclModule(VpcTestCase):
+
+    def get_acl_network_entries(self, count):
+        return [dict(rule_number=100 + n, protocol=6, rule_action='allow',
+                     cidr_block='10.{0}.0.0/16'.format(n), egress=False,
+                     port_range_from=1000 + n, port_range_to=1000 + n)
+                for n in range(count)]
+
+    def get_mock_network_acl(self, test_name, entries):
+
+        node_context = self.mock_node_context(
+            test_name,
+            self.get_mock_node_properties(
+                dict(acl_network_entries=entries)))
+        node_context.node.type = ACL_TYPE
+        node_context.node.type_hierarchy = \
+            [node_context.node.type, 'cloudify.nodes.Root']
+        current_ctx.set(ctx=node_context)
+
+        client = self.create_client()
+        network_acl = networkacl.NetworkAcl()
+        network_acl.resource_id = \
+            client.create_network_acl(self.create_vpc(client).id).id
+
+        return client, network_acl
+
+    def get_validated_entries(self, network_acl):
+        return network_acl.validate_network_acl_entries(
+            current_ctx.get_ctx().node.properties['acl_network_entries'])
+
+    @mock_ec2
+    def test_add_entries_to_network_acl(self):
+
+        client, network_acl = self.get_mock_network_acl(
+            'test_add_entries_to_network_acl',
+            self.get_acl_network_entries(10))
+        network_acl.add_entries_to_network_acl(
+            self.get_validated_entries(network_acl))
+        entries = client.get_all_network_acls(
+            [network_acl.resource_id])[0].network_acl_entries
+        self.assertEqual(
+            set(str(100 + n) for n in range(10)),
+            set(entry.rule_number for entry in entries))
+
+    @mock_ec2
+    def test_add_entries_to_network_acl_failure_deletes_acl(self):
+
+        client, network_acl = self.get_mock_network_acl(
+            'test_add_entries_to_network_acl_failure_deletes_acl',
+            self.get_acl_network_entries(5))
+        entries = self.get_validated_entries(network_acl)
+        create_network_acl_entry = network_acl.client.create_network_acl_entry
+
+        def fail_rule_102(**args):
+            if args['rule_number'] == 102:
+                raise NonRecoverableError('rule 102 failed')
+            return create_network_acl_entry(**args)
+
+        with mock.patch.object(network_acl.client,
+                               'create_network_acl_entry',
+                               side_effect=fail_rule_102):
+            error = self.assertRaises(
+                NonRecoverableError,
+                network_acl.add_entries_to_network_acl, entries)
+
+        self.assertIn('rule 102 failed', error.message)
+        self.assertNotIn(
+            network_acl.resource_id,
+            [acl.id for acl in client.get_all_network_acls()])
+
+    @mock_ec2
+    def test_validate_network_acl_entries(self):
+
+        entries = self.get_acl_network_entries(3)
+        entries[1]['rule_number'] = entries[0]['rule_number']
+        entries[2]['port_range_to'] = 'http'
+        _, network_acl = self.get_mock_network_acl(
+            'test_validate_network_acl_entries', entries)
+
+        with mock.patch.object(network_acl.client,
+                               'create_network_acl') as create:
+            error = self.assertRaises(
+                NonRecoverableError, network_acl.create)
+            self.assertIn('duplicates rule number 100', error.message)
+
+            del entries[1]
+            error = self.assertRaises(
+                NonRecoverableError, network_acl.create)
+            self.assertIn('is not a number', error.message)
+
+        self.assertFalse(create.called)
+
 
 class TestDhcpModule(VpcTestCase):
 
@@ -20,42 +20,50 @@ from boto import exception
 from . import constants
 from . import connection
 from core.base import AwsBaseNode, AwsBaseRelationship, RouteMixin
+from core import metrics
 from cloudify import ctx
 from cloudify.decorators import operation
 from cloudify.exceptions import NonRecoverableError, RecoverableError
 
 
 @operation
+@metrics.summarize_api_calls
 def creation_validation(**_):
     return Vpc().creation_validation()
 
 
 @operation
+@metrics.summarize_api_calls
 def create_vpc(**_):
     return Vpc().created()
 
 
 @operation
+@metrics.summarize_api_calls
 def start(**_):
     return Vpc().started()
 
 
 @operation
+@metrics.summarize_api_calls
 def delete(**_):
     return Vpc().deleted()
 
 
 @operation
+@metrics.summarize_api_calls
 def create_vpc_peering_connection(target_account_id, routes, **_):
     return VpcPeeringConnection(target_account_id, routes).associated()
 
 
 @operation
+@metrics.summarize_api_calls
 def delete_vpc_peering_connection(**_):
     return VpcPeeringConnection().disassociated()
 
 
 @operation
+@metrics.summarize_api_calls
 def accept_vpc_peering_connection(**_):
     target_aws_config = ctx.target.node.properties['aws_config']
     client = \
@@ -125,8 +133,8 @@ class VpcPeeringConnection(AwsBaseRelationship, RouteMixin):
                 route_table_id=self.source_route_table_id,
                 vpc_peering_connection_id=self.resource_id
             )
-            self.create_route(self.source_route_table_id, route,
-                              route_table_ctx_instance=ctx.source.instance)
+        self.create_route_batch(self.source_route_table_id, self.routes,
+                                route_table_ctx_instance=ctx.source.instance)
 
         return True
 
@@ -170,12 +178,13 @@ class VpcPeeringConnection(AwsBaseRelationship, RouteMixin):
         vpc_peering_connections = \
             ctx.source.instance.runtime_properties \
             .get('vpc_peering_connections')
+        routes = []
         for vpc_peering_connection in vpc_peering_connections:
             ctx.logger.info('{0}'.format(vpc_peering_connection))
-            for route in vpc_peering_connection['routes']:
-                self.delete_route(
-                    self.source_route_table_id, route,
-                    route_table_ctx_instance=ctx.source.instance)
+            routes.extend(vpc_peering_connection['routes'])
+        self.delete_route_batch(
+            self.source_route_table_id, routes,
+            route_table_ctx_instance=ctx.source.instance)
 
     def get_vpc_peering_connection_id(self, ctx_instance,
                                       vpc_id, property_name):
@@ -195,6 +204,8 @@ class VpcPeeringConnection(AwsBaseRelationship, RouteMixin):
 
     def accept_vpc_peering_connection(self):
 
+        self.describe_cache.invalidate()
+
         try:
             output = self.client.accept_vpc_peering_connection(
                 self.target_vpc_peering_connection_id)
@@ -218,27 +229,26 @@ class VpcPeeringConnection(AwsBaseRelationship, RouteMixin):
         at least one failed.
         """
 
-        source_vpc_cidr_block = ''
-
-        vpcs = self.execute(self.client.get_all_vpcs)
-        for vpc in vpcs:
-            if vpc.id == self.source_vpc_id:
-                source_vpc_cidr_block = vpc.cidr_block
+        source_vpcs = self.describe_filtered(
+            self.client.get_all_vpcs, {'vpc-id': self.source_vpc_id},
+            constants.VPC['NOT_FOUND_ERROR'])
 
         new_route = dict(
-            destination_cidr_block=source_vpc_cidr_block,
+            destination_cidr_block=source_vpcs[0].cidr_block
+            if source_vpcs else '',
             vpc_peering_connection_id=self.source_vpc_peering_connection_id
         )
 
-        route_tables = self.execute(self.client.get_all_route_tables)
+        route_tables = self.describe_filtered(
+            self.client.get_all_route_tables, {'vpc-id': self.target_vpc_id},
+            constants.ROUTE_TABLE['NOT_FOUND_ERROR'])
         for route_table in route_tables:
-            if route_table.vpc_id == self.target_vpc_id:
-                route_created = self.create_route(
-                    route_table_id=route_table.id,
-                    route=new_route
-                )
-                if not route_created:
-                    return False
+            route_created = self.create_route(
+                route_table_id=route_table.id,
+                route=new_route
+            )
+            if not route_created:
+                return False
 
         return True
 